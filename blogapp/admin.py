@@ -1,24 +1,27 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
-from .models import Blog, Article, UserProfile
+from .models import Blog, Article, UserProfile, Category, DeletionJob, ArchivedArticle, PromptTemplate, BlogHealth, ApiToken, OutboxConsumer
+from .api import assign_key
+from .archive import restore_article
+from .admin_utils import LargeTableAdmin, UsernameFilter, BlogNameFilter
 
 class UserProfileInline(admin.StackedInline):
     model = UserProfile
     can_delete = False
     verbose_name_plural = 'User Profile'
 
-class UserAdmin(BaseUserAdmin):
+class UserAdmin(BaseUserAdmin, LargeTableAdmin):
     inlines = (UserProfileInline,)
     list_display = ('username', 'email', 'first_name', 'last_name', 'is_staff', 'get_role', 'is_active')
     list_filter = ('is_staff', 'is_superuser', 'is_active', 'profile__role')
+    list_select_related = ('profile',)
     search_fields = ('username', 'email', 'first_name', 'last_name')
     
     def get_role(self, obj):
-        try:
-            return obj.profile.get_role_display()
-        except:
-            return 'No Role'
+        # The profile is joined in by list_select_related; users without one have no role
+        profile = getattr(obj, 'profile', None)
+        return profile.get_role_display() if profile else 'No Role'
     get_role.short_description = 'Role'
     get_role.admin_order_field = 'profile__role'
 
@@ -26,31 +29,124 @@ admin.site.unregister(User)
 admin.site.register(User, UserAdmin)
 
 @admin.register(UserProfile)
-class UserProfileAdmin(admin.ModelAdmin):
+class UserProfileAdmin(LargeTableAdmin):
     list_display = ('user', 'role', 'created_at', 'updated_at')
     list_filter = ('role', 'created_at', 'updated_at')
+    list_select_related = ('user',)
     search_fields = ('user__username', 'user__email')
+    autocomplete_fields = ('user',)
     readonly_fields = ('created_at', 'updated_at')
     ordering = ('-created_at',)
 
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ('name',)
+    search_fields = ('name',)
+
+@admin.register(PromptTemplate)
+class PromptTemplateAdmin(admin.ModelAdmin):
+    list_display = ('name', 'version', 'description', 'is_active', 'token_count', 'created_at')
+    list_filter = ('name', 'is_active')
+    search_fields = ('name', 'description')
+    readonly_fields = ('token_count', 'created_at')
+    
+    def get_readonly_fields(self, request, obj=None):
+        # A saved version is immutable so its cache key keeps meaning the same text
+        if obj is not None:
+            return self.readonly_fields + ('name', 'version', 'body')
+        return self.readonly_fields
+
 @admin.register(Blog)
-class BlogAdmin(admin.ModelAdmin):
+class BlogAdmin(LargeTableAdmin):
     list_display = ('name', 'user', 'url', 'username', 'created_at', 'updated_at')
-    list_filter = ('created_at', 'updated_at', 'user')
+    list_filter = ('created_at', 'updated_at', UsernameFilter)
+    list_select_related = ('user',)
+    date_hierarchy = 'created_at'
     search_fields = ('name', 'url', 'username')
     readonly_fields = ('created_at', 'updated_at')
-    filter_horizontal = ()
-    
-    def get_queryset(self, request):
-        return super().get_queryset(request).select_related('user')
+    autocomplete_fields = ('user', 'categories', 'prompt_template')
 
 @admin.register(Article)
-class ArticleAdmin(admin.ModelAdmin):
+class ArticleAdmin(LargeTableAdmin):
     list_display = ('title', 'user', 'blog', 'status', 'created_at', 'updated_at', 'published_at')
-    list_filter = ('status', 'created_at', 'updated_at', 'published_at', 'user', 'blog')
-    search_fields = ('title', 'content')
+    list_filter = ('status', 'created_at', 'updated_at', 'published_at', UsernameFilter, BlogNameFilter)
+    # Blog.__str__ shows its owner, so join that too
+    list_select_related = ('user', 'blog__user')
+    date_hierarchy = 'created_at'
+    # content is stored compressed, so it cannot be searched in the database
+    search_fields = ('title',)
+    search_help_text = 'Searches titles only; article bodies are stored compressed.'
     readonly_fields = ('created_at', 'updated_at', 'published_at')
-    filter_horizontal = ()
+    autocomplete_fields = ('user', 'blog')
+    
+    def get_queryset(self, request):
+        # The changelist never shows the body; the change form loads it on access
+        return super().get_queryset(request).defer('content')
+
+@admin.register(ArchivedArticle)
+class ArchivedArticleAdmin(LargeTableAdmin):
+    list_display = ('title', 'user', 'blog', 'archived_at', 'moved_at')
+    list_filter = ('archived_at', UsernameFilter, BlogNameFilter)
+    list_select_related = ('user', 'blog__user')
+    search_fields = ('title',)
+    readonly_fields = ('id', 'created_at', 'updated_at', 'published_at', 'archived_at', 'moved_at')
+    autocomplete_fields = ('user', 'blog')
+    actions = ['restore']
     
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('user', 'blog')
+        return super().get_queryset(request).defer('content')
+    
+    @admin.action(description='Restore selected articles to the live table')
+    def restore(self, request, queryset):
+        for archived in queryset:
+            restore_article(archived)
+        self.message_user(request, f'Restored {len(queryset)} article(s).')
+
+@admin.register(BlogHealth)
+class BlogHealthAdmin(admin.ModelAdmin):
+    list_display = ('blog', 'status', 'status_code', 'latency_ms', 'consecutive_failures', 'last_ok_at', 'updated_at')
+    list_filter = ('status',)
+    list_select_related = ('blog__user',)
+    search_fields = ('blog__name', 'blog__url')
+    readonly_fields = ('blog', 'status', 'status_code', 'latency_ms', 'error', 'consecutive_failures', 'last_ok_at', 'history', 'updated_at')
+
+@admin.register(ApiToken)
+class ApiTokenAdmin(admin.ModelAdmin):
+    list_display = ('name', 'user', 'prefix', 'is_active', 'created_at', 'last_used_at')
+    list_filter = ('is_active',)
+    list_select_related = ('user',)
+    search_fields = ('name', 'prefix', 'user__username')
+    autocomplete_fields = ('user',)
+    readonly_fields = ('prefix', 'created_at', 'last_used_at')
+    actions = ['revoke']
+    
+    def save_model(self, request, obj, form, change):
+        key = None if change else assign_key(obj)
+        super().save_model(request, obj, form, change)
+        if key:
+            # Only the hash is stored, so this is the one chance to copy the key
+            self.message_user(request, f'API key for "{obj.name}": {key} (it will not be shown again)', messages.WARNING)
+    
+    @admin.action(description='Revoke selected tokens')
+    def revoke(self, request, queryset):
+        count = queryset.filter(is_active=True).update(is_active=False)
+        self.message_user(request, f'Revoked {count} token(s).')
+
+@admin.register(OutboxConsumer)
+class OutboxConsumerAdmin(admin.ModelAdmin):
+    list_display = ('name', 'position', 'delivered', 'failures', 'retry_at', 'updated_at')
+    readonly_fields = ('name', 'position', 'delivered', 'failures', 'last_error', 'retry_at', 'updated_at')
+    actions = ['retry_now']
+    
+    @admin.action(description='Retry failed consumers now')
+    def retry_now(self, request, queryset):
+        count = queryset.exclude(retry_at=None).update(retry_at=None)
+        self.message_user(request, f'{count} consumer(s) will retry on the next dispatch.')
+
+@admin.register(DeletionJob)
+class DeletionJobAdmin(admin.ModelAdmin):
+    list_display = ('target_type', 'target_label', 'status', 'deleted', 'total', 'requested_by', 'created_at', 'finished_at')
+    list_filter = ('status', 'target_type')
+    list_select_related = ('requested_by',)
+    search_fields = ('target_label',)
+    readonly_fields = ('created_at', 'updated_at', 'finished_at')
@@ -0,0 +1,223 @@
+"""
+Admission control: concurrency limits per route class, per worker process.
+
+Every request is put in a class when its view is resolved (classify):
+AI generation, bulk operations, interactive reads and other writes. A class
+listed in ADMISSION_LIMITS runs at most `concurrency` requests at once;
+up to `queue` more wait at most `wait_seconds` for a slot, and anything
+beyond that is turned away at once with 503 and Retry-After. A client
+already holding `per_client` slots of the class gets 429 instead.
+
+A waiting request still occupies a server thread, so the limited classes
+together never hold more than ADMISSION_THREADS - ADMISSION_RESERVED_FOR_READS
+threads, running or waiting: the rest are always free for reads and other
+unlimited classes, however slow Gemini gets.
+
+State is shared by the threads of a process, not across processes; with
+gunicorn the effective limits are per worker. Counts are exported through
+blogapp.metrics as admission_in_flight / admission_queued gauges and
+admission_admitted_total / admission_rejected_total counters.
+"""
+import threading
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+
+from . import metrics
+
+AI = 'ai'
+BULK = 'bulk'
+READ = 'read'
+WRITE = 'write'
+
+# Views that touch many rows or stream large result sets
+BULK_ROUTES = {'user_bulk_action', 'api_blog_list', 'api_article_list'}
+
+
+def classify(request):
+    """The route class of a resolved request"""
+    match = request.resolver_match
+    name = match.url_name if match else None
+    if name == 'generate_article' or (
+        # article_creation hands its AJAX posts to the generator
+        name == 'article_creation' and request.method == 'POST'
+        and request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+    ):
+        return AI
+    if name in BULK_ROUTES:
+        return BULK
+    return READ if request.method in ('GET', 'HEAD', 'OPTIONS') else WRITE
+
+
+@dataclass(frozen=True)
+class Limit:
+    concurrency: int
+    queue: int = 0
+    wait_seconds: float = 0.0
+    per_client: int = 0
+    retry_after: int = 5
+
+
+class Rejected(Exception):
+    def __init__(self, route_class, reason, status, retry_after):
+        self.route_class = route_class
+        self.reason = reason
+        self.status = status
+        self.retry_after = retry_after
+        super().__init__(f"{route_class} request rejected ({reason})")
+
+
+class AdmissionController:
+    """
+    Thread-safe slot accounting for route classes.
+
+    `limits` maps a class to its Limit; classes without one are admitted
+    unconditionally (and only counted). `shared` caps the threads held by
+    all limited classes together, running or waiting; 0 leaves it open.
+    """
+
+    def __init__(self, limits, shared=0, clock=time.monotonic):
+        self.limits = limits
+        self.shared = shared
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._active = {}
+        self._waiting = {}
+        self._clients = {}
+        self._held = 0
+
+    def _publish(self, route_class):
+        metrics.set_gauge('admission_in_flight', self._active.get(route_class, 0), route_class=route_class)
+        metrics.set_gauge('admission_queued', self._waiting.get(route_class, 0), route_class=route_class)
+
+    def _reject(self, route_class, reason, status, limit):
+        metrics.inc('admission_rejected_total', route_class=route_class, reason=reason)
+        return Rejected(route_class, reason, status, limit.retry_after)
+
+    def acquire(self, route_class, client=None):
+        """
+        Take a slot, waiting for one if the class allows; returns the
+        seconds waited, or raises Rejected. Pair with release().
+        """
+        limit = self.limits.get(route_class)
+        with self._cond:
+            if limit is None:
+                self._active[route_class] = self._active.get(route_class, 0) + 1
+                self._publish(route_class)
+                metrics.inc('admission_admitted_total', route_class=route_class)
+                return 0.0
+            key = (route_class, client)
+            if limit.per_client and client is not None and self._clients.get(key, 0) >= limit.per_client:
+                raise self._reject(route_class, 'per_client', 429, limit)
+            if self.shared and self._held >= self.shared:
+                raise self._reject(route_class, 'saturated', 503, limit)
+            waited = 0.0
+            if limit.concurrency and self._active.get(route_class, 0) >= limit.concurrency:
+                if self._waiting.get(route_class, 0) >= limit.queue:
+                    raise self._reject(route_class, 'queue_full', 503, limit)
+                waited = self._wait(route_class, key, limit)
+            self._active[route_class] = self._active.get(route_class, 0) + 1
+            self._clients[key] = self._clients.get(key, 0) + 1
+            self._held += 1
+            self._publish(route_class)
+        metrics.inc('admission_admitted_total', route_class=route_class)
+        return waited
+
+    def _wait(self, route_class, key, limit):
+        # Called with the lock held; a waiting request counts against its client and the shared cap
+        self._waiting[route_class] = self._waiting.get(route_class, 0) + 1
+        self._clients[key] = self._clients.get(key, 0) + 1
+        self._held += 1
+        self._publish(route_class)
+        started = self._clock()
+        deadline = started + limit.wait_seconds
+        try:
+            while self._active.get(route_class, 0) >= limit.concurrency:
+                remaining = deadline - self._clock()
+                if remaining <= 0:
+                    raise self._reject(route_class, 'timeout', 503, limit)
+                self._cond.wait(remaining)
+        finally:
+            self._waiting[route_class] -= 1
+            self._release_client(key)
+            self._held -= 1
+            self._publish(route_class)
+        return self._clock() - started
+
+    def _release_client(self, key):
+        count = self._clients.get(key, 0) - 1
+        if count > 0:
+            self._clients[key] = count
+        else:
+            self._clients.pop(key, None)
+
+    def release(self, route_class, client=None):
+        with self._cond:
+            self._active[route_class] -= 1
+            if route_class in self.limits:
+                self._release_client((route_class, client))
+                self._held -= 1
+                self._cond.notify_all()
+            self._publish(route_class)
+
+    def snapshot(self):
+        """{route class: (running, waiting)}"""
+        with self._cond:
+            return {
+                name: (self._active.get(name, 0), self._waiting.get(name, 0))
+                for name in sorted({*self._active, *self._waiting})
+            }
+
+
+def _settings():
+    limits = {
+        name: Limit(**values) for name, values in getattr(settings, 'ADMISSION_LIMITS', {}).items()
+        if values.get('concurrency')
+    }
+    threads = getattr(settings, 'ADMISSION_THREADS', 0)
+    reserved = getattr(settings, 'ADMISSION_RESERVED_FOR_READS', 1)
+    return limits, max(threads - reserved, 1) if threads else 0
+
+
+_controller = None
+_controller_settings = None
+_controller_lock = threading.Lock()
+
+
+def controller():
+    """The process-wide controller, rebuilt if the settings changed"""
+    global _controller, _controller_settings
+    current = _settings()
+    with _controller_lock:
+        if _controller is None or current != _controller_settings:
+            _controller = AdmissionController(*current)
+            _controller_settings = current
+        return _controller
+
+
+def client_key(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def rejection_response(request, rejected):
+    """503/429 with Retry-After, in the format the rejected endpoint normally answers with"""
+    if rejected.status == 429:
+        message = "Too many requests of this kind in progress; wait for them to finish."
+    else:
+        message = "The server is busy; please try again shortly."
+    name = request.resolver_match.url_name if request.resolver_match else ''
+    if rejected.route_class == AI:
+        # The article editor shows `error` from the JSON body whatever the status
+        response = JsonResponse({'success': False, 'error': message}, status=rejected.status)
+    elif name and name.startswith('api_'):
+        code = 'too_many_requests' if rejected.status == 429 else 'overloaded'
+        response = JsonResponse({'error': {'code': code, 'message': message}}, status=rejected.status)
+    else:
+        response = HttpResponse(message, status=rejected.status, content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(rejected.retry_after)
+    return response
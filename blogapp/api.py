@@ -0,0 +1,379 @@
+"""
+Read-only JSON API, version 1.
+
+    GET /api/v1/blogs/            GET /api/v1/blogs/<id>/
+    GET /api/v1/articles/         GET /api/v1/articles/<id>/
+
+Authenticate with `Authorization: Bearer <key>`; every endpoint only sees
+the token owner's rows. List endpoints take:
+
+    fields=title,status   the fields to return (id is always included)
+    include=blog          embed a related object, fetched in the same query
+    limit=500             page size, up to API_MAX_PAGE_SIZE
+    cursor=...            from the previous page's `next`
+    updated_since=<ISO 8601 datetime>, and for articles blog=<id>, status=<status>
+
+Pages are ordered by id and streamed, so memory stays flat for any page size.
+With article shards (blogapp.sharding), article pages are merged by id from
+every database that holds the user's articles.
+"""
+import base64
+import binascii
+import hashlib
+import heapq
+import secrets
+from datetime import timedelta, timezone as dt_timezone
+from functools import wraps
+from itertools import groupby
+
+import orjson
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import require_safe
+
+from . import routers, sharding
+from .models import ApiToken, Article, Blog
+
+VERSION = 'v1'
+
+# Rows serialized per chunk of a streamed page
+STREAM_BATCH = 500
+
+# last_used_at is written at most this often per token, not on every request
+LAST_USED_RESOLUTION = timedelta(minutes=5)
+
+
+class ApiError(Exception):
+    def __init__(self, status, code, message):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+        self.message = message
+
+
+class Resource:
+    """
+    How one model is exposed: `fields` maps API names to model attributes
+    (all concrete, so they can go to .only()), `includes` maps relation
+    names to the fields embedded for them.
+    """
+
+    def __init__(self, name, model, fields, default_fields, includes, filters=()):
+        self.name = name
+        self.model = model
+        self.fields = fields
+        self.default_fields = default_fields
+        self.includes = includes
+        self.filters = filters
+
+    def parse_fields(self, value):
+        if not value:
+            return list(self.default_fields)
+        names = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ApiError(400, 'invalid_fields', f"Unknown field(s) {', '.join(unknown)}; "
+                                                  f"{self.name} have: {', '.join(self.fields)}")
+        return ['id'] + [name for name in dict.fromkeys(names) if name != 'id']
+
+    def parse_includes(self, value):
+        names = [name.strip() for name in (value or '').split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.includes]
+        if unknown:
+            raise ApiError(400, 'invalid_include', f"Cannot include {', '.join(unknown)}; "
+                                                   f"{self.name} can include: {', '.join(self.includes) or 'nothing'}")
+        return list(dict.fromkeys(names))
+
+    def queryset(self, base, fields, includes, extra=()):
+        """
+        `base` narrowed to the requested columns (plus `extra`), related rows
+        joined in. An article shard holds no blogs or users to join, so there
+        only the foreign keys are read and attach() fetches the rows.
+        """
+        columns = [self.fields[name] for name in fields] + list(extra)
+        if base.db in sharding.shard_aliases():
+            return base.only(*columns, *includes)
+        for relation in includes:
+            columns += [f"{relation}__{field}" for field in self.includes[relation]]
+        queryset = base.only(*columns)
+        if includes:
+            queryset = queryset.select_related(*includes)
+        return queryset
+
+    def attach(self, objs, includes):
+        """Fetch the included rows that queryset() could not join, one query per relation"""
+        for relation in includes:
+            field = self.model._meta.get_field(relation)
+            missing = [obj for obj in objs if not field.is_cached(obj)]
+            if not missing:
+                continue
+            related = {
+                row.pk: row for row in field.related_model._base_manager.filter(
+                    pk__in={getattr(obj, field.attname) for obj in missing},
+                ).only(*self.includes[relation])
+            }
+            for obj in missing:
+                field.set_cached_value(obj, related.get(getattr(obj, field.attname)))
+
+    def serialize(self, obj, fields, includes):
+        data = {name: getattr(obj, self.fields[name]) for name in fields}
+        for relation in includes:
+            related = getattr(obj, relation)
+            data[relation] = {field: getattr(related, field) for field in self.includes[relation]}
+        return data
+
+
+BLOGS = Resource(
+    'blogs', Blog,
+    fields={
+        'id': 'id', 'name': 'name', 'url': 'url', 'username': 'username', 'category': 'category',
+        'created_at': 'created_at', 'updated_at': 'updated_at',
+    },
+    default_fields=['id', 'name', 'url', 'username', 'category', 'created_at', 'updated_at'],
+    includes={'user': ['id', 'username']},
+)
+
+ARTICLES = Resource(
+    'articles', Article,
+    fields={
+        'id': 'id', 'title': 'title', 'content': 'content', 'status': 'status', 'blog_id': 'blog_id',
+        'created_at': 'created_at', 'updated_at': 'updated_at',
+        'published_at': 'published_at', 'publish_at': 'publish_at',
+    },
+    # Content is the bulk of every row; ask for it with fields=...,content
+    default_fields=['id', 'title', 'status', 'blog_id', 'created_at', 'updated_at', 'published_at', 'publish_at'],
+    includes={'blog': ['id', 'name', 'url'], 'user': ['id', 'username']},
+    filters=('blog', 'status'),
+)
+
+
+def hash_key(key):
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def assign_key(token):
+    """Give an unsaved token a fresh key; returns the key, which cannot be recovered later"""
+    key = secrets.token_urlsafe(32)
+    token.prefix = key[:8]
+    token.key_hash = hash_key(key)
+    return key
+
+
+def issue_token(user, name):
+    """Create a token for `user`; returns (token, key)"""
+    token = ApiToken(user=user, name=name)
+    key = assign_key(token)
+    token.save()
+    return token, key
+
+
+def authenticate(request):
+    header = request.headers.get('Authorization', '')
+    scheme, _, key = header.partition(' ')
+    if scheme.lower() not in ('bearer', 'token') or not key.strip():
+        raise ApiError(401, 'not_authenticated', "Send 'Authorization: Bearer <key>'.")
+    token = (
+        ApiToken.objects
+        .select_related('user')
+        .filter(key_hash=hash_key(key.strip()), is_active=True, user__is_active=True)
+        .first()
+    )
+    if token is None:
+        raise ApiError(401, 'invalid_token', 'Invalid or revoked token.')
+    now = timezone.now()
+    if token.last_used_at is None or now - token.last_used_at > LAST_USED_RESOLUTION:
+        with routers.unpinned_write():
+            ApiToken.objects.filter(pk=token.pk).update(last_used_at=now)
+    return token.user
+
+
+def _json(data, status=200):
+    return HttpResponse(orjson.dumps(data), status=status, content_type='application/json')
+
+
+def _error(error):
+    response = _json({'error': {'code': error.code, 'message': error.message}}, status=error.status)
+    if error.status == 401:
+        response['WWW-Authenticate'] = 'Bearer'
+    return response
+
+
+def api_view(view_func):
+    """GET/HEAD only, token-authenticated, ApiError rendered as a JSON error body"""
+    @require_safe
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        try:
+            user = authenticate(request)
+            return view_func(request, user, *args, **kwargs)
+        except ApiError as e:
+            return _error(e)
+    return _wrapped_view
+
+
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        return int(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode())
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise ApiError(400, 'invalid_cursor', 'Invalid cursor.')
+
+
+def _page_size(value):
+    default = getattr(settings, 'API_DEFAULT_PAGE_SIZE', 100)
+    maximum = getattr(settings, 'API_MAX_PAGE_SIZE', 5000)
+    if not value:
+        return default
+    try:
+        size = int(value)
+    except ValueError:
+        size = 0
+    if not 1 <= size <= maximum:
+        raise ApiError(400, 'invalid_limit', f"limit must be between 1 and {maximum}.")
+    return size
+
+
+def _filter(resource, queryset, params):
+    updated_since = params.get('updated_since')
+    if updated_since:
+        value = parse_datetime(updated_since)
+        if value is None:
+            raise ApiError(400, 'invalid_filter', 'updated_since must be an ISO 8601 datetime.')
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value, dt_timezone.utc)
+        queryset = queryset.filter(updated_at__gte=value)
+    if 'blog' in resource.filters and params.get('blog'):
+        try:
+            queryset = queryset.filter(blog_id=int(params['blog']))
+        except ValueError:
+            raise ApiError(400, 'invalid_filter', 'blog must be a blog id.')
+    if 'status' in resource.filters and params.get('status'):
+        statuses = {value for value, _ in Article.STATUS_CHOICES}
+        if params['status'] not in statuses:
+            raise ApiError(400, 'invalid_filter', f"status must be one of {', '.join(sorted(statuses))}.")
+        queryset = queryset.filter(status=params['status'])
+    return queryset
+
+
+def _chunks(rows, size):
+    chunk = []
+    for obj in rows:
+        chunk.append(obj)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _stream(rows, resource, fields, includes, next_url):
+    yield b'{"data":['
+    first = True
+    for chunk in _chunks(rows, STREAM_BATCH):
+        resource.attach(chunk, includes)
+        yield (b'' if first else b',') + b','.join(
+            orjson.dumps(resource.serialize(obj, fields, includes)) for obj in chunk
+        )
+        first = False
+    yield b'],"next":' + orjson.dumps(next_url) + b'}'
+
+
+def _merged(querysets):
+    """
+    The rows of querysets ordered by id, merged in id order. A row found
+    on two databases (a blog caught mid-move) is sent once, the copy with
+    the newest updated_at.
+    """
+    if len(querysets) == 1:
+        yield from querysets[0].iterator(chunk_size=2000)
+        return
+    rows = heapq.merge(*(qs.iterator(chunk_size=2000) for qs in querysets), key=lambda obj: obj.pk)
+    for _, copies in groupby(rows, key=lambda obj: obj.pk):
+        yield max(copies, key=lambda obj: obj.updated_at)
+
+
+def list_response(request, resource, bases):
+    """
+    One page of the union of the `bases` querysets (one per database), streamed.
+
+    The page's id range is found first with an index-only query on each
+    base, so the next cursor is known before any row is sent; the rows
+    themselves are then read with server-side iterators, merged by id and
+    serialized in batches.
+    """
+    params = request.GET
+    fields = resource.parse_fields(params.get('fields'))
+    includes = resource.parse_includes(params.get('include'))
+    limit = _page_size(params.get('limit'))
+    after = decode_cursor(params['cursor']) if params.get('cursor') else 0
+
+    bases = [_filter(resource, base, params).filter(id__gt=after).order_by('id') for base in bases]
+    ids = sorted({pk for base in bases for pk in base.values_list('id', flat=True)[:limit + 1]})[:limit + 1]
+    next_url = None
+    if len(ids) > limit:
+        ids = ids[:limit]
+        query = params.copy()
+        query['cursor'] = encode_cursor(ids[-1])
+        next_url = request.build_absolute_uri(f"{request.path}?{query.urlencode()}")
+    if ids:
+        # updated_at picks between the two copies of a row on a moving blog
+        extra = ('updated_at',) if len(bases) > 1 else ()
+        rows = _merged([resource.queryset(base.filter(id__lte=ids[-1]), fields, includes, extra) for base in bases])
+    else:
+        rows = iter(())
+
+    response = StreamingHttpResponse(
+        _stream(rows, resource, fields, includes, next_url), content_type='application/json',
+    )
+    if next_url:
+        response['Link'] = f'<{next_url}>; rel="next"'
+    return response
+
+
+def detail_response(request, resource, bases, pk):
+    fields = resource.parse_fields(request.GET.get('fields'))
+    includes = resource.parse_includes(request.GET.get('include'))
+    extra = ('updated_at',) if len(bases) > 1 else ()
+    found = [obj for obj in (resource.queryset(base.filter(pk=pk), fields, includes, extra).first() for base in bases) if obj]
+    if not found:
+        raise ApiError(404, 'not_found', f"No such {resource.name[:-1]}.")
+    obj = max(found, key=lambda obj: obj.updated_at) if len(found) > 1 else found[0]
+    resource.attach([obj], includes)
+    return _json({'data': resource.serialize(obj, fields, includes)})
+
+
+def _blogs(user):
+    return [Blog.objects.filter(user=user, is_deleting=False)]
+
+
+def _articles(user):
+    """One queryset per database holding the user's articles; none from blogs being deleted"""
+    # A list fetched up front rather than a join: shards hold no blogs
+    deleting = list(Blog.objects.filter(is_deleting=True).values_list('id', flat=True))
+    return sharding.user_querysets(user, Article.objects.exclude(blog_id__in=deleting))
+
+
+@api_view
+def blog_list(request, user):
+    return list_response(request, BLOGS, _blogs(user))
+
+
+@api_view
+def blog_detail(request, user, blog_id):
+    return detail_response(request, BLOGS, _blogs(user), blog_id)
+
+
+@api_view
+def article_list(request, user):
+    return list_response(request, ARTICLES, _articles(user))
+
+
+@api_view
+def article_detail(request, user, article_id):
+    return detail_response(request, ARTICLES, _articles(user), article_id)
@@ -0,0 +1,130 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+from . import sharding
+from .deletion import fast_delete
+from .models import Article, ArticleRevision, ArchivedArticle, ArchivedArticleRevision
+
+logger = logging.getLogger(__name__)
+
+_ARTICLE_FIELDS = ['id', 'user_id', 'blog_id', 'title', 'content', 'created_at', 'updated_at', 'published_at', 'archived_at']
+_REVISION_FIELDS = ['article_id', 'number', 'user_id', 'title', 'is_snapshot', 'data', 'content_length', 'created_at']
+
+
+def archive_cutoff(now=None, days=None):
+    now = now or timezone.now()
+    days = getattr(settings, 'ARTICLE_ARCHIVE_AFTER_DAYS', 90) if days is None else days
+    return now - timedelta(days=days)
+
+
+def archivable_articles(cutoff, alias=sharding.PRIMARY):
+    """Articles on `alias` archived before `cutoff` (served by article_archived_idx)"""
+    return sharding.on(Article.objects.filter(status='archived', archived_at__lt=cutoff), alias)
+
+
+def archive_batch(cutoff, batch_size=500, alias=sharding.PRIMARY):
+    """
+    Move one batch of archivable articles on `alias`, with their revisions, to the archive tables.
+
+    Copy and delete run in the same transaction, so a row is never in both
+    tables or in neither. Content and revision data are copied as the
+    stored bytes, without decompressing. Returns the number moved.
+    """
+    if alias != sharding.PRIMARY:
+        return _archive_shard_batch(cutoff, batch_size, alias)
+    with transaction.atomic():
+        ids = list(
+            archivable_articles(cutoff)
+            .order_by('archived_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0
+        rows = Article._base_manager.filter(id__in=ids).values(*_ARTICLE_FIELDS)
+        ArchivedArticle.objects.bulk_create([ArchivedArticle(**row) for row in rows])
+        revision_rows = ArticleRevision.objects.filter(article_id__in=ids).values(*_REVISION_FIELDS)
+        ArchivedArticleRevision.objects.bulk_create(
+            [ArchivedArticleRevision(**row) for row in revision_rows.iterator()],
+            batch_size=1000,
+        )
+        moved = fast_delete(Article._base_manager.filter(id__in=ids))
+    logger.info(f"Moved {moved} article(s) to the archive")
+    return moved
+
+
+def _archive_shard_batch(cutoff, batch_size, alias):
+    """
+    archive_batch for a shard: the archive tables live on `default`, so the
+    copy commits there first and the delete follows on the shard. A failure
+    in between leaves the rows in both; the next run copies them again
+    (ignoring the existing copies) and deletes them.
+    """
+    ids = list(archivable_articles(cutoff, alias).order_by('archived_at').values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return 0
+    rows = list(Article._base_manager.using(alias).filter(id__in=ids).values(*_ARTICLE_FIELDS))
+    with transaction.atomic():
+        ArchivedArticle.objects.bulk_create([ArchivedArticle(**row) for row in rows], ignore_conflicts=True)
+        revision_rows = ArticleRevision.objects.filter(article_id__in=ids).values(*_REVISION_FIELDS)
+        ArchivedArticleRevision.objects.bulk_create(
+            [ArchivedArticleRevision(**row) for row in revision_rows.iterator()],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+    with transaction.atomic(using=alias):
+        # The revisions and other side rows on `default` go with the articles' delete signals
+        moved = fast_delete(Article._base_manager.using(alias).filter(id__in=ids))
+    logger.info(f"Moved {moved} article(s) from {alias} to the archive")
+    return moved
+
+
+def archive_articles(now=None, days=None, batch_size=500):
+    """Move every article past the archive window, on every article database; returns the total moved"""
+    cutoff = archive_cutoff(now, days)
+    total = 0
+    for alias in sharding.all_aliases():
+        while True:
+            moved = archive_batch(cutoff, batch_size, alias)
+            total += moved
+            if moved < batch_size:
+                break
+    return total
+
+
+def restore_article(archived):
+    """
+    Move an archived article back into the Article table.
+
+    It comes back with status 'archived' and a fresh archived_at, so it is
+    not swept up again before someone has had a chance to change it.
+    On a sharded blog the article row is written to the blog's database,
+    outside the transaction on `default` that moves the revisions.
+    """
+    with transaction.atomic():
+        article = Article(
+            id=archived.id,
+            user_id=archived.user_id,
+            blog_id=archived.blog_id,
+            title=archived.title,
+            content=ArchivedArticle._base_manager.filter(pk=archived.pk).values_list('content', flat=True).get(),
+            status='archived',
+            published_at=archived.published_at,
+        )
+        article.save(force_insert=True)
+        # created_at/updated_at are auto fields on Article; put the originals back
+        Article._base_manager.using(article._state.db).filter(pk=article.pk).update(created_at=archived.created_at, updated_at=archived.updated_at)
+        revision_rows = list(ArchivedArticleRevision.objects.filter(article_id=archived.pk).values(*_REVISION_FIELDS))
+        ArticleRevision.objects.bulk_create([ArticleRevision(**row) for row in revision_rows], batch_size=1000)
+        if revision_rows:
+            # bulk_create stamps auto_now_add fields too; restore the original save times
+            ArticleRevision.objects.filter(article_id=archived.pk).update(created_at=Case(
+                *[When(number=row['number'], then=Value(row['created_at'])) for row in revision_rows],
+                output_field=DateTimeField(),
+            ))
+        ArchivedArticle.objects.filter(pk=archived.pk).delete()
+    return article
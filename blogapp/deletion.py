@@ -0,0 +1,273 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import CASCADE, DO_NOTHING, SET_NULL, Q, signals
+from django.db.models.deletion import get_candidate_relations_to_delete
+from django.utils import timezone
+
+from . import metrics, sharding
+from .models import Article, ArchivedArticle, Blog, DeletionJob, FeedDocument, OutboxEvent, UserProfile
+
+logger = logging.getLogger(__name__)
+
+
+def _deletion_settings():
+    return (
+        getattr(settings, 'DELETION_BATCH_SIZE', 500),
+        getattr(settings, 'DELETION_INLINE_LIMIT', 500),
+        getattr(settings, 'DELETION_BATCH_PAUSE_SECONDS', 0.05),
+    )
+
+
+def _has_delete_listeners(model):
+    return signals.pre_delete.has_listeners(model) or signals.post_delete.has_listeners(model)
+
+
+def _articles_deleted(queryset):
+    """
+    The bulk form of Article's post_delete receivers in blogapp.models,
+    run by fast_delete in place of them: 'deleted' outbox events, stale
+    feeds for blogs losing a published article, and the shard cleanup.
+    """
+    db = queryset.db
+    rows = list(queryset.values_list('id', 'blog_id', 'user_id', 'status'))
+    OutboxEvent.objects.using(db).bulk_create([
+        OutboxEvent(
+            aggregate_type='article', aggregate_id=pk, event_type='deleted',
+            payload={'blog_id': blog_id, 'user_id': user_id},
+        )
+        for pk, blog_id, user_id, _ in rows
+    ], batch_size=500)
+    published = {blog_id for _, blog_id, _, status in rows if status == 'published'}
+    if published:
+        FeedDocument.objects.filter(blog_id__in=published, stale=False).update(stale=True)
+    sharding.articles_deleted(db, [(pk, blog_id) for pk, blog_id, _, _ in rows])
+
+
+# Models whose own delete receivers have a bulk form here; a new receiver
+# on one of them needs adding to its function too
+BULK_DELETE_RECEIVERS = {
+    Article: _articles_deleted,
+}
+
+
+def can_fast_delete(model, _seen=None):
+    """
+    Whether rows of `model`, and everything cascading from them, can be
+    removed with plain DELETE/UPDATE statements.
+
+    That holds when no delete signals are connected anywhere in the cascade
+    and every relation is CASCADE, SET_NULL or DO_NOTHING. The signals of
+    `model` itself are allowed when BULK_DELETE_RECEIVERS has their bulk
+    form, which fast_delete runs instead.
+    """
+    top = _seen is None
+    seen = set() if top else _seen
+    if model in seen:
+        return True
+    seen.add(model)
+    if _has_delete_listeners(model) and not (top and model in BULK_DELETE_RECEIVERS):
+        return False
+    for related in get_candidate_relations_to_delete(model._meta):
+        on_delete = related.field.remote_field.on_delete
+        if on_delete is CASCADE:
+            if not can_fast_delete(related.related_model, seen):
+                return False
+        elif on_delete is SET_NULL:
+            if _has_delete_listeners(related.related_model):
+                return False
+        elif on_delete is not DO_NOTHING:
+            return False
+    return True
+
+
+def _raw_cascade(queryset):
+    pks = queryset.values('pk')
+    for related in get_candidate_relations_to_delete(queryset.model._meta):
+        field = related.field
+        # On the parent's database, as the collector would; side rows of shard articles are BULK_DELETE_RECEIVERS' job
+        children = related.related_model._base_manager.using(queryset.db).filter(**{f'{field.name}__in': pks})
+        on_delete = field.remote_field.on_delete
+        if on_delete is CASCADE:
+            _raw_cascade(children)
+        elif on_delete is SET_NULL:
+            children.update(**{field.name: None})
+    return queryset._raw_delete(queryset.db)
+
+
+def fast_delete(queryset):
+    """
+    Delete the rows of `queryset` and their dependents without loading them.
+
+    Children go first as set-based DELETEs keyed by a subquery on the
+    parent ids. Falls back to the regular collector when the cascade needs
+    signals or other Python-side handling. Returns the number of rows of
+    `queryset.model` deleted.
+    """
+    if not can_fast_delete(queryset.model):
+        _, per_model = queryset.delete()
+        return per_model.get(queryset.model._meta.label, 0)
+    bulk_receivers = BULK_DELETE_RECEIVERS.get(queryset.model)
+    if bulk_receivers is not None:
+        bulk_receivers(queryset._chain())
+    return _raw_cascade(queryset._chain())
+
+
+def _target_rows(model, target_type, target_id, using=None):
+    rows = model._base_manager.using(using)
+    if target_type == 'blog':
+        return rows.filter(blog_id=target_id)
+    if using not in (None, sharding.PRIMARY):
+        # An article shard holds no blogs to join against
+        blog_ids = list(Blog._base_manager.filter(user_id=target_id).values_list('id', flat=True))
+        return rows.filter(Q(user_id=target_id) | Q(blog_id__in=blog_ids))
+    return rows.filter(Q(user_id=target_id) | Q(blog__user_id=target_id))
+
+
+def _batched_rows():
+    """(model, database) pairs drained before the parent goes; articles may be on any shard"""
+    return [(Article, alias) for alias in sharding.all_aliases()] + [(ArchivedArticle, None)]
+
+
+def _delete_parent(job):
+    if job.target_type == 'blog':
+        fast_delete(Blog._base_manager.filter(pk=job.target_id))
+    else:
+        # Each blog is empty by now, so this only clears the blogs and their category links
+        fast_delete(Blog._base_manager.filter(user_id=job.target_id))
+        fast_delete(User._base_manager.filter(pk=job.target_id))
+
+
+def delete_batch(job, batch_size, model=Article, using=None):
+    """Delete one batch of the job's `model` rows in its own short transaction; returns the count"""
+    with transaction.atomic(using=using):
+        ids = list(_target_rows(model, job.target_type, job.target_id, using).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return 0
+        deleted = fast_delete(model._base_manager.using(using).filter(pk__in=ids))
+    DeletionJob.objects.filter(pk=job.pk).update(
+        deleted=job.deleted + deleted,
+        updated_at=timezone.now(),
+    )
+    job.deleted += deleted
+    metrics.inc('deletion_articles_deleted_total', deleted, target=job.target_type)
+    return deleted
+
+
+def run_job(job, batch_size=None, pause=None):
+    """
+    Drain the job's articles batch by batch, then delete the parent.
+
+    The write lock is released between batches, and `pause` seconds are
+    left for other writers to get in, so a large delete never holds the
+    database for long. Safe to re-run after a crash: every step only
+    deletes what is still there.
+    """
+    default_batch_size, _, default_pause = _deletion_settings()
+    batch_size = batch_size or default_batch_size
+    pause = default_pause if pause is None else pause
+    started = time.monotonic()
+    try:
+        for model, using in _batched_rows():
+            while delete_batch(job, batch_size, model, using) == batch_size:
+                if pause:
+                    time.sleep(pause)
+        with transaction.atomic():
+            # Articles added while the batches ran are swept up by the cascade here
+            _delete_parent(job)
+    except Exception as e:
+        logger.exception(f"Deletion of {job.target_type} {job.target_label} failed")
+        metrics.inc('deletion_jobs_total', target=job.target_type, status='failed')
+        job.status, job.error = 'failed', str(e)
+        job.save(update_fields=['status', 'error', 'updated_at'])
+        return job
+    job.status, job.finished_at = 'done', timezone.now()
+    job.save(update_fields=['status', 'finished_at', 'updated_at'])
+    metrics.inc('deletion_jobs_total', target=job.target_type, status='done')
+    logger.info(
+        f"Deleted {job.target_type} {job.target_label} ({job.deleted} articles) "
+        f"in {time.monotonic() - started:.1f}s"
+    )
+    return job
+
+
+def request_deletion(target, requested_by=None):
+    """
+    Mark a Blog or User as deleting and schedule its removal.
+
+    Small targets are deleted before returning; anything with more than
+    DELETION_INLINE_LIMIT articles is left for the `process_deletions`
+    worker. Returns the DeletionJob; check its status for which happened.
+    """
+    _, inline_limit, _ = _deletion_settings()
+    target_type = 'blog' if isinstance(target, Blog) else 'user'
+    with transaction.atomic():
+        existing = DeletionJob.objects.filter(
+            target_type=target_type, target_id=target.pk, status__in=('pending', 'running'),
+        ).first()
+        if existing:
+            return existing
+        if target_type == 'blog':
+            Blog.objects.filter(pk=target.pk).update(is_deleting=True, updated_at=timezone.now())
+            # Take the public feeds down now rather than when the rows are gone
+            FeedDocument.objects.filter(blog_id=target.pk).delete()
+            OutboxEvent.record('blog', target.pk, 'updated', user_id=target.user_id, is_deleting=True)
+            label = target.name
+        else:
+            # Deactivate at once so the account cannot be used while its rows go
+            User.objects.filter(pk=target.pk).update(is_active=False)
+            UserProfile.objects.filter(user_id=target.pk).update(is_deleting=True, updated_at=timezone.now())
+            FeedDocument.objects.filter(blog__user_id=target.pk).delete()
+            label = target.username
+        total = sum(_target_rows(model, target_type, target.pk, using).count() for model, using in _batched_rows())
+        job = DeletionJob.objects.create(
+            target_type=target_type,
+            target_id=target.pk,
+            target_label=label,
+            requested_by=requested_by,
+            total=total,
+            # Inline jobs start out claimed so a worker does not pick them up as well
+            status='running' if total <= inline_limit else 'pending',
+        )
+    metrics.inc('deletion_jobs_requested_total', target=target_type)
+    if job.status == 'running':
+        # No need for a worker; skip the pauses as well
+        return run_job(job, pause=0)
+    return job
+
+
+def claim_next_job(stale_after=600):
+    """
+    Take the oldest pending job, or a running one whose worker stopped
+    reporting progress `stale_after` seconds ago. Returns None when idle.
+    """
+    stale = timezone.now() - timedelta(seconds=stale_after)
+    candidates = (
+        DeletionJob.objects
+        .filter(Q(status='pending') | Q(status='running', updated_at__lt=stale))
+        .order_by('created_at')
+        .values_list('pk', 'updated_at')
+    )
+    for pk, updated_at in candidates[:10]:
+        # Conditional on the row being unchanged, so two workers never claim the same job
+        claimed = DeletionJob.objects.filter(pk=pk, updated_at=updated_at).exclude(status__in=('done', 'failed')).update(
+            status='running',
+            updated_at=timezone.now(),
+        )
+        if claimed:
+            return DeletionJob.objects.get(pk=pk)
+    return None
+
+
+def active_jobs(target_type, target_ids):
+    """Unfinished jobs for the given targets, keyed by target id"""
+    jobs = DeletionJob.objects.filter(
+        target_type=target_type,
+        target_id__in=list(target_ids),
+        status__in=('pending', 'running', 'failed'),
+    )
+    return {job.target_id: job for job in jobs}
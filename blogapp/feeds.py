@@ -0,0 +1,175 @@
+import gzip
+import hashlib
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils import feedgenerator
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+from . import routers, sharding
+from .models import Article, Blog, FeedDocument
+
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+CONTENT_TYPES = {
+    'rss': 'application/rss+xml; charset=utf-8',
+    'atom': 'application/atom+xml; charset=utf-8',
+    'sitemap_index': 'application/xml; charset=utf-8',
+    'sitemap': 'application/xml; charset=utf-8',
+}
+
+
+def _settings():
+    return (
+        getattr(settings, 'FEED_ITEMS', 50),
+        getattr(settings, 'SITEMAP_SHARD_SIZE', 50000),
+    )
+
+
+def base_url(request):
+    """Scheme and host for absolute links: FEED_BASE_URL, else the requesting host"""
+    return (getattr(settings, 'FEED_BASE_URL', '') or request.build_absolute_uri('/')).rstrip('/')
+
+
+def published_articles(blog):
+    """A blog's published articles, oldest first (served by article_blog_published_idx)"""
+    # Mid-move, the source still holds most rows; the feed is marked stale when the move ends
+    alias = sharding.read_aliases(blog.id)[-1]
+    return sharding.on(Article.objects.filter(blog=blog, status='published'), alias).order_by('published_at', 'id')
+
+
+# Stands in for the article id when a URL pattern is built once for many articles
+_PK_SENTINEL = 987654321987
+
+
+def article_url(base, blog_id, article_id):
+    return base + reverse('article_public', args=[blog_id, article_id])
+
+
+def _w3c(value):
+    return value.isoformat(timespec='seconds')
+
+
+def render_feed(blog, kind, base):
+    items, _ = _settings()
+    feed_class = feedgenerator.Atom1Feed if kind == 'atom' else feedgenerator.Rss201rev2Feed
+    feed = feed_class(
+        title=blog.name,
+        link=blog.url,
+        description=f"Latest articles from {blog.name}",
+        feed_url=base + reverse(f'blog_{kind}', args=[blog.id]),
+    )
+    latest = published_articles(blog).reverse().only('id', 'title', 'content', 'published_at', 'updated_at')[:items]
+    for article in latest:
+        link = article_url(base, blog.id, article.id)
+        feed.add_item(
+            title=article.title,
+            link=link,
+            unique_id=link,
+            description=Truncator(strip_tags(article.content)).words(60),
+            pubdate=article.published_at,
+            updateddate=article.updated_at,
+        )
+    return feed.writeString('utf-8')
+
+
+def render_sitemap(blog, part, base):
+    """Shard `part` of the blog's sitemap, or None past the last shard"""
+    _, shard_size = _settings()
+    start = part * shard_size
+    rows = list(published_articles(blog).values_list('id', 'updated_at')[start:start + shard_size])
+    if not rows and part:
+        return None
+    # reverse() once, not once per URL
+    loc = escape(article_url(base, blog.id, _PK_SENTINEL)).replace(str(_PK_SENTINEL), '{}')
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', f'<urlset xmlns="{SITEMAP_NS}">']
+    lines.extend(
+        f"<url><loc>{loc.format(pk)}</loc><lastmod>{_w3c(updated_at)}</lastmod></url>"
+        for pk, updated_at in rows
+    )
+    lines.append('</urlset>')
+    return '\n'.join(lines)
+
+
+def render_sitemap_index(blog, base):
+    """
+    One <sitemap> entry per shard of SITEMAP_SHARD_SIZE URLs.
+
+    lastmod per shard comes from a single pass over the index, so crawlers
+    only refetch the shards whose articles changed.
+    """
+    _, shard_size = _settings()
+    lastmods = []
+    for i, updated_at in enumerate(published_articles(blog).values_list('updated_at', flat=True).iterator(chunk_size=5000)):
+        if i % shard_size == 0:
+            lastmods.append(updated_at)
+        elif updated_at > lastmods[-1]:
+            lastmods[-1] = updated_at
+    if not lastmods:
+        # Always list one (empty) shard, so the index is valid
+        lastmods = [blog.updated_at]
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', f'<sitemapindex xmlns="{SITEMAP_NS}">']
+    lines.extend(
+        f"<sitemap><loc>{escape(base + reverse('blog_sitemap', args=[blog.id, part]))}</loc>"
+        f"<lastmod>{_w3c(lastmod)}</lastmod></sitemap>"
+        for part, lastmod in enumerate(lastmods)
+    )
+    lines.append('</sitemapindex>')
+    return '\n'.join(lines)
+
+
+def render(blog, kind, part, base):
+    if kind == 'sitemap':
+        return render_sitemap(blog, part, base)
+    if part:
+        return None
+    if kind == 'sitemap_index':
+        return render_sitemap_index(blog, base)
+    return render_feed(blog, kind, base)
+
+
+# A crawler's GET stores the document; that must not pin the crawler to the primary
+@routers.unpinned_write()
+def regenerate(blog_id, kind, part, base):
+    """
+    Render a document and store it; returns it, or None when there is
+    nothing to serve (no such blog, blog going away, shard out of range).
+    """
+    blog = Blog.objects.filter(pk=blog_id, is_deleting=False, user__is_active=True).first()
+    if blog is None:
+        FeedDocument.objects.filter(blog_id=blog_id).delete()
+        return None
+    # Clear the flag before reading the articles: a change that lands while
+    # rendering sets it again, so that change is never lost
+    doc, created = FeedDocument.objects.get_or_create(blog=blog, kind=kind, part=part)
+    if not created and doc.stale:
+        FeedDocument.objects.filter(pk=doc.pk).update(stale=False)
+    text = render(blog, kind, part, base)
+    if text is None:
+        doc.delete()
+        return None
+    data = text.encode('utf-8')
+    etag = hashlib.sha1(data).hexdigest()
+    if etag != doc.etag:
+        # Unchanged output keeps its Last-Modified, so crawlers get 304s either way
+        doc.body = gzip.compress(data, mtime=0)
+        doc.etag = etag
+        doc.save(update_fields=['body', 'etag', 'updated_at'])
+    doc.stale = False
+    return doc
+
+
+def get_document(blog_id, kind, part, base):
+    """
+    The stored document, rendered first if it is missing or stale.
+
+    The body is deferred: a conditional request answered with 304 never
+    reads it.
+    """
+    doc = FeedDocument.objects.filter(blog_id=blog_id, kind=kind, part=part).defer('body').first()
+    if doc is not None and not doc.stale:
+        return doc
+    return regenerate(blog_id, kind, part, base)
+
@@ -0,0 +1,154 @@
+import zlib
+
+from django import forms
+from django.conf import settings
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; zlib is always available
+    zstandard = None
+
+# First byte of every stored value says how the rest is encoded
+RAW = b'\x00'
+ZLIB = b'\x01'
+ZSTD = b'\x02'
+
+
+def _compression_settings():
+    method = getattr(settings, 'ARTICLE_CONTENT_COMPRESSION', 'zlib')
+    threshold = getattr(settings, 'ARTICLE_CONTENT_COMPRESSION_THRESHOLD', 1024)
+    if method == 'zstd' and zstandard is None:
+        method = 'zlib'
+    return method, threshold
+
+
+def compress_text(text, method=None, threshold=None):
+    """Encode text for storage, compressing it when it is above the threshold"""
+    default_method, default_threshold = _compression_settings()
+    method = method or default_method
+    threshold = default_threshold if threshold is None else threshold
+    raw = text.encode('utf-8')
+    if method == 'none' or len(raw) < threshold:
+        return RAW + raw
+    if method == 'zstd':
+        packed = ZSTD + zstandard.ZstdCompressor(level=6).compress(raw)
+    else:
+        packed = ZLIB + zlib.compress(raw, 6)
+    # Incompressible text is cheaper to keep as-is
+    return packed if len(packed) < len(raw) + 1 else RAW + raw
+
+
+def decompress_text(value):
+    """Decode a value produced by compress_text (or a legacy plain-text row)"""
+    if value is None or isinstance(value, str):
+        return value
+    value = bytes(value)
+    if not value:
+        return ''
+    marker, body = value[:1], value[1:]
+    if marker == ZLIB:
+        return zlib.decompress(body).decode('utf-8')
+    if marker == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Content is zstd-compressed but the 'zstandard' package is not installed.")
+        return zstandard.ZstdDecompressor().decompress(body).decode('utf-8')
+    if marker == RAW:
+        return body.decode('utf-8')
+    # Rows written before the column was converted
+    return value.decode('utf-8')
+
+
+def is_compressed(value):
+    return isinstance(value, (bytes, memoryview)) and bytes(value[:1]) in (ZLIB, ZSTD)
+
+
+class CompressedTextDescriptor(DeferredAttribute):
+    """
+    Keep the stored bytes on the instance and only decompress on first read.
+
+    Rows loaded for a listing that never touches the text pay no
+    decompression cost, and saving such a row writes the bytes back as-is.
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, (bytes, memoryview)):
+            value = decompress_text(value)
+            instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+
+class CompressedTextField(models.BinaryField):
+    """
+    Text stored as bytes, compressed above ARTICLE_CONTENT_COMPRESSION_THRESHOLD.
+
+    Reads back as `str` on model instances. `values()`/`values_list()` return
+    the stored bytes; pass them through decompress_text(). Database-side
+    text lookups (icontains etc.) do not apply to compressed rows.
+    """
+    descriptor_class = CompressedTextDescriptor
+    description = "Compressed text"
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('editable', True)
+        super().__init__(*args, **kwargs)
+
+    def pre_save(self, model_instance, add):
+        # Read the raw slot so an untouched value is not decompressed just to be re-encoded
+        return model_instance.__dict__.get(self.attname)
+
+    def get_prep_value(self, value):
+        if isinstance(value, str):
+            return compress_text(value)
+        return value
+
+    def to_python(self, value):
+        return decompress_text(value)
+
+    def value_from_object(self, obj):
+        return getattr(obj, self.attname)
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
+
+    def formfield(self, **kwargs):
+        defaults = {'form_class': forms.CharField, 'widget': forms.Textarea}
+        defaults.update(kwargs)
+        return models.Field.formfield(self, **defaults)
+
+
+class ShardableRelationMixin:
+    """
+    A relation that may cross databases once articles are sharded.
+
+    The database constraint is only left out when ARTICLE_SHARDS is set:
+    a row on a shard cannot reference one on `default`, but a single
+    database keeps full referential integrity. The choice is made from the
+    settings at migrate time and is never written into migrations, so
+    turning sharding on for an existing database means migrating blogapp
+    back to 0022 and forward again to drop the constraints.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('db_constraint', not getattr(settings, 'ARTICLE_SHARDS', []))
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs.pop('db_constraint', None)
+        return name, path, args, kwargs
+
+
+class ShardableForeignKey(ShardableRelationMixin, models.ForeignKey):
+    pass
+
+
+class ShardableOneToOneField(ShardableRelationMixin, models.OneToOneField):
+    pass
@@ -0,0 +1,288 @@
+import hashlib
+import heapq
+import importlib
+import re
+
+from django.conf import settings
+from django.db import transaction
+
+from . import sharding
+from .models import Article, ArticleFingerprint, ArticleLSHBucket, Blog
+
+# MinHash permutations, split into BANDS bands of NUM_PERM // BANDS rows.
+# Two articles share a bucket with probability 1 - (1 - J**8)**16 for Jaccard
+# similarity J: ~0.03 at J=0.4, ~0.7 at J=0.7, ~0.999 at J=0.9.
+# Changing either value invalidates every stored fingerprint (`report_duplicates --rebuild`).
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+# Words per shingle
+SHINGLE_SIZE = 4
+
+_WORD_RE = re.compile(r'\w+')
+
+_np = None
+_permutations = None
+
+
+def _load_numpy():
+    """Import NumPy on first use, so the URLconf and views do not pay for it"""
+    global _np, _permutations
+    if _np is None:
+        np = importlib.import_module('numpy')
+        # Fixed seed: signatures must be comparable across processes and deploys
+        rng = np.random.default_rng(0x5EED)
+        a = rng.integers(1, 2 ** 63, size=NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        b = rng.integers(0, 2 ** 63, size=NUM_PERM, dtype=np.uint64)
+        _permutations = (a, b)
+        _np = np
+    return _np
+
+
+def _threshold():
+    return getattr(settings, 'NEAR_DUPLICATE_THRESHOLD', 0.8)
+
+
+def normalize(title, content):
+    """
+    Lower-cased words of an article, punctuation and spacing dropped.
+
+    Runs of non-ASCII characters (CJK text has no spaces) are split into
+    single characters so they still form meaningful shingles.
+    """
+    tokens = []
+    for word in _WORD_RE.findall(f"{title}\n{content}".lower()):
+        if word.isascii():
+            tokens.append(word)
+        else:
+            tokens.extend(word)
+    return tokens
+
+
+def text_digest(tokens):
+    """Identifies the normalized text; an unchanged digest means an unchanged signature"""
+    return hashlib.sha1(' '.join(tokens).encode('utf-8')).hexdigest()
+
+
+def _shingle_hashes(tokens):
+    np = _load_numpy()
+    if len(tokens) < SHINGLE_SIZE:
+        shingles = {' '.join(tokens)}
+    else:
+        shingles = {' '.join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'little') for s in shingles),
+        dtype=np.uint64,
+        count=len(shingles),
+    )
+
+
+def minhash(tokens):
+    """
+    MinHash signature of a token list: NUM_PERM uint32 values.
+
+    Each permutation is a multiply-shift hash, (a * x + b) mod 2**64 taking
+    the high 32 bits, which NumPy computes with wrapping uint64 arithmetic.
+    """
+    np = _load_numpy()
+    a, b = _permutations
+    hashes = _shingle_hashes(tokens)
+    signature = np.full(NUM_PERM, np.iinfo(np.uint32).max, dtype=np.uint32)
+    # Chunked to bound the (shingles x NUM_PERM) temporary for very long articles
+    for start in range(0, len(hashes), 4096):
+        chunk = hashes[start:start + 4096, None]
+        permuted = ((chunk * a + b) >> np.uint64(32)).astype(np.uint32)
+        np.minimum(signature, permuted.min(axis=0), out=signature)
+    return signature
+
+
+def pack_signature(signature):
+    return signature.astype('<u4').tobytes()
+
+
+def unpack_signature(data):
+    np = _load_numpy()
+    return np.frombuffer(bytes(data), dtype='<u4')
+
+
+def band_keys(signature):
+    """One signed 64-bit bucket key per band; the band number is mixed in so bands never collide"""
+    data = pack_signature(signature)
+    width = ROWS * 4
+    keys = []
+    for band in range(BANDS):
+        digest = hashlib.blake2b(data[band * width:(band + 1) * width], digest_size=8, person=b'band%d' % band).digest()
+        keys.append(int.from_bytes(digest, 'little', signed=True))
+    return keys
+
+
+def similarity(signature, other):
+    """Estimated Jaccard similarity of the two articles' shingle sets"""
+    return float((signature == other).mean())
+
+
+def fingerprint_article(article):
+    """
+    Store the signature and bucket keys of a saved article.
+
+    Skipped when the normalized text has not changed since the last
+    fingerprint, so status-only saves cost one indexed lookup.
+    """
+    tokens = normalize(article.title, article.content)
+    digest = text_digest(tokens)
+    if ArticleFingerprint.objects.filter(article_id=article.pk, digest=digest).exists():
+        return False
+    signature = minhash(tokens)
+    with transaction.atomic():
+        ArticleFingerprint.objects.update_or_create(
+            article_id=article.pk,
+            defaults={'digest': digest, 'signature': pack_signature(signature)},
+        )
+        ArticleLSHBucket.objects.filter(article_id=article.pk).delete()
+        ArticleLSHBucket.objects.bulk_create(
+            [ArticleLSHBucket(article_id=article.pk, key=key) for key in band_keys(signature)]
+        )
+    return True
+
+
+def backfill(articles, batch_size=500):
+    """Fingerprint every article in the queryset that has none yet (e.g. rows from bulk_create); returns the count"""
+    done = 0
+    last = 0
+    while True:
+        # Fingerprints live on `default`, so look them up by id rather than through a join
+        ids = list(articles.filter(pk__gt=last).order_by('pk').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return done
+        last = ids[-1]
+        missing = set(ids) - set(ArticleFingerprint.objects.filter(article_id__in=ids).values_list('article_id', flat=True))
+        if not missing:
+            continue
+        batch = list(articles.filter(id__in=missing).only('id', 'title', 'content'))
+        fingerprints, buckets = [], []
+        for article in batch:
+            tokens = normalize(article.title, article.content)
+            signature = minhash(tokens)
+            fingerprints.append(ArticleFingerprint(
+                article_id=article.pk, digest=text_digest(tokens), signature=pack_signature(signature),
+            ))
+            buckets.extend(ArticleLSHBucket(article_id=article.pk, key=key) for key in band_keys(signature))
+        with transaction.atomic():
+            ArticleLSHBucket.objects.filter(article_id__in=[article.pk for article in batch]).delete()
+            ArticleFingerprint.objects.bulk_create(fingerprints, ignore_conflicts=True)
+            ArticleLSHBucket.objects.bulk_create(buckets, batch_size=1000)
+        done += len(batch)
+
+
+def _verified(signature, candidates, threshold):
+    """(article_id, similarity) for candidates whose stored signature is close enough, closest first"""
+    matches = []
+    for article_id, data in (
+        ArticleFingerprint.objects
+        .filter(article_id__in=candidates)
+        .values_list('article_id', 'signature')
+    ):
+        score = similarity(signature, unpack_signature(data))
+        if score >= threshold:
+            matches.append((article_id, score))
+    matches.sort(key=lambda match: -match[1])
+    return matches
+
+
+def find_near_duplicates(user, title, content, exclude=None, threshold=None, limit=5):
+    """
+    The user's articles that look like a near-copy of `title`/`content`.
+
+    Candidates come from the bucket index (an indexed IN lookup on 16
+    keys per database holding the user's articles), so the cost depends on
+    the number of matches, not on how many articles exist; each candidate
+    is then checked against its stored signature. Returns
+    [(article, similarity)], most similar first.
+    """
+    threshold = _threshold() if threshold is None else threshold
+    signature = minhash(normalize(title, content))
+    keys = band_keys(signature)
+    candidates = []
+    for lookup in sharding.article_ids(sharding.user_querysets(user)):
+        found = ArticleLSHBucket.objects.filter(key__in=keys, article_id__in=lookup)
+        if exclude is not None:
+            found = found.exclude(article_id=exclude)
+        candidates.extend(found.values_list('article_id', flat=True).distinct()[:limit * 20 - len(candidates)])
+        if len(candidates) >= limit * 20:
+            break
+    matches = _verified(signature, sorted(set(candidates)), threshold)[:limit]
+    articles = sharding.in_bulk([pk for pk, _ in matches], Article.objects.defer('content'))
+    blogs = Blog.objects.in_bulk({article.blog_id for article in articles.values()})
+    for article in articles.values():
+        article.blog = blogs[article.blog_id]
+    return [(articles[pk], score) for pk, score in matches if pk in articles]
+
+
+def duplicate_groups(blog, threshold=None):
+    """
+    Groups of near-duplicate articles within `blog`, each a list of
+    (article_id, similarity to the group's first article), largest group first.
+
+    Streams the blog's bucket keys in key order, so articles sharing a
+    bucket arrive together; only those pairs are compared.
+    """
+    threshold = _threshold() if threshold is None else threshold
+    streams = [
+        ArticleLSHBucket.objects
+        .filter(article_id__in=lookup)
+        .order_by('key', 'article_id')
+        .values_list('key', 'article_id')
+        .iterator(chunk_size=5000)
+        for lookup in sharding.article_ids(sharding.blog_querysets(blog.pk))
+    ]
+    buckets, current_key, members = [], None, []
+    for key, article_id in heapq.merge(*streams):
+        if key == current_key and members[-1] == article_id:
+            # Covered twice while the blog moves
+            continue
+        if key != current_key:
+            if len(members) > 1:
+                buckets.append(members)
+            current_key, members = key, []
+        members.append(article_id)
+    if len(members) > 1:
+        buckets.append(members)
+
+    involved = sorted({pk for members in buckets for pk in members})
+    signatures = {}
+    for start in range(0, len(involved), 500):
+        for pk, data in (
+            ArticleFingerprint.objects
+            .filter(article_id__in=involved[start:start + 500])
+            .values_list('article_id', 'signature')
+        ):
+            signatures[pk] = unpack_signature(data)
+
+    parent = {pk: pk for pk in signatures}
+
+    def find(pk):
+        while parent[pk] != pk:
+            parent[pk] = parent[parent[pk]]
+            pk = parent[pk]
+        return pk
+
+    for members in buckets:
+        members = [pk for pk in members if pk in signatures]
+        for i, first in enumerate(members):
+            for other in members[i + 1:]:
+                if find(first) != find(other) and similarity(signatures[first], signatures[other]) >= threshold:
+                    parent[find(other)] = find(first)
+
+    groups = {}
+    for pk in parent:
+        groups.setdefault(find(pk), []).append(pk)
+    result = []
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        members.sort()
+        head = signatures[members[0]]
+        result.append([(pk, similarity(head, signatures[pk])) for pk in members])
+    result.sort(key=len, reverse=True)
+    return result
@@ -13,7 +13,8 @@ class UserRegistrationForm(UserCreationForm):
     
     def clean_email(self):
         email = self.cleaned_data.get('email')
-        if User.objects.filter(email=email).exists():
+        from .models import users_with_email
+        if users_with_email(email).exists():
             raise ValidationError('This email address is already in use.')
         return email
     
@@ -92,6 +93,7 @@ class ArticleForm(forms.Form):
     status = forms.ChoiceField(
         choices=[
             ('draft', 'Draft'),
+            ('scheduled', 'Scheduled'),
             ('published', 'Published'),
             ('archived', 'Archived')
         ],
@@ -0,0 +1,80 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.models import User
+from django.db.models import Count, F, Func, Max, Subquery
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+
+def _scope_state(user, querysets):
+    """
+    MAX(updated_at) and COUNT(*) for each queryset, fetched in a single query
+    (plus one per queryset on an article shard).
+
+    Each pair becomes a scalar subquery hung off the user's own row, so the
+    whole check is one round trip no matter how many querysets feed a page.
+    The count catches deletions, which do not move MAX(updated_at).
+    """
+    annotations = {}
+    state = {}
+    shards = set(getattr(settings, 'ARTICLE_SHARDS', []))
+    for i, qs in enumerate(querysets):
+        qs = qs.order_by()
+        if qs._db in shards:
+            # No user row to hang a subquery off on an article shard
+            state.update(qs.aggregate(**{f'max_{i}': Max('updated_at'), f'count_{i}': Count('pk')}))
+            continue
+        annotations[f'max_{i}'] = Subquery(qs.values(v=Func(F('updated_at'), function='MAX')))
+        annotations[f'count_{i}'] = Subquery(qs.values(v=Func(F('pk'), function='COUNT')))
+    state.update(User.objects.filter(pk=user.pk).values(**annotations).get())
+    return state
+
+
+def conditional_page(scope, querysets_func):
+    """
+    Serve 304s for a per-user page until the data behind it changes.
+
+    `querysets_func(request, *args, **kwargs)` returns the querysets whose
+    contents the page renders. Their aggregate state, the user, the CSRF
+    secret and the full URL make up the ETag. Pages with pending flash
+    messages are always rendered in full.
+    """
+
+    def state(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or len(messages.get_messages(request)):
+            return None
+        cache = request.__dict__.setdefault('_conditional_state', {})
+        if scope not in cache:
+            cache[scope] = _scope_state(request.user, querysets_func(request, *args, **kwargs))
+        return cache[scope]
+
+    def etag_func(request, *args, **kwargs):
+        values = state(request, *args, **kwargs)
+        if values is None:
+            return None
+        user = request.user
+        profile = getattr(user, 'profile', None)
+        parts = [
+            scope,
+            str(user.pk),
+            user.username,
+            profile.role if profile else '',
+            request.META.get('CSRF_COOKIE', ''),
+            request.get_full_path(),
+        ] + [str(values[key]) for key in sorted(values)]
+        return '"%s"' % hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+    def last_modified_func(request, *args, **kwargs):
+        values = state(request, *args, **kwargs)
+        if values is None:
+            return None
+        stamps = [value for key, value in values.items() if key.startswith('max_') and value]
+        return max(stamps) if stamps else None
+
+    def decorator(view_func):
+        return cache_control(private=True, no_cache=True)(
+            condition(etag_func=etag_func, last_modified_func=last_modified_func)(view_func)
+        )
+    return decorator
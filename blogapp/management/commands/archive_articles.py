@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blogapp.archive import archive_articles
+
+
+class Command(BaseCommand):
+    help = "Move articles archived longer than ARTICLE_ARCHIVE_AFTER_DAYS to the archive tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Archive window in days (default: ARTICLE_ARCHIVE_AFTER_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Articles moved per transaction')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling instead of exiting after one pass')
+        parser.add_argument('--interval', type=float, default=3600.0,
+                            help='Seconds between passes when --loop is given')
+
+    def handle(self, *args, **options):
+        while True:
+            moved = archive_articles(days=options['days'], batch_size=options['batch_size'])
+            if moved:
+                self.stdout.write(self.style.SUCCESS(f"Archived {moved} article(s)"))
+            if not options['loop']:
+                break
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                break
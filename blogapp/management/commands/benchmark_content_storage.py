@@ -0,0 +1,79 @@
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from blogapp.fields import compress_text, decompress_text
+
+WORDS = (
+    "blog article content search engine optimization keyword audience writing "
+    "strategy marketing digital platform readers insight guide practical topic "
+    "analysis design development python django performance database query index "
+    "the a of and to in is for on with as by that this it from are be"
+).split()
+
+
+def _article_text(rng, paragraphs):
+    return "\n\n".join(
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(60, 140))).capitalize() + "."
+        for _ in range(paragraphs)
+    )
+
+
+class Command(BaseCommand):
+    help = "Compare database size and read latency for plain vs compressed article content"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--articles', type=int, default=5000)
+        parser.add_argument('--paragraphs', type=int, default=12,
+                            help='Paragraphs per generated article')
+        parser.add_argument('--reads', type=int, default=2000,
+                            help='Random single-row reads to time')
+        parser.add_argument('--method', default='zlib', choices=['zlib', 'zstd'])
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        texts = [_article_text(rng, options['paragraphs']) for _ in range(options['articles'])]
+        read_ids = [rng.randint(1, len(texts)) for _ in range(options['reads'])]
+
+        rows = []
+        for label, encode, decode in (
+            ('plain', lambda text: text, lambda value: value),
+            (options['method'], lambda text: compress_text(text, options['method'], 0), decompress_text),
+        ):
+            rows.append((label, *self._measure(texts, read_ids, encode, decode)))
+
+        self.stdout.write(f"{'storage':<8} {'db size':>12} {'random read':>14} {'full scan':>12}")
+        for label, size, point, scan in rows:
+            self.stdout.write(
+                f"{label:<8} {size / 1024 / 1024:>9.1f} MB {point * 1e6 / len(read_ids):>11.1f} us {scan * 1000:>9.1f} ms"
+            )
+
+    def _measure(self, texts, read_ids, encode, decode):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bench.sqlite3')
+            conn = sqlite3.connect(path)
+            conn.execute("CREATE TABLE article (id INTEGER PRIMARY KEY, title TEXT, content BLOB)")
+            conn.executemany(
+                "INSERT INTO article (id, title, content) VALUES (?, ?, ?)",
+                ((i, f"Article {i}", encode(text)) for i, text in enumerate(texts, start=1)),
+            )
+            conn.commit()
+            conn.execute("VACUUM")
+            size = os.path.getsize(path)
+
+            start = time.perf_counter()
+            for article_id in read_ids:
+                (value,) = conn.execute("SELECT content FROM article WHERE id = ?", (article_id,)).fetchone()
+                decode(value)
+            point = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for (value,) in conn.execute("SELECT content FROM article"):
+                decode(value)
+            scan = time.perf_counter() - start
+            conn.close()
+        return size, point, scan
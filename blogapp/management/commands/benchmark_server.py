@@ -0,0 +1,84 @@
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure throughput of a running server on the article generation endpoint. "
+        "Start the server with GEMINI_USE_FAKE=1 to benchmark without calling Google."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the server')
+        parser.add_argument('--username', required=True, help='Admin account used to log in')
+        parser.add_argument('--password', required=True)
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--path', default='/generate-article/',
+                            help='Endpoint to hit; GET for anything but the generation endpoint')
+
+    def handle(self, *args, **options):
+        base = options['url'].rstrip('/')
+        local = threading.local()
+
+        def session():
+            # One logged-in cookie jar per client thread
+            if not hasattr(local, 'opener'):
+                jar = CookieJar()
+                opener = build_opener(HTTPCookieProcessor(jar))
+                opener.open(f"{base}/login/").read()
+                csrf = next((c.value for c in jar if c.name == 'csrftoken'), '')
+                opener.open(Request(
+                    f"{base}/login/",
+                    data=urlencode({'username': options['username'], 'password': options['password'],
+                                    'csrfmiddlewaretoken': csrf}).encode(),
+                    headers={'Referer': f"{base}/login/"},
+                )).read()
+                local.opener = opener
+                local.csrf = next((c.value for c in jar if c.name == 'csrftoken'), csrf)
+            return local.opener, local.csrf
+
+        def one_request(_):
+            opener, csrf = session()
+            if options['path'] == '/generate-article/':
+                request = Request(
+                    base + options['path'],
+                    data=json.dumps({'keyword': 'benchmark'}).encode(),
+                    headers={'Content-Type': 'application/json', 'X-CSRFToken': csrf,
+                             'X-Requested-With': 'XMLHttpRequest', 'Referer': base + '/'},
+                )
+            else:
+                request = Request(base + options['path'])
+            start = time.perf_counter()
+            try:
+                with opener.open(request, timeout=120) as response:
+                    response.read()
+                    ok = response.status == 200
+            except Exception:
+                ok = False
+            return ok, time.perf_counter() - start
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            results = list(pool.map(one_request, range(options['requests'])))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for ok, latency in results if ok)
+        failures = sum(1 for ok, _ in results if not ok)
+        if not latencies:
+            raise CommandError(f"All {failures} request(s) failed")
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        self.stdout.write(
+            f"{len(results)} requests, concurrency {options['concurrency']}: "
+            f"{len(results) / elapsed:.1f} req/s, "
+            f"p50 {statistics.median(latencies) * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms, "
+            f"{failures} failed"
+        )
@@ -0,0 +1,97 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+MANAGE_PY = os.path.join(settings.BASE_DIR, 'manage.py')
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare article insert throughput on one database and on --shards article databases, "
+        "with --processes writers each adding articles to its own blog. Runs on throwaway SQLite files."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shards', type=int, default=4)
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--inserts', type=int, default=500, help='Articles added by each process')
+        # Internal: the steps run inside a process configured for the throwaway databases
+        parser.add_argument('--setup', action='store_true', help='(internal)')
+        parser.add_argument('--worker-blog', type=int, help='(internal)')
+        parser.add_argument('--start-at', type=float, help='(internal)')
+
+    def handle(self, *args, **options):
+        if options['setup']:
+            return self.setup(options['processes'])
+        if options['worker_blog']:
+            return self.work(options['worker_blog'], options['inserts'], options['start_at'])
+
+        self.stdout.write(f"{options['processes']} process(es) x {options['inserts']} inserts, {os.cpu_count()} CPU(s)")
+        for shards in (0, options['shards']):
+            rate = self.run_layout(shards, options['processes'], options['inserts'])
+            label = f"{shards} shards" if shards else "1 database"
+            self.stdout.write(f"{label:<12} {rate:>8.0f} inserts/s")
+
+    def run_layout(self, shards, processes, inserts):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(
+                os.environ,
+                SQLITE_PATH=os.path.join(tmp, 'default.sqlite3'),
+                SQLITE_SHARD_PATHS=','.join(os.path.join(tmp, f'shard{i + 1}.sqlite3') for i in range(shards)),
+                SQLITE_REPLICA_PATHS='',
+            )
+            for alias in ['default'] + [f'shard{i + 1}' for i in range(shards)]:
+                self.manage(env, 'migrate', '--noinput', '-v0', '--database', alias)
+            blog_ids = self.manage(env, 'benchmark_shard_writes', '--setup', '--processes', str(processes)).split()
+            start_at = time.time() + 2
+            workers = [
+                subprocess.Popen(
+                    [sys.executable, MANAGE_PY, 'benchmark_shard_writes', '--worker-blog', blog_id,
+                     '--inserts', str(inserts), '--start-at', str(start_at)],
+                    env=env, stdout=subprocess.PIPE, text=True,
+                )
+                for blog_id in blog_ids
+            ]
+            finished = []
+            for worker in workers:
+                out, _ = worker.communicate()
+                if worker.returncode:
+                    raise CommandError("A benchmark worker failed")
+                finished.append(float(out))
+        return processes * inserts / (max(finished) - start_at)
+
+    def manage(self, env, *args):
+        result = subprocess.run([sys.executable, MANAGE_PY, *args], env=env, capture_output=True, text=True)
+        if result.returncode:
+            raise CommandError(result.stderr)
+        return result.stdout
+
+    def setup(self, processes):
+        from django.contrib.auth.models import User
+
+        from blogapp import sharding
+        from blogapp.models import Blog, BlogShard
+
+        user = User.objects.create_user('benchmark', 'benchmark@example.com')
+        shards = sharding.shard_aliases()
+        for i in range(processes):
+            blog = Blog.objects.create(user=user, name=f'bench{i}', url='https://example.com', username='u', apikey='k')
+            if shards:
+                # One blog per shard in turn, rather than wherever the hash puts it
+                BlogShard.objects.filter(blog=blog).update(alias=shards[i % len(shards)])
+            self.stdout.write(str(blog.pk))
+
+    def work(self, blog_id, inserts, start_at):
+        from blogapp.models import Article, Blog
+
+        blog = Blog.objects.get(pk=blog_id)
+        body = 'Benchmark article body. ' * 40
+        time.sleep(max(0.0, start_at - time.time()))
+        for i in range(inserts):
+            Article.objects.create(user_id=blog.user_id, blog=blog, title=f'Article {i}', content=body)
+        self.stdout.write(repr(time.time()))
@@ -0,0 +1,137 @@
+import json
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+from blogapp.health import PROBE_PATH
+
+# The first path segment of a blog URL picks the answer, e.g. http://127.0.0.1:8001/slow
+BEHAVIOURS = ('ok', 'slow', 'auth', 'forbidden', 'error', 'hang')
+
+
+class StubServer:
+    """
+    A stand-in for many WordPress sites, for check_blog_health and its tests.
+
+    Answers PROBE_PATH under /<behaviour>/: ok and slow with 200 (slow
+    after `slow_seconds`), auth with 401, forbidden with 403, error with
+    500, and hang only after `hang_seconds`. Records the requests in
+    flight per Host header, so per-host limits can be checked.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, slow_seconds=0.3, hang_seconds=5.0):
+        self.slow_seconds = slow_seconds
+        self.hang_seconds = hang_seconds
+        self.requests = 0
+        self.in_flight = defaultdict(int)
+        self.max_in_flight = defaultdict(int)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        # Hanging requests must not hold up stop()
+        self.httpd.block_on_close = False
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, behaviour):
+        return f"{self.base_url}/{behaviour}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='blog-health-stub', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _enter(self, host):
+        with self._lock:
+            self.requests += 1
+            self.in_flight[host] += 1
+            self.max_in_flight[host] = max(self.max_in_flight[host], self.in_flight[host])
+
+    def _leave(self, host):
+        with self._lock:
+            self.in_flight[host] -= 1
+
+    def _answer(self, behaviour):
+        """(status, body) for a behaviour, after its delay"""
+        if behaviour == 'slow':
+            time.sleep(self.slow_seconds)
+        elif behaviour == 'hang':
+            time.sleep(self.hang_seconds)
+        if behaviour == 'auth':
+            return 401, {'code': 'rest_not_logged_in'}
+        if behaviour == 'forbidden':
+            return 403, {'code': 'rest_forbidden'}
+        if behaviour == 'error':
+            return 500, {'code': 'internal_server_error'}
+        if behaviour in ('ok', 'slow', 'hang'):
+            return 200, {'id': 1, 'name': 'stub'}
+        return 404, {'code': 'rest_no_route'}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                host = self.headers.get('Host', '')
+                behaviour, _, rest = self.path.lstrip('/').partition('/')
+                stub._enter(host)
+                try:
+                    if '/' + rest != PROBE_PATH:
+                        status, body = 404, {'code': 'rest_no_route'}
+                    else:
+                        status, body = stub._answer(behaviour)
+                finally:
+                    stub._leave(host)
+                data = json.dumps(body).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The prober gave up waiting
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve a stub WordPress REST API for trying check_blog_health locally. "
+        f"Point blogs at http://HOST:PORT/<behaviour>, behaviour one of {', '.join(BEHAVIOURS)}."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8001)
+        parser.add_argument('--slow-seconds', type=float, default=0.3,
+                            help='Delay of the slow behaviour')
+        parser.add_argument('--hang-seconds', type=float, default=60.0,
+                            help='Delay of the hang behaviour; longer than the probe timeout makes it a timeout')
+
+    def handle(self, *args, **options):
+        stub = StubServer(options['host'], options['port'], options['slow_seconds'], options['hang_seconds'])
+        self.stdout.write(f"Stub blogs at {stub.base_url}/<{'|'.join(BEHAVIOURS)}>; Ctrl-C to stop")
+        try:
+            stub.httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stub.httpd.server_close()
@@ -0,0 +1,77 @@
+import re
+from pathlib import Path
+from urllib.parse import quote
+
+import httpx
+
+from django.core.management.base import BaseCommand, CommandError
+
+APP_DIR = Path(__file__).resolve().parents[2]
+OUTPUT = APP_DIR / 'static' / 'vendor' / 'bootstrap-icons' / 'bootstrap-icons.css'
+
+# The sprite is fetched when the stylesheet is rebuilt, never vendored; bump the version here
+BOOTSTRAP_ICONS_VERSION = '1.11.3'
+SPRITE_URL = f'https://cdn.jsdelivr.net/npm/bootstrap-icons@{BOOTSTRAP_ICONS_VERSION}/bootstrap-icons.svg'
+
+ICON_CLASS_RE = re.compile(r'\bbi-([a-z0-9-]+)')
+
+HEADER = f"""/*!
+ * Bootstrap Icons v{BOOTSTRAP_ICONS_VERSION} subset (https://icons.getbootstrap.com/), MIT licensed.
+ * Generated by `manage.py build_icon_css`; only the icons referenced in
+ * blogapp/templates and blogapp/static/js are included.
+ */
+.bi::before {{
+  content: "";
+  display: inline-block;
+  width: 1em;
+  height: 1em;
+  vertical-align: -.125em;
+  background-color: currentColor;
+  -webkit-mask: var(--bi-icon) no-repeat center / contain;
+  mask: var(--bi-icon) no-repeat center / contain;
+}}
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Regenerate the self-hosted Bootstrap Icons stylesheet for the icons used in templates. "
+        "Run it after using a new icon; the output is committed, the sprite is not."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sprite', type=Path,
+                            help=f'A local bootstrap-icons.svg (e.g. from `npm install bootstrap-icons@'
+                                 f'{BOOTSTRAP_ICONS_VERSION}`) instead of downloading {SPRITE_URL}')
+
+    def load_sprite(self, path):
+        if path:
+            return path.read_text()
+        try:
+            response = httpx.get(SPRITE_URL, timeout=30, follow_redirects=True)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            raise CommandError(f"Could not download {SPRITE_URL}: {e}; pass --sprite instead")
+        return response.text
+
+    def handle(self, *args, **options):
+        sprite = self.load_sprite(options['sprite'])
+        names = set()
+        for template in (APP_DIR / 'templates').rglob('*.html'):
+            names.update(ICON_CLASS_RE.findall(template.read_text()))
+        # Scripts that swap icon classes (e.g. the password toggle)
+        for script in (APP_DIR / 'static' / 'js').rglob('*.js'):
+            names.update(ICON_CLASS_RE.findall(script.read_text()))
+
+        rules = []
+        for name in sorted(names):
+            match = re.search(r'<symbol[^>]*viewBox="([^"]+)"[^>]*id="%s"[^>]*>(.*?)</symbol>' % re.escape(name), sprite, re.S)
+            if not match:
+                raise CommandError(f"Icon 'bi-{name}' is not in Bootstrap Icons {BOOTSTRAP_ICONS_VERSION}")
+            view_box, body = match.groups()
+            svg = f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="{view_box}">{body}</svg>'
+            rules.append(f'.bi-{name} {{ --bi-icon: url("data:image/svg+xml,{quote(svg, safe=" =:/")}"); }}')
+
+        OUTPUT.parent.mkdir(parents=True, exist_ok=True)
+        OUTPUT.write_text(HEADER + '\n'.join(rules) + '\n')
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(rules)} icon(s) to {OUTPUT}"))
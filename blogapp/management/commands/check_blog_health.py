@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blogapp.health import check_blogs
+from blogapp.models import Blog
+
+
+class Command(BaseCommand):
+    help = "Probe every registered blog's REST API concurrently and record the results"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--blog', type=int, action='append', dest='blogs',
+                            help='Only probe this blog id (repeatable)')
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help='Requests in flight overall (default: BLOG_HEALTH_CONCURRENCY)')
+        parser.add_argument('--per-host', type=int, default=None,
+                            help='Requests in flight per host (default: BLOG_HEALTH_PER_HOST)')
+        parser.add_argument('--timeout', type=float, default=None,
+                            help='Seconds before a probe counts as unreachable (default: BLOG_HEALTH_TIMEOUT_SECONDS)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep probing instead of exiting after one pass')
+        parser.add_argument('--interval', type=float, default=300.0,
+                            help='Seconds between passes when --loop is given')
+
+    def handle(self, *args, **options):
+        blogs = Blog.objects.filter(is_deleting=False)
+        if options['blogs']:
+            blogs = blogs.filter(id__in=options['blogs'])
+        while True:
+            started = time.monotonic()
+            counts = check_blogs(
+                blogs,
+                concurrency=options['concurrency'],
+                per_host=options['per_host'],
+                timeout=options['timeout'],
+            )
+            summary = ', '.join(f"{status} {count}" for status, count in sorted(counts.items())) or 'no blogs'
+            self.stdout.write(f"Probed {sum(counts.values())} blog(s) in {time.monotonic() - started:.1f}s: {summary}")
+            if not options['loop']:
+                break
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                break
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blogapp import sharding
+from blogapp.fields import compress_text, decompress_text
+from blogapp.models import Article
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-encode stored article content with the configured compression, in batches. "
+        "Migration 0022 already converts plain-text rows; run this after changing "
+        "ARTICLE_CONTENT_COMPRESSION or its threshold."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Rows read and rewritten per transaction')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        scanned = rewritten = 0
+        for alias in sharding.all_aliases():
+            articles = sharding.on(Article.objects.all(), alias)
+            last_id = 0
+            while True:
+                rows = list(
+                    articles
+                    .filter(id__gt=last_id)
+                    .order_by('id')
+                    .values_list('id', 'content')[:batch_size]
+                )
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                scanned += len(rows)
+
+                changed = []
+                for article_id, stored in rows:
+                    text = decompress_text(stored)
+                    encoded = compress_text(text)
+                    if isinstance(stored, str) or bytes(stored) != encoded:
+                        changed.append(Article(id=article_id, content=text))
+                if changed:
+                    with transaction.atomic(using=alias):
+                        articles.bulk_update(changed, ['content'])
+                    rewritten += len(changed)
+                self.stdout.write(f"Scanned {scanned} article(s), rewrote {rewritten}")
+
+        self.stdout.write(self.style.SUCCESS(f"Done: rewrote {rewritten} of {scanned} article(s)"))
@@ -0,0 +1,20 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from blogapp.api import issue_token
+
+
+class Command(BaseCommand):
+    help = "Issue a JSON API token for a user and print its key (shown only once)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--name', default='cli', help='Label to tell the token apart (default: cli)')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['username']).first()
+        if user is None:
+            raise CommandError(f"No user named {options['username']}")
+        token, key = issue_token(user, options['name'])
+        self.stderr.write(f"Token {token.name!r} ({token.prefix}…) for {user.username}; store the key now, it is not kept:")
+        self.stdout.write(key)
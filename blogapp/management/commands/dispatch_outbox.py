@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blogapp.outbox import dispatch, lag, prune
+
+
+class Command(BaseCommand):
+    help = "Deliver outbox events (Article/Blog changes) to the registered consumers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Events handed to a consumer at a time (default: OUTBOX_BATCH_SIZE)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling instead of exiting after one pass')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds between polls when --loop is given')
+
+    def handle(self, *args, **options):
+        while True:
+            progress = dispatch(batch_size=options['batch_size'])
+            pruned = prune()
+            for name, (events, seconds) in lag().items():
+                if progress.get(name) or events:
+                    self.stdout.write(
+                        f"{name}: {progress.get(name, 0)} event(s) delivered, {events} behind ({seconds:.1f}s)"
+                    )
+            if pruned:
+                self.stdout.write(f"Pruned {pruned} delivered event(s)")
+            if not options['loop']:
+                break
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                break
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blogapp.deletion import claim_next_job, run_job
+
+
+class Command(BaseCommand):
+    help = "Run queued blog and user deletions in small batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Articles deleted per transaction (default: DELETION_BATCH_SIZE)')
+        parser.add_argument('--pause', type=float, default=None,
+                            help='Seconds to yield to other writers between batches '
+                                 '(default: DELETION_BATCH_PAUSE_SECONDS)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling instead of exiting once the queue is empty')
+        parser.add_argument('--interval', type=float, default=10.0,
+                            help='Seconds between polls when --loop is given')
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_next_job()
+            if job is not None:
+                job = run_job(job, batch_size=options['batch_size'], pause=options['pause'])
+                style = self.style.SUCCESS if job.status == 'done' else self.style.ERROR
+                self.stdout.write(style(
+                    f"{job.get_status_display()}: {job.target_type} {job.target_label} "
+                    f"({job.deleted}/{job.total} articles)"
+                ))
+                continue
+            if not options['loop']:
+                break
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                break
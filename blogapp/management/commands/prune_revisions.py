@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from blogapp.models import Article, ArticleRevision
+from blogapp.revisions import prune_revisions
+
+
+class Command(BaseCommand):
+    help = "Delete old article revisions, keeping the newest N per article"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', type=int, default=50,
+                            help='Revisions to keep per article')
+
+    def handle(self, *args, **options):
+        keep = options['keep']
+        if keep < 1:
+            self.stderr.write(self.style.ERROR("--keep must be at least 1"))
+            return
+        # Grouped on the revisions themselves, which all live on `default` whatever database holds the article
+        articles = (
+            ArticleRevision.objects
+            .values('article_id')
+            .annotate(revision_count=Count('id'))
+            .filter(revision_count__gt=keep)
+            .values_list('article_id', flat=True)
+        )
+        total = 0
+        for article_id in articles.iterator():
+            total += prune_revisions(Article(id=article_id), keep)
+        self.stdout.write(self.style.SUCCESS(f"Deleted {total} revision(s)"))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blogapp.scheduling import publish_due_articles
+
+
+class Command(BaseCommand):
+    help = "Publish scheduled articles whose publish time has passed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Articles leased and published per transaction')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling instead of exiting after one pass')
+        parser.add_argument('--interval', type=float, default=30.0,
+                            help='Seconds between polls when --loop is given')
+
+    def handle(self, *args, **options):
+        while True:
+            published = publish_due_articles(batch_size=options['batch_size'])
+            if published:
+                self.stdout.write(self.style.SUCCESS(f"Published {published} article(s)"))
+            if not options['loop']:
+                break
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                break
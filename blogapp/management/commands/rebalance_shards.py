@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blogapp import sharding
+from blogapp.models import Blog, BlogShard
+
+
+class Command(BaseCommand):
+    help = "Move blogs' articles between article databases, or show how articles are spread over them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--blog', type=int, action='append', dest='blogs',
+                            help='Blog id to move (repeatable); without it, only print the current spread')
+        parser.add_argument('--to', dest='target',
+                            help='Destination database alias (default, or one of ARTICLE_SHARDS)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Articles copied per transaction')
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help='Seconds to sleep between batches, to leave room for other writers')
+
+    def handle(self, *args, **options):
+        if options['blogs']:
+            if not options['target']:
+                raise CommandError("--to is required with --blog")
+            if options['target'] not in sharding.all_aliases():
+                raise CommandError(
+                    f"Unknown database {options['target']!r}; expected one of {', '.join(sharding.all_aliases())}"
+                )
+            missing = set(options['blogs']) - set(Blog.objects.filter(id__in=options['blogs']).values_list('id', flat=True))
+            if missing:
+                raise CommandError(f"No blog with id {', '.join(map(str, sorted(missing)))}")
+            for blog_id in options['blogs']:
+                try:
+                    moved = sharding.move_blog(
+                        blog_id, options['target'], batch_size=options['batch_size'], pause=options['pause'],
+                    )
+                except ValueError as e:
+                    raise CommandError(str(e))
+                self.stdout.write(self.style.SUCCESS(f"Blog {blog_id}: moved {moved} article(s) to {options['target']}"))
+        placed = {}
+        for alias in BlogShard.objects.values_list('alias', flat=True):
+            placed[alias] = placed.get(alias, 0) + 1
+        for alias, count in sharding.shard_counts().items():
+            blogs = placed.get(alias, 0) if alias != sharding.PRIMARY else Blog.objects.count() - sum(
+                n for a, n in placed.items() if a != sharding.PRIMARY
+            )
+            self.stdout.write(f"{alias}: {count} article(s), {blogs} blog(s)")
+        moving = BlogShard.objects.exclude(moving_to='').values_list('blog_id', 'alias', 'moving_to')
+        for blog_id, alias, moving_to in moving:
+            self.stdout.write(self.style.WARNING(f"Blog {blog_id} is mid-move from {alias} to {moving_to}; re-run to finish"))
@@ -0,0 +1,45 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from blogapp.routers import PRIMARY, replica_aliases
+
+
+class Command(BaseCommand):
+    help = "Copy the primary SQLite database onto each configured replica file (local replica setup)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep refreshing instead of exiting after one copy')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds between refreshes when --loop is given (the simulated lag)')
+
+    def handle(self, *args, **options):
+        aliases = replica_aliases()
+        if not aliases:
+            raise CommandError("No replicas configured; set SQLITE_REPLICA_PATHS.")
+        for alias in [PRIMARY, *aliases]:
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError(f"Database '{alias}' is not SQLite; use the server's own replication.")
+        while True:
+            started = time.monotonic()
+            source = sqlite3.connect(connections[PRIMARY].settings_dict['NAME'])
+            try:
+                for alias in aliases:
+                    target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+                    try:
+                        # Online backup: the primary stays writable while pages are copied
+                        source.backup(target, pages=1024)
+                    finally:
+                        target.close()
+            finally:
+                source.close()
+            self.stdout.write(f"Refreshed {len(aliases)} replica(s) in {time.monotonic() - started:.2f}s")
+            if not options['loop']:
+                break
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                break
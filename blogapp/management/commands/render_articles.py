@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blogapp import sharding
+from blogapp.models import Article, Blog
+from blogapp.rendering import backfill
+
+
+class Command(BaseCommand):
+    help = "Render and store the HTML of articles whose stored HTML is missing or stale"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--blog', type=int, action='append', dest='blogs',
+                            help='Only render this blog id (repeatable; default: every blog)')
+        parser.add_argument('--force', action='store_true',
+                            help='Render every selected article, even when its stored HTML is current')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Articles read and stored per batch')
+
+    def handle(self, *args, **options):
+        articles = Article.objects.all()
+        if options['blogs']:
+            missing = set(options['blogs']) - set(Blog.objects.filter(id__in=options['blogs']).values_list('id', flat=True))
+            if missing:
+                raise CommandError(f"No blog with id {', '.join(map(str, sorted(missing)))}")
+            articles = articles.filter(blog_id__in=options['blogs'])
+        started = time.monotonic()
+        checked = rendered = 0
+        for alias in sharding.all_aliases():
+            done = backfill(sharding.on(articles, alias), options['batch_size'], options['force'])
+            checked += done[0]
+            rendered += done[1]
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {rendered} of {checked} article(s) in {time.monotonic() - started:.1f}s"
+        ))
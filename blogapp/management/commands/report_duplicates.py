@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blogapp import sharding
+from blogapp.fingerprints import backfill, duplicate_groups
+from blogapp.models import Article, ArticleFingerprint, ArticleLSHBucket, Blog
+
+
+class Command(BaseCommand):
+    help = "Report groups of near-duplicate articles within each blog"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--blog', type=int, action='append', dest='blogs',
+                            help='Only report this blog id (repeatable; default: every blog)')
+        parser.add_argument('--threshold', type=float, default=None,
+                            help='Minimum estimated similarity (default: NEAR_DUPLICATE_THRESHOLD)')
+        parser.add_argument('--backfill', action='store_true',
+                            help='First fingerprint articles that have none (e.g. bulk-imported rows)')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='First recompute every fingerprint of the selected blogs')
+
+    def handle(self, *args, **options):
+        blogs = Blog.objects.order_by('id')
+        if options['blogs']:
+            blogs = blogs.filter(id__in=options['blogs'])
+            missing = set(options['blogs']) - set(blogs.values_list('id', flat=True))
+            if missing:
+                raise CommandError(f"No blog with id {', '.join(map(str, sorted(missing)))}")
+        found = 0
+        for blog in blogs:
+            querysets = sharding.blog_querysets(blog.id)
+            if options['rebuild']:
+                for lookup in sharding.article_ids(querysets):
+                    ArticleFingerprint.objects.filter(article_id__in=lookup).delete()
+                    ArticleLSHBucket.objects.filter(article_id__in=lookup).delete()
+            if options['backfill'] or options['rebuild']:
+                count = sum(backfill(articles) for articles in querysets)
+                if count:
+                    self.stdout.write(f"Blog {blog.id}: fingerprinted {count} article(s)")
+            groups = duplicate_groups(blog, threshold=options['threshold'])
+            if not groups:
+                continue
+            titles = {
+                pk: article.title for pk, article in sharding.in_bulk(
+                    [pk for group in groups for pk, _ in group], Article.objects.only('id', 'title', 'updated_at'),
+                ).items()
+            }
+            self.stdout.write(self.style.WARNING(f"{blog.name} (id {blog.id}): {len(groups)} group(s)"))
+            for group in groups:
+                found += len(group)
+                for pk, score in group:
+                    self.stdout.write(f"  {score:5.0%}  #{pk} {titles.get(pk, '')}")
+                self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(f"{found} article(s) in near-duplicate groups"))
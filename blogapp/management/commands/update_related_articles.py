@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blogapp import sharding
+from blogapp.models import Article
+from blogapp.related import rebuild_user, update_all
+
+
+class Command(BaseCommand):
+    help = "Refresh the precomputed related-articles lists"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute every list instead of only those touched by changed articles')
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Limit --rebuild to this user id (repeatable)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling for changed articles instead of exiting after one pass')
+        parser.add_argument('--interval', type=float, default=60.0,
+                            help='Seconds between polls when --loop is given')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            user_ids = options['users'] or sorted({
+                user_id for alias in sharding.all_aliases()
+                for user_id in sharding.on(Article.objects.all(), alias).values_list('user_id', flat=True).distinct()
+            })
+            for user_id in user_ids:
+                started = time.monotonic()
+                count = rebuild_user(user_id)
+                self.stdout.write(f"User {user_id}: {count} article(s) in {time.monotonic() - started:.1f}s")
+            return
+        while True:
+            updated = update_all()
+            if updated:
+                self.stdout.write(self.style.SUCCESS(f"Updated related articles for {updated} changed article(s)"))
+            if not options['loop']:
+                break
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                break
@@ -0,0 +1,54 @@
+import threading
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+
+
+def _key(name, labels):
+    return (name, tuple(sorted((labels or {}).items())))
+
+
+def inc(name, value=1, **labels):
+    """Increment a process-local counter"""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    """Set a process-local gauge to the given value"""
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def snapshot():
+    """Return a copy of all counters and gauges"""
+    with _lock:
+        return dict(_counters), dict(_gauges)
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+
+def render_prometheus():
+    """Render every metric in the Prometheus text exposition format"""
+    counters, gauges = snapshot()
+    lines = []
+    for kind, metrics in (('counter', counters), ('gauge', gauges)):
+        seen = set()
+        for (name, labels), value in sorted(metrics.items()):
+            if name not in seen:
+                lines.append(f'# TYPE {name} {kind}')
+                seen.add(name)
+            lines.append(f'{name}{_format_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,213 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponseNotModified
+from django.middleware.gzip import GZipMiddleware
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+from . import admission, metrics, profiling, routers
+
+# Names produced by ManifestStaticFilesStorage, e.g. base.3f2a9c1b7d4e.css
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}\.[^/.]+$')
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+UNHASHED_CACHE_CONTROL = 'public, max-age=300'
+
+
+class StaticAssetMiddleware:
+    """
+    Serve files from STATIC_ROOT before sessions, auth or CSRF run.
+
+    Hashed names get a one-year immutable Cache-Control; other files are
+    cached briefly and revalidated with If-None-Match (a weak ETag from the
+    file's mtime and size, shared by its encodings) or If-Modified-Since.
+    The precompressed .br/.gz copies written by collectstatic are sent when
+    the client accepts them. Requests for files that are not in STATIC_ROOT fall through to the
+    rest of the stack (e.g. runserver's finder-based handler in DEBUG).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = '/' + settings.STATIC_URL.lstrip('/')
+        self.root = str(settings.STATIC_ROOT) if getattr(settings, 'STATIC_ROOT', None) else None
+
+    def __call__(self, request):
+        if self.root and request.method in ('GET', 'HEAD') and request.path.startswith(self.prefix):
+            response = self.serve(request, request.path[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def serve(self, request, name):
+        try:
+            path = safe_join(self.root, name)
+        except Exception:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        stat = os.stat(path)
+        if self._not_modified(request, stat):
+            response = HttpResponseNotModified()
+            self._set_cache_headers(response, name, stat)
+            return response
+
+        accept = request.headers.get('Accept-Encoding', '')
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        serve_path, encoding = path, None
+        for suffix, token in (('.br', 'br'), ('.gz', 'gzip')):
+            if token in accept and os.path.isfile(path + suffix):
+                serve_path, encoding = path + suffix, token
+                break
+
+        response = FileResponse(open(serve_path, 'rb'), content_type=content_type)
+        # FileResponse derives an inline Content-Disposition from the file's name; assets don't need one
+        response.headers.pop('Content-Disposition', None)
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['Vary'] = 'Accept-Encoding'
+        self._set_cache_headers(response, name, stat)
+        return response
+
+    @staticmethod
+    def _etag(stat):
+        return 'W/"%x-%x"' % (int(stat.st_mtime), stat.st_size)
+
+    def _not_modified(self, request, stat):
+        # If-None-Match wins over If-Modified-Since when both are sent (RFC 9110 13.2.2)
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            etag = self._etag(stat).removeprefix('W/')
+            return if_none_match.strip() == '*' or etag in (tag.removeprefix('W/') for tag in parse_etags(if_none_match))
+        if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        return bool(if_modified_since) and int(stat.st_mtime) <= if_modified_since
+
+    def _set_cache_headers(self, response, name, stat):
+        response['ETag'] = self._etag(stat)
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if HASHED_NAME_RE.search(name) else UNHASHED_CACHE_CONTROL
+
+
+class ApiGZipMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware for the JSON API only.
+
+    HTML pages are sent uncompressed because of BREACH: they hold secrets
+    (the CSRF token, a blog's API key in its edit form) next to text an
+    attacker can put in the URL, and a cross-site page can make the browser
+    fetch them with the victim's cookies while it watches response sizes.
+    The API is safe to compress: it authenticates with a bearer token that
+    a browser never attaches by itself, and it never echoes the token.
+    Feeds and static files are stored compressed and carry their own
+    Content-Encoding, which this leaves alone.
+    """
+
+    def process_response(self, request, response):
+        match = getattr(request, 'resolver_match', None)
+        if match is None or not (match.url_name or '').startswith('api_'):
+            return response
+        return super().process_response(request, response)
+
+
+class ReplicaPinningMiddleware:
+    """
+    Keep a client on the primary database for a while after it writes.
+
+    Unsafe methods are pinned from the start. A request that writes sets a
+    short-lived cookie; while it is present the client's reads skip the
+    replicas, so it never sees a page older than its own change. Cache and
+    bookkeeping writes made under routers.unpinned_write() don't count.
+    Does nothing when no DATABASE_REPLICAS are configured.
+    """
+    cookie_name = 'db_pin'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not routers.replica_aliases():
+            return self.get_response(request)
+        pin = request.method not in ('GET', 'HEAD', 'OPTIONS') or self.cookie_name in request.COOKIES
+        with routers.pinned(pin):
+            response = self.get_response(request)
+            wrote = routers.has_written()
+        if wrote:
+            response.set_cookie(
+                self.cookie_name, '1',
+                max_age=getattr(settings, 'REPLICA_STICKY_SECONDS', 10),
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+
+class AdmissionControlMiddleware:
+    """
+    Hold a slot of the request's route class while its view runs (see
+    blogapp.admission); a request that cannot get one is answered with
+    503/429 and Retry-After without running the view. Streaming responses
+    keep their slot until the body has been sent.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            self._release(request)
+            raise
+        slot = getattr(request, '_admission_slot', None)
+        if slot is not None and response.streaming:
+            response._resource_closers.append(lambda: self._release(request))
+        else:
+            self._release(request)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not getattr(settings, 'ADMISSION_CONTROL_ENABLED', True):
+            return None
+        controller = admission.controller()
+        route_class = admission.classify(request)
+        limit = controller.limits.get(route_class)
+        client = admission.client_key(request) if limit and limit.per_client else None
+        try:
+            waited = controller.acquire(route_class, client)
+        except admission.Rejected as e:
+            return admission.rejection_response(request, e)
+        request._admission_slot = (controller, route_class, client)
+        if waited:
+            metrics.inc('admission_wait_seconds_total', round(waited, 3), route_class=route_class)
+        return None
+
+    def _release(self, request):
+        slot = request.__dict__.pop('_admission_slot', None)
+        if slot is not None:
+            controller, route_class, client = slot
+            controller.release(route_class, client)
+
+
+class ProfilingMiddleware:
+    """
+    Profile the rest of the stack for requests an admin flagged, or for a
+    random PROFILING_SAMPLE_PERCENT share of all requests (see
+    blogapp.profiling). Placed after AuthenticationMiddleware, which the
+    admin check needs.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'PROFILING_ENABLED', True):
+            return self.get_response(request)
+        mode = profiling.requested_mode(request)
+        if mode is not None:
+            return profiling.profile(request, self.get_response, mode, 'flag')
+        if profiling.take_sample():
+            return profiling.profile(request, self.get_response, 'sample', 'sampled')
+        return self.get_response(request)
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:42
+
+from django.db import migrations, models
+
+
+def backfill_categories(apps, schema_editor):
+    Blog = apps.get_model('blogapp', 'Blog')
+    Category = apps.get_model('blogapp', 'Category')
+    Through = Blog.categories.through
+
+    blog_names = {
+        blog_id: {name for name in (names or []) if name}
+        for blog_id, names in Blog.objects.values_list('id', 'category').iterator()
+    }
+    all_names = set().union(*blog_names.values()) if blog_names else set()
+    Category.objects.bulk_create([Category(name=name) for name in all_names], ignore_conflicts=True)
+    category_ids = dict(Category.objects.values_list('name', 'id'))
+
+    Through.objects.bulk_create(
+        [
+            Through(blog_id=blog_id, category_id=category_ids[name])
+            for blog_id, names in blog_names.items()
+            for name in names
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+            ],
+            options={
+                'verbose_name_plural': 'categories',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='blog',
+            name='categories',
+            field=models.ManyToManyField(blank=True, related_name='blogs', to='blogapp.category'),
+        ),
+        migrations.RunPython(backfill_categories, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:46
+
+import blogapp.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogapp', '0004_articlerevision'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='article',
+            name='content',
+            field=blogapp.fields.CompressedTextField(editable=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogapp', '0005_article_content_compressed'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    # auth.User belongs to another app, so the indexes are created in SQL.
+    # Blank emails (e.g. createsuperuser without one) are left out of the
+    # uniqueness check.
+    operations = [
+        migrations.RunSQL(
+            "CREATE UNIQUE INDEX blogapp_user_email_ci_uniq ON auth_user (LOWER(email)) WHERE email > ''",
+            "DROP INDEX blogapp_user_email_ci_uniq",
+        ),
+        migrations.RunSQL(
+            "CREATE INDEX blogapp_user_date_joined_idx ON auth_user (date_joined)",
+            "DROP INDEX blogapp_user_date_joined_idx",
+        ),
+    ]
@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+
+def check_duplicate_emails(apps, schema_editor):
+    # The unique index would fail with a bare IntegrityError; name the accounts to merge or fix instead
+    User = apps.get_model('auth', 'User')
+    duplicates = list(
+        User.objects.using(schema_editor.connection.alias)
+        .filter(email__gt='')
+        .values(email_lower=Lower('email'))
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+        .order_by('email_lower')
+        .values_list('email_lower', flat=True)
+    )
+    if not duplicates:
+        return
+    lines = []
+    for email in duplicates:
+        users = (
+            User.objects.using(schema_editor.connection.alias)
+            .annotate(email_lower=Lower('email'))
+            .filter(email_lower=email)
+            .order_by('id')
+            .values_list('id', 'username', 'email')
+        )
+        lines.append(f"  {email}: " + ', '.join(f"#{pk} {username} <{address}>" for pk, username, address in users))
+    raise RuntimeError(
+        "Cannot add the case-insensitive unique index on auth_user.email: "
+        f"{len(duplicates)} address(es) belong to more than one user. Change or clear the email of all but one "
+        "user of each, then run migrate again.\n" + '\n'.join(lines)
+    )
+
+
+class Migration(migrations.Migration):
+    """
+    0006 with a duplicate-email check before the unique index.
+
+    0006 itself has already run on existing databases and is left as it
+    was; Django counts this one as applied there, and runs it instead of
+    0006 on databases that have neither.
+    """
+
+    replaces = [('blogapp', '0006_user_email_ci_unique')]
+
+    dependencies = [
+        ('blogapp', '0005_article_content_compressed'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    # auth.User belongs to another app, so the indexes are created in SQL.
+    # Blank emails (e.g. createsuperuser without one) are left out of the
+    # uniqueness check.
+    operations = [
+        migrations.RunPython(check_duplicate_emails, migrations.RunPython.noop),
+        migrations.RunSQL(
+            "CREATE UNIQUE INDEX blogapp_user_email_ci_uniq ON auth_user (LOWER(email)) WHERE email > ''",
+            "DROP INDEX blogapp_user_email_ci_uniq",
+        ),
+        migrations.RunSQL(
+            "CREATE INDEX blogapp_user_date_joined_idx ON auth_user (date_joined)",
+            "DROP INDEX blogapp_user_date_joined_idx",
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogapp', '0006_user_email_ci_unique'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['user', 'updated_at'], name='article_user_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='blog',
+            index=models.Index(fields=['user', 'updated_at'], name='blog_user_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,94 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:58
+
+import blogapp.fields
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_archived_at(apps, schema_editor):
+    # Rows archived before the column existed start their policy window at their last update
+    Article = apps.get_model('blogapp', 'Article')
+    Article.objects.filter(status='archived', archived_at__isnull=True).update(archived_at=F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogapp', '0008_deletion_jobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedArticle',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=200)),
+                ('content', blogapp.fields.CompressedTextField(editable=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('published_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField()),
+                ('moved_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['-archived_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedArticleRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('title', models.CharField(max_length=200)),
+                ('is_snapshot', models.BooleanField(default=False)),
+                ('data', models.BinaryField()),
+                ('content_length', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['-number'],
+            },
+        ),
+        migrations.AddField(
+            model_name='article',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(condition=models.Q(('status', 'archived')), fields=['archived_at'], name='article_archived_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedarticle',
+            name='blog',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_articles', to='blogapp.blog'),
+        ),
+        migrations.AddField(
+            model_name='archivedarticle',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_articles', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedarticlerevision',
+            name='article',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='blogapp.archivedarticle'),
+        ),
+        migrations.AddField(
+            model_name='archivedarticlerevision',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_article_revisions', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='archivedarticle',
+            index=models.Index(fields=['user', 'archived_at'], name='archived_user_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='archivedarticlerevision',
+            unique_together={('article', 'number')},
+        ),
+        migrations.RunPython(backfill_archived_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogapp', '0009_article_archive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archivedarticle',
+            index=models.Index(fields=['archived_at'], name='archived_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['created_at'], name='article_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='blog',
+            index=models.Index(fields=['created_at'], name='blog_created_idx'),
+        ),
+    ]
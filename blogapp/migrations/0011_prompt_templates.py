@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogapp', '0010_admin_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromptTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.SlugField()),
+                ('version', models.PositiveIntegerField()),
+                ('body', models.TextField()),
+                ('description', models.CharField(blank=True, max_length=200)),
+                ('is_active', models.BooleanField(default=True)),
+                ('token_count', models.PositiveIntegerField(default=0, editable=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['name', '-version'],
+                'unique_together': {('name', 'version')},
+            },
+        ),
+        migrations.AddField(
+            model_name='blog',
+            name='prompt_template',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='blogs', to='blogapp.prompttemplate'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogapp', '0012_related_articles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArticleFingerprint',
+            fields=[
+                ('article', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fingerprint', serialize=False, to='blogapp.article')),
+                ('digest', models.CharField(max_length=40)),
+                ('signature', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArticleLSHBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.BigIntegerField()),
+                ('article', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lsh_buckets', to='blogapp.article')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['key', 'article'], name='articlelsh_key_idx')],
+            },
+        ),
+    ]
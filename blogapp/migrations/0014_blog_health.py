@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogapp', '0013_article_fingerprints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlogHealth',
+            fields=[
+                ('blog', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='health', serialize=False, to='blogapp.blog')),
+                ('status', models.CharField(choices=[('ok', 'OK'), ('slow', 'Slow'), ('auth', 'Credentials rejected'), ('error', 'Error'), ('down', 'Unreachable')], max_length=10)),
+                ('status_code', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('latency_ms', models.PositiveIntegerField(blank=True, null=True)),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('consecutive_failures', models.PositiveIntegerField(default=0)),
+                ('last_ok_at', models.DateTimeField(blank=True, null=True)),
+                ('history', models.JSONField(blank=True, default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'blog health',
+            },
+        ),
+    ]
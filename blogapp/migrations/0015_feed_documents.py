@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogapp', '0014_blog_health'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('rss', 'RSS'), ('atom', 'Atom'), ('sitemap_index', 'Sitemap index'), ('sitemap', 'Sitemap')], max_length=20)),
+                ('part', models.PositiveIntegerField(default=0)),
+                ('body', models.BinaryField(default=b'')),
+                ('etag', models.CharField(blank=True, max_length=40)),
+                ('stale', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(condition=models.Q(('status', 'published')), fields=['blog', 'published_at', 'id'], name='article_blog_published_idx'),
+        ),
+        migrations.AddField(
+            model_name='feeddocument',
+            name='blog',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_documents', to='blogapp.blog'),
+        ),
+        migrations.AddConstraint(
+            model_name='feeddocument',
+            constraint=models.UniqueConstraint(fields=('blog', 'kind', 'part'), name='feeddocument_uniq'),
+        ),
+    ]
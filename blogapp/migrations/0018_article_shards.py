@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogapp', '0017_outbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArticleIdSequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('next_value', models.BigIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BlogShard',
+            fields=[
+                ('blog', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='shard', serialize=False, to='blogapp.blog')),
+                ('alias', models.CharField(max_length=100)),
+                ('moving_to', models.CharField(blank=True, max_length=100)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='article',
+            name='blog',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='articles', to='blogapp.blog'),
+        ),
+        migrations.AlterField(
+            model_name='article',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='articles', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='articlefingerprint',
+            name='article',
+            field=models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fingerprint', serialize=False, to='blogapp.article'),
+        ),
+        migrations.AlterField(
+            model_name='articlelshbucket',
+            name='article',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='lsh_buckets', to='blogapp.article'),
+        ),
+        migrations.AlterField(
+            model_name='articlerevision',
+            name='article',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='blogapp.article'),
+        ),
+        migrations.AlterField(
+            model_name='articlevector',
+            name='article',
+            field=models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='vector', serialize=False, to='blogapp.article'),
+        ),
+        migrations.AlterField(
+            model_name='relatedarticle',
+            name='article',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='related_links', to='blogapp.article'),
+        ),
+        migrations.AlterField(
+            model_name='relatedarticle',
+            name='related',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='blogapp.article'),
+        ),
+    ]
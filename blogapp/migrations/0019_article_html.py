@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:43
+
+import blogapp.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogapp', '0018_article_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArticleHtml',
+            fields=[
+                ('article', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rendered', serialize=False, to='blogapp.article')),
+                ('content_hash', models.CharField(max_length=40)),
+                ('html', blogapp.fields.CompressedTextField(editable=True)),
+                ('rendered_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
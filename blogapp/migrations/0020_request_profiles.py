@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:47
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogapp', '0019_article_html'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=500)),
+                ('view_name', models.CharField(blank=True, max_length=200)),
+                ('status_code', models.PositiveSmallIntegerField(null=True)),
+                ('mode', models.CharField(choices=[('cprofile', 'cProfile'), ('sample', 'Stack sampling')], max_length=10)),
+                ('trigger', models.CharField(choices=[('flag', 'Requested'), ('sampled', 'Random sample')], max_length=10)),
+                ('duration_ms', models.FloatField()),
+                ('sql_count', models.PositiveIntegerField(default=0)),
+                ('sql_ms', models.FloatField(default=0)),
+                ('queries', models.JSONField(blank=True, default=list)),
+                ('stacks', models.TextField(blank=True)),
+                ('pstats', models.BinaryField(blank=True, null=True)),
+                ('summary', models.TextField(blank=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['-created_at'], name='requestprofile_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogapp', '0020_request_profiles'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    # Serves the case-insensitive username prefix search in user_list, next
+    # to blogapp_user_email_ci_uniq (0006); auth.User belongs to another app,
+    # so the index is created in SQL.
+    operations = [
+        migrations.RunSQL(
+            "CREATE INDEX blogapp_user_username_ci_idx ON auth_user (LOWER(username))",
+            "DROP INDEX blogapp_user_username_ci_idx",
+        ),
+    ]
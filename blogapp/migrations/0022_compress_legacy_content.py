@@ -0,0 +1,36 @@
+from django.db import migrations, transaction
+
+from blogapp.fields import compress_text
+
+BATCH_SIZE = 500
+
+
+def compress_legacy_content(apps, schema_editor):
+    # 0005 changed the column type only; rows written before it still hold plain text
+    Article = apps.get_model('blogapp', 'Article')
+    alias = schema_editor.connection.alias
+    articles = Article.objects.using(alias)
+    last_id = 0
+    while True:
+        rows = list(articles.filter(id__gt=last_id).order_by('id').values_list('id', 'content')[:BATCH_SIZE])
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        legacy = [Article(id=pk, content=compress_text(text)) for pk, text in rows if isinstance(text, str)]
+        if legacy:
+            with transaction.atomic(using=alias):
+                articles.bulk_update(legacy, ['content'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogapp', '0021_user_username_ci_idx'),
+    ]
+
+    # Runs on every article database (the shards are migrated too). Reading
+    # works either way (decompress_text accepts text rows), so there is
+    # nothing to undo.
+    operations = [
+        migrations.RunPython(compress_legacy_content, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:31
+
+import blogapp.fields
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations
+
+# Rows pointing at articles, and the article columns pointing elsewhere
+SIDE_TABLES = [
+    ('ArticleRevision', 'article'), ('ArticleVector', 'article'), ('RelatedArticle', 'article'),
+    ('RelatedArticle', 'related'), ('ArticleFingerprint', 'article'), ('ArticleLSHBucket', 'article'),
+    ('ArticleHtml', 'article'),
+]
+
+
+def delete_orphans(apps, schema_editor):
+    # Nothing enforced these since 0018; a constraint cannot be added over dangling rows
+    if getattr(settings, 'ARTICLE_SHARDS', []):
+        return
+    alias = schema_editor.connection.alias
+    Article = apps.get_model('blogapp', 'Article')
+    Blog = apps.get_model('blogapp', 'Blog')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    articles = Article.objects.using(alias)
+    articles.exclude(blog_id__in=Blog.objects.using(alias).values('id')).delete()
+    articles.exclude(user_id__in=User.objects.using(alias).values('id')).delete()
+    for model_name, field in SIDE_TABLES:
+        model = apps.get_model('blogapp', model_name)
+        model.objects.using(alias).exclude(**{f'{field}_id__in': articles.values('id')}).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogapp', '0022_compress_legacy_content'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    # Rebuilds the tables with foreign key constraints unless ARTICLE_SHARDS
+    # is set (see blogapp.fields.ShardableRelationMixin)
+    operations = [
+        migrations.RunPython(delete_orphans, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='article',
+            name='blog',
+            field=blogapp.fields.ShardableForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='articles', to='blogapp.blog'),
+        ),
+        migrations.AlterField(
+            model_name='article',
+            name='user',
+            field=blogapp.fields.ShardableForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='articles', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='articlefingerprint',
+            name='article',
+            field=blogapp.fields.ShardableOneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fingerprint', serialize=False, to='blogapp.article'),
+        ),
+        migrations.AlterField(
+            model_name='articlehtml',
+            name='article',
+            field=blogapp.fields.ShardableOneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rendered', serialize=False, to='blogapp.article'),
+        ),
+        migrations.AlterField(
+            model_name='articlelshbucket',
+            name='article',
+            field=blogapp.fields.ShardableForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lsh_buckets', to='blogapp.article'),
+        ),
+        migrations.AlterField(
+            model_name='articlerevision',
+            name='article',
+            field=blogapp.fields.ShardableForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='blogapp.article'),
+        ),
+        migrations.AlterField(
+            model_name='articlevector',
+            name='article',
+            field=blogapp.fields.ShardableOneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='vector', serialize=False, to='blogapp.article'),
+        ),
+        migrations.AlterField(
+            model_name='relatedarticle',
+            name='article',
+            field=blogapp.fields.ShardableForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_links', to='blogapp.article'),
+        ),
+        migrations.AlterField(
+            model_name='relatedarticle',
+            name='related',
+            field=blogapp.fields.ShardableForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='blogapp.article'),
+        ),
+    ]
@@ -1,7 +1,10 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.contrib.auth.models import User
+from django.db.models.functions import Lower
 from django.utils import timezone
 
+from .fields import CompressedTextField, ShardableForeignKey, ShardableOneToOneField
+
 class UserProfile(models.Model):
     ROLE_CHOICES = [
         ('user', 'User'),
@@ -10,6 +13,8 @@ class UserProfile(models.Model):
     
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, default='user')
+    # Set as soon as deletion is requested; the rows go in the background (blogapp.deletion)
+    is_deleting = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -27,6 +32,55 @@ class UserProfile(models.Model):
     def is_user(self):
         return self.role == 'user'
 
+def users_with_email(email):
+    """Users whose email matches case-insensitively, served by the LOWER(email) unique index"""
+    # email__gt='' repeats the partial index predicate so the planner can use it
+    return User.objects.annotate(email_lower=Lower('email')).filter(email_lower=email.lower(), email__gt='')
+
+class Category(models.Model):
+    """Normalized index of the names stored in Blog.category"""
+    name = models.CharField(max_length=50, unique=True)
+    
+    class Meta:
+        ordering = ['name']
+        verbose_name_plural = 'categories'
+    
+    def __str__(self):
+        return self.name
+
+class PromptTemplate(models.Model):
+    """
+    A versioned prompt for the AI generator (see blogapp.prompts).
+    
+    A version's body never changes once saved; edit by adding a new
+    version. Placeholders use str.format syntax, e.g. {keyword}.
+    """
+    name = models.SlugField(max_length=50)
+    version = models.PositiveIntegerField()
+    body = models.TextField()
+    description = models.CharField(max_length=200, blank=True)
+    # Only active versions are picked as the default for their name
+    is_active = models.BooleanField(default=True)
+    # Estimated tokens in the fixed text, so a request can be sized before rendering
+    token_count = models.PositiveIntegerField(default=0, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['name', '-version']
+        unique_together = ['name', 'version']
+    
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+    
+    def clean(self):
+        from .prompts import validate_template
+        validate_template(self.name, self.body)
+    
+    def save(self, *args, **kwargs):
+        from .prompts import compile_template
+        self.token_count = compile_template(self.name, self.version, self.body).static_tokens
+        super().save(*args, **kwargs)
+
 class Blog(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='blogs')
     name = models.CharField(max_length=100, unique=True)
@@ -34,50 +88,212 @@ class Blog(models.Model):
     username = models.CharField(max_length=50)
     apikey = models.CharField(max_length=255)
     category = models.JSONField(default=list, blank=True)
+    # Kept in sync with `category` by sync_blog_categories below
+    categories = models.ManyToManyField(Category, related_name='blogs', blank=True)
+    # None uses the newest active version of the default prompt
+    prompt_template = models.ForeignKey(
+        PromptTemplate, on_delete=models.SET_NULL, null=True, blank=True, related_name='blogs',
+    )
+    # Set as soon as deletion is requested; the rows go in the background (blogapp.deletion)
+    is_deleting = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         unique_together = ['user', 'name']
         ordering = ['-created_at']
+        indexes = [
+            # Covers the per-user MAX(updated_at)/COUNT(*) behind conditional GETs
+            models.Index(fields=['user', 'updated_at'], name='blog_user_updated_idx'),
+            # Default ordering and the admin date hierarchy
+            models.Index(fields=['created_at'], name='blog_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name} ({self.user.username})"
     
+    def save(self, *args, **kwargs):
+        # One transaction with the post_save receivers, so the outbox event commits with the row
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(Blog, instance=self)):
+            super().save(*args, **kwargs)
+    
     def get_categories_display(self):
         return ', '.join(self.category) if self.category else 'No categories'
+    
+    def sync_categories(self):
+        """Mirror the `category` JSON list into the indexed `categories` relation"""
+        names = {name for name in (self.category or []) if name}
+        if names == set(self.categories.values_list('name', flat=True)):
+            return
+        Category.objects.bulk_create([Category(name=name) for name in names], ignore_conflicts=True)
+        self.categories.set(Category.objects.filter(name__in=names))
+
+class BlogHealth(models.Model):
+    """
+    Result of the latest probe of a blog's REST API (see blogapp.health).
+    
+    `history` keeps the most recent BLOG_HEALTH_HISTORY probes, oldest
+    first, as [checked_at ISO string, latency in ms or null, status].
+    """
+    STATUS_CHOICES = [
+        ('ok', 'OK'),
+        ('slow', 'Slow'),
+        ('auth', 'Credentials rejected'),
+        ('error', 'Error'),
+        ('down', 'Unreachable'),
+    ]
+    
+    blog = models.OneToOneField(Blog, on_delete=models.CASCADE, primary_key=True, related_name='health')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    latency_ms = models.PositiveIntegerField(null=True, blank=True)
+    error = models.CharField(max_length=255, blank=True)
+    consecutive_failures = models.PositiveIntegerField(default=0)
+    last_ok_at = models.DateTimeField(null=True, blank=True)
+    history = models.JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'blog health'
+    
+    def __str__(self):
+        return f"{self.blog_id}: {self.status}"
+    
+    @property
+    def is_healthy(self):
+        return self.status in ('ok', 'slow')
+    
+    @property
+    def recent_latencies(self):
+        return [latency for _, latency, _ in self.history if latency is not None]
+
+class BlogShard(models.Model):
+    """
+    Which database holds a blog's articles (blogapp.sharding). Blogs without
+    a row keep theirs on `default`. While `moving_to` is set, the articles
+    are being copied there by `manage.py rebalance_shards`.
+    """
+    blog = models.OneToOneField(Blog, on_delete=models.CASCADE, primary_key=True, related_name='shard')
+    alias = models.CharField(max_length=100)
+    moving_to = models.CharField(max_length=100, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.blog_id}: {self.alias}" + (f" -> {self.moving_to}" if self.moving_to else '')
+
+class ArticleIdSequence(models.Model):
+    """
+    Next free article id, handed out in blocks (blogapp.sharding.next_article_id)
+    so ids stay unique across article databases.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    next_value = models.BigIntegerField()
+    
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
+class ArticleQuerySet(models.QuerySet):
+    def create(self, **kwargs):
+        # Without an explicit .using(), let the router place the row by its blog
+        if self._db is not None:
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True)
+        return obj
 
 class Article(models.Model):
     STATUS_CHOICES = [
         ('draft', 'Draft'),
+        ('scheduled', 'Scheduled'),
         ('published', 'Published'),
         ('archived', 'Archived'),
     ]
     
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='articles')
-    blog = models.ForeignKey(Blog, on_delete=models.CASCADE, related_name='articles')
+    # Without database constraints when sharded, as are the per-article tables
+    # below: an article may then live on a shard database (blogapp.sharding)
+    user = ShardableForeignKey(User, on_delete=models.CASCADE, related_name='articles')
+    blog = ShardableForeignKey(Blog, on_delete=models.CASCADE, related_name='articles')
     title = models.CharField(max_length=200)
-    content = models.TextField()
+    content = CompressedTextField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='draft')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     published_at = models.DateTimeField(null=True, blank=True)
+    # When a 'scheduled' article should be flipped to 'published'
+    publish_at = models.DateTimeField(null=True, blank=True)
+    # When the article entered 'archived'; drives the move to ArchivedArticle
+    archived_at = models.DateTimeField(null=True, blank=True)
+    
+    objects = ArticleQuerySet.as_manager()
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'updated_at'], name='article_user_updated_idx'),
+            # Default ordering and the admin date hierarchy
+            models.Index(fields=['created_at'], name='article_created_idx'),
+            # Only scheduled rows are indexed, so the due-job scan stays small
+            models.Index(
+                fields=['status', 'publish_at'],
+                name='article_scheduled_idx',
+                condition=models.Q(status='scheduled'),
+            ),
+            models.Index(
+                fields=['archived_at'],
+                name='article_archived_idx',
+                condition=models.Q(status='archived'),
+            ),
+            # A blog's published articles by publication date, for its feeds and sitemaps
+            models.Index(
+                fields=['blog', 'published_at', 'id'],
+                name='article_blog_published_idx',
+                condition=models.Q(status='published'),
+            ),
+        ]
     
     def __str__(self):
         return f"{self.title} ({self.user.username})"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The row as loaded, so post_save receivers can tell what moved (e.g. out of a blog's feed)
+        loaded = dict(zip(field_names, values))
+        instance._loaded_feed_state = (loaded.get('blog_id'), loaded.get('status'))
+        return instance
+    
     def save(self, *args, **kwargs):
         if self.status == 'published' and not self.published_at:
             self.published_at = timezone.now()
-        super().save(*args, **kwargs)
+        if self.status == 'archived':
+            self.archived_at = self.archived_at or timezone.now()
+        else:
+            self.archived_at = None
+        from .sharding import follow_blog, is_enabled, next_article_id
+        sharded = is_enabled()
+        if sharded and self.pk is None:
+            # Each shard has its own autoincrement; take the id from the shared sequence
+            self.pk = next_article_id()
+            kwargs.setdefault('force_insert', True)
+        loaded_blog_id = getattr(self, '_loaded_feed_state', (None, None))[0]
+        # One transaction with the post_save receivers, so the outbox event commits with the row
+        using = kwargs.get('using') or router.db_for_write(Article, instance=self)
+        if sharded:
+            # Routed once: placing a new row costs a BlogShard lookup
+            kwargs['using'] = using
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+        if sharded and loaded_blog_id is not None and loaded_blog_id != self.blog_id:
+            follow_blog(self)
     
     @property
     def is_published(self):
         return self.status == 'published'
     
+    @property
+    def is_scheduled(self):
+        return self.status == 'scheduled'
+    
     @property
     def reading_time(self):
         """Estimate reading time in minutes"""
@@ -85,8 +301,354 @@ class Article(models.Model):
         word_count = len(self.content.split())
         return max(1, round(word_count / words_per_minute))
 
+class ArticleRevision(models.Model):
+    """
+    One saved version of an article's title and content.
+    
+    Content is stored zlib-compressed, either as a full snapshot or as a
+    delta against the previous revision (see blogapp.revisions).
+    """
+    article = ShardableForeignKey(Article, on_delete=models.CASCADE, related_name='revisions')
+    number = models.PositiveIntegerField()
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='article_revisions')
+    title = models.CharField(max_length=200)
+    is_snapshot = models.BooleanField(default=False)
+    data = models.BinaryField()
+    content_length = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-number']
+        unique_together = ['article', 'number']
+    
+    def __str__(self):
+        return f"{self.article.title} r{self.number}"
+
+class ArticleVector(models.Model):
+    """
+    An article's hashed term weights for the related-articles index (see blogapp.related).
+    
+    `stale` is set on every save and cleared when the index has caught up.
+    """
+    article = ShardableOneToOneField(Article, on_delete=models.CASCADE, primary_key=True, related_name='vector')
+    terms = models.BinaryField(default=b'')
+    stale = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['stale'], name='articlevector_stale_idx', condition=models.Q(stale=True)),
+        ]
+
+class RelatedArticle(models.Model):
+    """One precomputed neighbour of an article, `rank` 0 being the most similar"""
+    article = ShardableForeignKey(Article, on_delete=models.CASCADE, related_name='related_links')
+    related = ShardableForeignKey(Article, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['article', 'rank']
+        constraints = [
+            # Also the index behind the per-article lookup
+            models.UniqueConstraint(fields=['article', 'rank'], name='relatedarticle_rank_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.article_id} -> {self.related_id} ({self.score:.2f})"
+
+def related_articles(article, limit=None):
+    """The precomputed neighbours of `article`, most similar first (indexed lookups: the links, then the articles on each database)"""
+    # Lives here rather than in blogapp.related so views never import NumPy/SciPy
+    from .sharding import in_bulk
+    links = RelatedArticle.objects.filter(article_id=article.pk).order_by('rank').values_list('related_id', flat=True)
+    if limit:
+        links = links[:limit]
+    ids = list(links)
+    found = in_bulk(ids, Article.objects.defer('content'))
+    return [found[pk] for pk in ids if pk in found]
+
+class ArticleFingerprint(models.Model):
+    """
+    MinHash signature of an article's text, for near-duplicate checks (see blogapp.fingerprints).
+    
+    `digest` identifies the text it was computed from, so saves that do not
+    change the text skip the work.
+    """
+    article = ShardableOneToOneField(Article, on_delete=models.CASCADE, primary_key=True, related_name='fingerprint')
+    digest = models.CharField(max_length=40)
+    signature = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+class ArticleLSHBucket(models.Model):
+    """One band of an article's signature; articles sharing a key are near-duplicate candidates"""
+    article = ShardableForeignKey(Article, on_delete=models.CASCADE, related_name='lsh_buckets')
+    key = models.BigIntegerField()
+    
+    class Meta:
+        indexes = [
+            # Covering: a candidate lookup never touches the table
+            models.Index(fields=['key', 'article'], name='articlelsh_key_idx'),
+        ]
+
+class ArticleHtml(models.Model):
+    """
+    An article's content rendered to sanitized HTML (see blogapp.rendering).
+    
+    `content_hash` identifies the text and renderer it was made from; a row
+    whose hash no longer matches is stale and is rendered again.
+    """
+    article = ShardableOneToOneField(Article, on_delete=models.CASCADE, primary_key=True, related_name='rendered')
+    content_hash = models.CharField(max_length=40)
+    html = CompressedTextField()
+    rendered_at = models.DateTimeField(auto_now=True)
+
+class FeedDocument(models.Model):
+    """
+    A blog's feed or sitemap, rendered and gzipped ahead of the crawlers (see blogapp.feeds).
+    
+    `stale` is set when an article that is, or was, in the blog's feeds
+    changes; the document is rendered again on its next request.
+    """
+    KIND_CHOICES = [
+        ('rss', 'RSS'),
+        ('atom', 'Atom'),
+        ('sitemap_index', 'Sitemap index'),
+        ('sitemap', 'Sitemap'),
+    ]
+    
+    blog = models.ForeignKey(Blog, on_delete=models.CASCADE, related_name='feed_documents')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # Sitemap shard number; 0 for every other kind
+    part = models.PositiveIntegerField(default=0)
+    body = models.BinaryField(default=b'')
+    etag = models.CharField(max_length=40, blank=True)
+    stale = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['blog', 'kind', 'part'], name='feeddocument_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.blog_id} {self.kind}/{self.part}"
+
+class ApiToken(models.Model):
+    """
+    A bearer token for the JSON API (see blogapp.api), acting as `user`.
+    
+    Only a SHA-256 hash of the key is stored; the key itself is shown once,
+    when the token is issued.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='api_tokens')
+    name = models.CharField(max_length=100)
+    # First characters of the key, to tell tokens apart in listings
+    prefix = models.CharField(max_length=8, editable=False)
+    key_hash = models.CharField(max_length=64, unique=True, editable=False)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(null=True, blank=True, editable=False)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.name} ({self.prefix}…)"
+
+class OutboxEvent(models.Model):
+    """
+    A change to an Article or Blog, written in the transaction that made it
+    and delivered afterwards to the consumers in blogapp.outbox.
+
+    Events of one aggregate are delivered in id order. The payload is a
+    small summary; consumers that need the full row read it when handling.
+    """
+    AGGREGATE_CHOICES = [
+        ('article', 'Article'),
+        ('blog', 'Blog'),
+    ]
+    EVENT_CHOICES = [
+        ('created', 'Created'),
+        ('updated', 'Updated'),
+        ('deleted', 'Deleted'),
+    ]
+    
+    aggregate_type = models.CharField(max_length=20, choices=AGGREGATE_CHOICES)
+    aggregate_id = models.BigIntegerField()
+    event_type = models.CharField(max_length=20, choices=EVENT_CHOICES)
+    payload = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"#{self.pk} {self.aggregate_type} {self.aggregate_id} {self.event_type}"
+    
+    @classmethod
+    def record(cls, aggregate_type, aggregate_id, event_type, using=None, **payload):
+        """Write an event; `using` is the database of the changed row, so both commit together"""
+        return cls.objects.using(using).create(
+            aggregate_type=aggregate_type, aggregate_id=aggregate_id, event_type=event_type, payload=payload,
+        )
+
+class OutboxConsumer(models.Model):
+    """Delivery position of one outbox consumer: every event up to `position` has been handled"""
+    name = models.CharField(max_length=100, primary_key=True)
+    position = models.BigIntegerField(default=0)
+    delivered = models.BigIntegerField(default=0)
+    # Failed batches are retried from `position` once `retry_at` has passed
+    failures = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    retry_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['name']
+    
+    def __str__(self):
+        return self.name
+
+class ArchivedArticle(models.Model):
+    """
+    An article moved out of the hot Article table after sitting in
+    'archived' past ARTICLE_ARCHIVE_AFTER_DAYS (see blogapp.archive).
+    
+    Keeps the article's id, so old links such as its history still resolve.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_articles')
+    blog = models.ForeignKey(Blog, on_delete=models.CASCADE, related_name='archived_articles')
+    title = models.CharField(max_length=200)
+    content = CompressedTextField()
+    # Copied from the live row as-is, hence no auto_now
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    published_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField()
+    moved_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['-archived_at']
+        indexes = [
+            models.Index(fields=['user', 'archived_at'], name='archived_user_idx'),
+            models.Index(fields=['archived_at'], name='archived_at_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.title} ({self.user.username}, archived)"
+
+class ArchivedArticleRevision(models.Model):
+    """ArticleRevision rows of an ArchivedArticle, stored the same way"""
+    article = models.ForeignKey(ArchivedArticle, on_delete=models.CASCADE, related_name='revisions')
+    number = models.PositiveIntegerField()
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='archived_article_revisions')
+    title = models.CharField(max_length=200)
+    is_snapshot = models.BooleanField(default=False)
+    data = models.BinaryField()
+    content_length = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField()
+    
+    class Meta:
+        ordering = ['-number']
+        unique_together = ['article', 'number']
+    
+    def __str__(self):
+        return f"{self.article.title} r{self.number}"
+
+class RequestProfile(models.Model):
+    """
+    One profiled request (see blogapp.profiling): where its time went and
+    the SQL it ran, kept for browsing from the admin panel.
+    """
+    MODE_CHOICES = [
+        ('cprofile', 'cProfile'),
+        ('sample', 'Stack sampling'),
+    ]
+    TRIGGER_CHOICES = [
+        ('flag', 'Requested'),
+        ('sampled', 'Random sample'),
+    ]
+    
+    created_at = models.DateTimeField(default=timezone.now)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    view_name = models.CharField(max_length=200, blank=True)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    mode = models.CharField(max_length=10, choices=MODE_CHOICES)
+    trigger = models.CharField(max_length=10, choices=TRIGGER_CHOICES)
+    duration_ms = models.FloatField()
+    sql_count = models.PositiveIntegerField(default=0)
+    sql_ms = models.FloatField(default=0)
+    # [{"db", "sql", "ms"}] in execution order, capped at PROFILING_MAX_QUERIES
+    queries = models.JSONField(default=list, blank=True)
+    # Collapsed stacks ("outer;inner;leaf count" per line), the input format of flamegraph tools
+    stacks = models.TextField(blank=True)
+    # pstats data of a cProfile run (what `Stats.dump_stats` writes)
+    pstats = models.BinaryField(null=True, blank=True)
+    summary = models.TextField(blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at'], name='requestprofile_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+class DeletionJob(models.Model):
+    """
+    A blog or user being deleted in batches.
+    
+    Progress is counted in articles, live and archived, which make up nearly all of the rows.
+    """
+    TARGET_CHOICES = [
+        ('blog', 'Blog'),
+        ('user', 'User'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    target_type = models.CharField(max_length=10, choices=TARGET_CHOICES)
+    target_id = models.BigIntegerField()
+    target_label = models.CharField(max_length=150)
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='deletion_jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    total = models.PositiveIntegerField(default=0)
+    deleted = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='deletionjob_status_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Delete {self.target_type} {self.target_label} ({self.status})"
+    
+    @property
+    def progress(self):
+        """Percentage of articles deleted so far"""
+        if self.status == 'done':
+            return 100
+        if not self.total:
+            return 0
+        return min(100, int(self.deleted * 100 / self.total))
+
 # Signal to create UserProfile when User is created
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
 @receiver(post_save, sender=User)
@@ -98,3 +660,83 @@ def create_user_profile(sender, instance, created, **kwargs):
 def save_user_profile(sender, instance, **kwargs):
     if hasattr(instance, 'profile'):
         instance.profile.save()
+
+@receiver(post_save, sender=Blog)
+def sync_blog_categories(sender, instance, raw=False, **kwargs):
+    if not raw:
+        instance.sync_categories()
+
+# Outbox events. Data derived from articles (fingerprints, related lists,
+# rendered HTML) belongs in a blogapp.outbox consumer, not in a receiver here.
+# The other receivers below must take effect with the write itself: shard
+# placement before the blog's first article is saved, shard cleanup before a
+# move's next batch or an archive restore brings the same id back (a delayed
+# cleanup would delete the restored rows), and feed invalidation before the
+# next feed request.
+# Article's post_delete receivers have a bulk form in blogapp.deletion
+# (BULK_DELETE_RECEIVERS) that fast_delete runs instead; keep the two in step.
+# Must run before invalidate_article_feeds, which resets _loaded_feed_state.
+@receiver(post_save, sender=Article)
+def record_article_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    payload = {'blog_id': instance.blog_id, 'user_id': instance.user_id, 'status': instance.status}
+    blog_id, status = getattr(instance, '_loaded_feed_state', (None, None))
+    if not created and (blog_id, status) != (instance.blog_id, instance.status):
+        payload['previous'] = {'blog_id': blog_id, 'status': status}
+    OutboxEvent.record(
+        'article', instance.pk, 'created' if created else 'updated', using=instance._state.db, **payload,
+    )
+
+@receiver(post_delete, sender=Article)
+def record_article_deleted(sender, instance, **kwargs):
+    OutboxEvent.record(
+        'article', instance.pk, 'deleted', using=instance._state.db, blog_id=instance.blog_id, user_id=instance.user_id,
+    )
+
+@receiver(post_save, sender=Blog)
+def record_blog_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        OutboxEvent.record('blog', instance.pk, 'created' if created else 'updated', user_id=instance.user_id)
+
+@receiver(post_delete, sender=Blog)
+def record_blog_deleted(sender, instance, **kwargs):
+    OutboxEvent.record('blog', instance.pk, 'deleted', user_id=instance.user_id)
+
+@receiver(post_save, sender=Blog)
+def assign_blog_shard(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        from .sharding import assign_shard
+        assign_shard(instance)
+
+@receiver(post_delete, sender=Article)
+def delete_sharded_article_rows(sender, instance, **kwargs):
+    # The cascade ran on the article's own database; its side rows are on default
+    from .sharding import article_deleted
+    article_deleted(instance)
+
+@receiver(post_save, sender=Article)
+@receiver(post_delete, sender=Article)
+def invalidate_article_feeds(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    blog_id, status = getattr(instance, '_loaded_feed_state', (None, None))
+    blog_ids = {blog_id} if status == 'published' else set()
+    if instance.status == 'published':
+        blog_ids.add(instance.blog_id)
+    blog_ids.discard(None)
+    if blog_ids:
+        FeedDocument.objects.filter(blog_id__in=blog_ids, stale=False).update(stale=True)
+    instance._loaded_feed_state = (instance.blog_id, instance.status)
+
+@receiver(post_save, sender=Blog)
+def invalidate_blog_feeds(sender, instance, raw=False, **kwargs):
+    # Feeds carry the blog's name and URL
+    if not raw:
+        FeedDocument.objects.filter(blog=instance, stale=False).update(stale=True)
+
+@receiver(post_save, sender=PromptTemplate)
+def clear_prompt_cache(sender, **kwargs):
+    # Only this process; others pick up a new default within PROMPT_CACHE_SECONDS
+    from .prompts import clear_cache
+    clear_cache()
@@ -0,0 +1,296 @@
+"""
+Transactional outbox for Article and Blog changes.
+
+Saves and deletes write an OutboxEvent in their own transaction (see the
+receivers in blogapp.models), so a save costs one extra INSERT however many
+consumers there are. `manage.py dispatch_outbox` then delivers the events
+to every registered consumer:
+
+    from blogapp.outbox import consumer
+
+    @consumer('search_index', aggregates=['article'])
+    def update_search_index(events):
+        ...
+
+A consumer gets the events in id order, in batches, and keeps its own
+position. Delivery is at-least-once: a batch that raises is retried from
+the same position after a backoff, so handlers must be idempotent, and a
+consumer never skips past an event it failed on, so the events of one
+aggregate are always handled in order. Modules listed in OUTBOX_CONSUMERS
+are imported to register consumers outside this app.
+
+Events are written to the database of the row that changed, so each
+article shard (blogapp.sharding) has its own outbox; a consumer keeps one
+position per database, and a batch never mixes databases. When rows move
+to another database their pending events move with them (move_events).
+"""
+import importlib
+import logging
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import metrics, sharding
+from .models import Article, ArticleVector, OutboxConsumer, OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+# Longest wait before a failed batch is retried
+MAX_BACKOFF_SECONDS = 300
+
+
+@dataclass(frozen=True)
+class Consumer:
+    name: str
+    handler: object
+    aggregates: frozenset | None
+
+    def wants(self, event):
+        return self.aggregates is None or event.aggregate_type in self.aggregates
+
+
+_consumers = {}
+_loaded = False
+
+
+def consumer(name, aggregates=None):
+    """Register `handler(events)` under `name`; `aggregates` limits the aggregate types it receives"""
+    def decorator(handler):
+        _consumers[name] = Consumer(name, handler, frozenset(aggregates) if aggregates else None)
+        return handler
+    return decorator
+
+
+def consumers():
+    """Every registered consumer, importing OUTBOX_CONSUMERS modules first"""
+    global _loaded
+    if not _loaded:
+        for module in getattr(settings, 'OUTBOX_CONSUMERS', []):
+            importlib.import_module(module)
+        _loaded = True
+    return dict(_consumers)
+
+
+def _settings():
+    return (
+        getattr(settings, 'OUTBOX_BATCH_SIZE', 500),
+        getattr(settings, 'OUTBOX_GAP_TIMEOUT_SECONDS', 60),
+        getattr(settings, 'OUTBOX_RETENTION_HOURS', 72),
+    )
+
+
+def position_key(name, alias):
+    """OutboxConsumer row of a consumer's position in the outbox on `alias`"""
+    return name if alias == sharding.PRIMARY else f"{name}@{alias}"
+
+
+def visible_prefix(events, position, now, gap_timeout):
+    """
+    The leading events that are safe to deliver after `position`.
+
+    Ids are taken when an event is inserted but become visible when its
+    transaction commits, so a missing id may belong to a transaction that
+    is still open. Delivery stops at such a gap until the event after it is
+    older than `gap_timeout` seconds; by then the missing one was rolled
+    back (its id was taken earlier still). SQLite never leaves gaps.
+    """
+    expected = position + 1
+    for i, event in enumerate(events):
+        if event.pk != expected and now - event.created_at < timedelta(seconds=gap_timeout):
+            return events[:i]
+        expected = event.pk + 1
+    return events
+
+
+def deliver(name, batch_size=None, now=None, alias=sharding.PRIMARY):
+    """
+    Deliver one batch of pending events in the outbox on `alias` to consumer `name`.
+
+    Returns the number of events the position advanced by (0 when the
+    consumer is caught up, backing off, or failed on this batch).
+    """
+    default_batch, gap_timeout, _ = _settings()
+    batch_size = batch_size or default_batch
+    now = now or timezone.now()
+    target = consumers()[name]
+    key = position_key(name, alias)
+    state, _ = OutboxConsumer.objects.get_or_create(name=key)
+    if state.retry_at and state.retry_at > now:
+        return 0
+    events = visible_prefix(
+        list(sharding.on(OutboxEvent.objects.filter(id__gt=state.position), alias).order_by('id')[:batch_size]),
+        state.position, now, gap_timeout,
+    )
+    if not events:
+        return 0
+    wanted = [event for event in events if target.wants(event)]
+    try:
+        if wanted:
+            target.handler(wanted)
+    except Exception as e:
+        state.failures += 1
+        backoff = min(2 ** state.failures, MAX_BACKOFF_SECONDS)
+        OutboxConsumer.objects.filter(pk=key).update(
+            failures=state.failures,
+            last_error=f"{type(e).__name__}: {e}"[:2000],
+            retry_at=now + timedelta(seconds=backoff),
+            updated_at=now,
+        )
+        metrics.inc('outbox_failures_total', consumer=name)
+        logger.exception(f"Outbox consumer {key} failed at event {events[0].pk}; retrying in {backoff}s")
+        return 0
+    # Conditional on the old position: if another dispatcher got there first, keep its progress
+    OutboxConsumer.objects.filter(pk=key, position=state.position).update(
+        position=events[-1].pk,
+        delivered=state.delivered + len(wanted),
+        failures=0,
+        last_error='',
+        retry_at=None,
+        updated_at=now,
+    )
+    metrics.inc('outbox_delivered_total', len(wanted), consumer=name)
+    return len(events)
+
+
+def move_events(aggregate_type, ids, source, target):
+    """
+    Move the pending events of aggregates `ids` from the outbox on `source`
+    to the one on `target`, keeping their order; returns the number moved.
+
+    blogapp.sharding calls this in the transaction on `target` that copies
+    the rows, so an aggregate's later events, written on `target`, are never
+    delivered ahead of earlier ones still waiting on `source`. The originals
+    are deleted once that transaction commits. Events every consumer has
+    passed stay behind for prune(); a consumer that had handled some of the
+    moved ones gets them again.
+    """
+    keys = [position_key(name, source) for name in consumers()]
+    positions = list(OutboxConsumer.objects.filter(name__in=keys).values_list('position', flat=True))
+    handled = min(positions, default=0) if len(positions) == len(keys) else 0
+    events = list(
+        OutboxEvent.objects.using(source)
+        .filter(aggregate_type=aggregate_type, aggregate_id__in=ids, id__gt=handled)
+        .order_by('id')
+    )
+    if not events:
+        return 0
+    OutboxEvent.objects.using(target).bulk_create([
+        OutboxEvent(
+            aggregate_type=event.aggregate_type, aggregate_id=event.aggregate_id,
+            event_type=event.event_type, payload=event.payload, created_at=event.created_at,
+        )
+        for event in events
+    ])
+    moved = [event.pk for event in events]
+    transaction.on_commit(lambda: OutboxEvent.objects.using(source).filter(id__in=moved).delete(), using=target)
+    return len(events)
+
+
+def dispatch(batch_size=None, max_batches=None):
+    """
+    Deliver pending events to every consumer until each is caught up (or
+    has taken `max_batches` batches). Returns {consumer: events passed}.
+    """
+    progress = {}
+    for name in consumers():
+        total = 0
+        for alias in sharding.all_aliases():
+            batches = 0
+            while max_batches is None or batches < max_batches:
+                advanced = deliver(name, batch_size, alias=alias)
+                if not advanced:
+                    break
+                total += advanced
+                batches += 1
+        progress[name] = total
+    return progress
+
+
+def lag():
+    """
+    {consumer: (events behind, seconds behind)} from the newest event id
+    and each consumer's position, summed (events) or the worst (seconds)
+    over the article databases; a few primary-key lookups in all.
+    """
+    positions = dict(OutboxConsumer.objects.values_list('name', 'position'))
+    now = timezone.now()
+    result = {name: (0, 0.0) for name in consumers()}
+    for alias in sharding.all_aliases():
+        events = sharding.on(OutboxEvent.objects.all(), alias)
+        newest = events.aggregate(newest=Max('id'))['newest'] or 0
+        for name, (behind, seconds) in result.items():
+            position = positions.get(position_key(name, alias), 0)
+            oldest = events.filter(id__gt=position).order_by('id').values_list('created_at', flat=True).first()
+            result[name] = (
+                behind + max(newest - position, 0),
+                max(seconds, (now - oldest).total_seconds() if oldest else 0.0),
+            )
+    return result
+
+
+def update_lag_metrics():
+    for name, (events, seconds) in lag().items():
+        metrics.set_gauge('outbox_lag_events', events, consumer=name)
+        metrics.set_gauge('outbox_lag_seconds', round(seconds, 3), consumer=name)
+
+
+def prune(now=None, batch_size=5000):
+    """
+    Delete events every consumer has handled and that are older than
+    OUTBOX_RETENTION_HOURS; returns the number deleted.
+    """
+    _, _, retention_hours = _settings()
+    now = now or timezone.now()
+    deleted = 0
+    for alias in sharding.all_aliases():
+        events = OutboxEvent.objects.using(alias)
+        keys = [position_key(name, alias) for name in consumers()]
+        positions = list(OutboxConsumer.objects.filter(name__in=keys).values_list('position', flat=True))
+        if len(positions) < len(keys):
+            # A consumer that has never run still needs every event
+            continue
+        safe = min(positions, default=None)
+        if safe is None:
+            safe = events.aggregate(newest=Max('id'))['newest'] or 0
+        prunable = events.filter(id__lte=safe, created_at__lt=now - timedelta(hours=retention_hours))
+        while True:
+            ids = list(prunable.order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            deleted += events.filter(id__in=ids).delete()[0]
+    return deleted
+
+
+@consumer('fingerprints', aggregates=['article'])
+def refresh_fingerprints(events):
+    """Near-duplicate fingerprints, once per article per batch, off the save path"""
+    from .fingerprints import fingerprint_article
+    ids = {event.aggregate_id for event in events if event.event_type != 'deleted'}
+    # Looked up on every database: the article may have moved since the event was recorded
+    for article in sharding.in_bulk(ids, Article.objects.only('id', 'title', 'content', 'updated_at')).values():
+        fingerprint_article(article)
+
+
+@consumer('related_articles', aggregates=['article'])
+def queue_related_updates(events):
+    """Flag changed articles' term vectors; `manage.py update_related_articles` recomputes them"""
+    ids = {event.aggregate_id for event in events if event.event_type != 'deleted'}
+    ArticleVector.objects.bulk_create(
+        [ArticleVector(article_id=pk, stale=True) for pk in sorted(ids)],
+        update_conflicts=True,
+        unique_fields=['article'],
+        update_fields=['stale', 'updated_at'],
+        batch_size=500,
+    )
+
+
+@consumer('rendered_html', aggregates=['article'])
+def refresh_rendered_html(events):
+    """Render changed articles' HTML ahead of their first view; unchanged text is skipped by its hash"""
+    from .rendering import store
+    ids = {event.aggregate_id for event in events if event.event_type != 'deleted'}
+    store(sharding.in_bulk(ids, Article.objects.only('id', 'content', 'updated_at')).values())
@@ -0,0 +1,226 @@
+"""
+On-demand request profiling.
+
+An admin profiles one request by adding `?_profile=sample` (or
+`?_profile=cprofile`) to its URL, or an `X-Profile: sample|cprofile` header;
+the response carries X-Profile-Id. PROFILING_SAMPLE_PERCENT additionally
+profiles that share of all requests at random, at most
+PROFILING_MAX_PER_MINUTE per process.
+
+Two profilers:
+
+    sample     a thread reads the request thread's stack every
+               PROFILING_SAMPLE_INTERVAL_MS; cheap enough for random
+               sampling, and gives collapsed stacks for flamegraphs
+    cprofile   deterministic, every call counted; slows the request
+               down, so best for a single requested profile
+
+Either way the SQL run on every database is traced with its timings.
+Profiles are stored as RequestProfile rows (the newest PROFILING_KEEP) and
+browsed at admin-panel/profiles/. With no flag and no sampling, the cost
+per request is a couple of dictionary lookups.
+"""
+import cProfile
+import io
+import marshal
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .models import RequestProfile, UserProfile
+
+MODES = ('sample', 'cprofile')
+QUERY_FLAG = '_profile'
+HEADER = 'HTTP_X_PROFILE'
+
+_rate_lock = threading.Lock()
+# Start times of the randomly sampled profiles in the last minute
+_recent = deque()
+# Profiles running in this process
+_running = threading.BoundedSemaphore(2)
+
+
+def _settings():
+    return (
+        getattr(settings, 'PROFILING_SAMPLE_PERCENT', 0.0),
+        getattr(settings, 'PROFILING_MAX_PER_MINUTE', 6),
+        getattr(settings, 'PROFILING_SAMPLE_INTERVAL_MS', 5),
+        getattr(settings, 'PROFILING_MAX_QUERIES', 1000),
+        getattr(settings, 'PROFILING_KEEP', 500),
+    )
+
+
+def is_admin(user):
+    """The admin_required check, without the redirects"""
+    if not user.is_authenticated:
+        return False
+    try:
+        return user.profile.is_admin
+    except UserProfile.DoesNotExist:
+        return False
+
+
+def requested_mode(request):
+    """The profiler an admin asked for on this request, or None"""
+    mode = request.META.get(HEADER)
+    if mode is None and QUERY_FLAG in request.META.get('QUERY_STRING', ''):
+        mode = request.GET.get(QUERY_FLAG)
+    if mode is None:
+        return None
+    mode = mode.strip().lower()
+    if mode in ('1', 'true', 'yes', ''):
+        mode = 'sample'
+    if mode not in MODES or not is_admin(request.user):
+        return None
+    return mode
+
+
+def take_sample(now=None):
+    """Whether to profile this request at random, within the per-minute budget"""
+    percent, per_minute, _, _, _ = _settings()
+    if percent <= 0 or random.random() * 100 >= percent:
+        return False
+    now = time.monotonic() if now is None else now
+    with _rate_lock:
+        while _recent and now - _recent[0] >= 60:
+            _recent.popleft()
+        if len(_recent) >= per_minute:
+            return False
+        _recent.append(now)
+        return True
+
+
+def _frame_name(frame):
+    return f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_qualname}"
+
+
+class StackSampler:
+    """Counts the stacks of one thread, sampled every `interval` seconds from a background thread"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            if names:
+                self.counts[';'.join(reversed(names))] += 1
+
+    def collapsed(self):
+        return '\n'.join(f"{stack} {count}" for stack, count in self.counts.most_common())
+
+
+def hot_functions(collapsed, limit=30):
+    """[(function, self samples, total samples)] from collapsed stacks, most self time first"""
+    own, total = Counter(), Counter()
+    for line in collapsed.splitlines():
+        stack, _, count = line.rpartition(' ')
+        frames = stack.split(';')
+        own[frames[-1]] += int(count)
+        for name in set(frames):
+            total[name] += int(count)
+    return [(name, count, total[name]) for name, count in own.most_common(limit)]
+
+
+class SqlTrace:
+    """An execute_wrapper that records each query's database, SQL and time"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.queries = []
+        self.count = 0
+        self.total_ms = 0.0
+
+    def wrapper(self, alias):
+        def record(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                ms = (time.perf_counter() - started) * 1000
+                self.count += 1
+                self.total_ms += ms
+                if len(self.queries) < self.limit:
+                    self.queries.append({'db': alias, 'sql': sql, 'ms': round(ms, 3)})
+        return record
+
+
+def profile(request, get_response, mode, trigger):
+    """Run `get_response(request)` under the profiler and store the result; returns the response"""
+    if not _running.acquire(blocking=False):
+        # Enough profiles running already; this one just runs
+        return get_response(request)
+    try:
+        _, _, interval_ms, max_queries, keep = _settings()
+        trace = SqlTrace(max_queries)
+        profiler = sampler = None
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(trace.wrapper(connection.alias)))
+            if mode == 'cprofile':
+                profiler = cProfile.Profile()
+                profiler.enable()
+            else:
+                sampler = StackSampler(threading.get_ident(), interval_ms / 1000)
+                sampler.start()
+            try:
+                response = get_response(request)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+                else:
+                    sampler.stop()
+        duration_ms = (time.perf_counter() - started) * 1000
+        record = RequestProfile(
+            user=request.user if request.user.is_authenticated else None,
+            method=request.method,
+            path=request.get_full_path()[:500],
+            view_name=(request.resolver_match.view_name if request.resolver_match else '')[:200],
+            status_code=response.status_code,
+            mode=mode,
+            trigger=trigger,
+            duration_ms=round(duration_ms, 3),
+            sql_count=trace.count,
+            sql_ms=round(trace.total_ms, 3),
+            queries=trace.queries,
+        )
+        if profiler is not None:
+            out = io.StringIO()
+            stats = pstats.Stats(profiler, stream=out)
+            stats.sort_stats('cumulative').print_stats(40)
+            record.summary = out.getvalue()
+            record.pstats = marshal.dumps(stats.stats)
+        else:
+            record.stacks = sampler.collapsed()
+            record.summary = f"{sum(sampler.counts.values())} samples every {interval_ms} ms"
+        record.save()
+        expired = list(RequestProfile.objects.order_by('-created_at').values_list('pk', flat=True)[keep:keep + 100])
+        if expired:
+            RequestProfile.objects.filter(pk__in=expired).delete()
+        response['X-Profile-Id'] = str(record.pk)
+        return response
+    finally:
+        _running.release()
@@ -0,0 +1,174 @@
+import hashlib
+import math
+import re
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from string import Formatter
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+
+from .models import PromptTemplate
+
+# Built-in prompts: prompt_templates/<name>/v<version>.txt
+TEMPLATE_DIR = Path(__file__).resolve().parent / 'prompt_templates'
+
+# Placeholders each known prompt may use
+PROMPT_FIELDS = {
+    'article': {'keyword', 'categories_context'},
+}
+
+_VERSION_FILE_RE = re.compile(r'^v(\d+)\.txt$')
+
+
+def estimate_tokens(text):
+    """
+    Conservative token estimate without calling the model.
+
+    About four ASCII characters make a token; other characters (CJK etc.)
+    are counted as a token each.
+    """
+    ascii_chars = len(text.encode('ascii', 'ignore'))
+    return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars)
+
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+    """A parsed template: literal text and placeholder names, ready to render"""
+    name: str
+    version: int
+    source: str
+    parts: tuple
+    static_tokens: int
+    digest: str
+
+    @property
+    def key(self):
+        """Identifies the exact prompt text; stable across processes, safe for cache keys"""
+        return f"{self.name}@v{self.version}:{self.digest[:12]}"
+
+    def render(self, **values):
+        return ''.join(literal + (values[field] if field else '') for literal, field in self.parts)
+
+    def estimate_tokens(self, **values):
+        """Tokens in the rendered prompt, estimated without rendering it"""
+        return self.static_tokens + sum(estimate_tokens(values[field]) for _, field in self.parts if field)
+
+
+def validate_template(name, body):
+    """Parse `body`, raising ValidationError for bad syntax or unknown placeholders"""
+    try:
+        parsed = list(Formatter().parse(body))
+    except ValueError as e:
+        raise ValidationError(f"Invalid template syntax: {e}")
+    allowed = PROMPT_FIELDS.get(name)
+    for _, field, format_spec, conversion in parsed:
+        if field is None:
+            continue
+        if format_spec or conversion or not field.isidentifier():
+            raise ValidationError(f"Placeholder '{{{field}}}' must be a plain name.")
+        if allowed is not None and field not in allowed:
+            raise ValidationError(
+                f"Unknown placeholder '{{{field}}}'; '{name}' prompts can use: {', '.join(sorted(allowed))}."
+            )
+    return parsed
+
+
+def compile_template(name, version, body, source='db'):
+    parts = tuple((literal, field) for literal, field, _, _ in validate_template(name, body))
+    return CompiledPrompt(
+        name=name,
+        version=version,
+        source=source,
+        parts=parts,
+        static_tokens=estimate_tokens(''.join(literal for literal, _ in parts)),
+        digest=hashlib.sha1(body.encode('utf-8')).hexdigest(),
+    )
+
+
+@lru_cache(maxsize=None)
+def _disk_prompt(name):
+    """Newest built-in version of `name`, or None"""
+    directory = TEMPLATE_DIR / name
+    versions = []
+    if directory.is_dir():
+        for path in directory.iterdir():
+            match = _VERSION_FILE_RE.match(path.name)
+            if match:
+                versions.append((int(match.group(1)), path))
+    if not versions:
+        return None
+    version, path = max(versions)
+    return compile_template(name, version, path.read_text(encoding='utf-8'), source='disk')
+
+
+# Database versions never change once saved, so compiled ones are kept for the process lifetime
+_db_prompts = {}
+# name -> (expires_at, CompiledPrompt): which version is the default can change at any time
+_defaults = {}
+_lock = threading.Lock()
+
+
+def _db_prompt(template_id):
+    compiled = _db_prompts.get(template_id)
+    if compiled is None:
+        template = PromptTemplate.objects.filter(pk=template_id).only('name', 'version', 'body').first()
+        if template is None:
+            return None
+        compiled = compile_template(template.name, template.version, template.body)
+        with _lock:
+            _db_prompts[template_id] = compiled
+    return compiled
+
+
+def default_prompt(name):
+    """
+    The newest active database version of `name`, else the newest built-in one.
+
+    The choice is cached for PROMPT_CACHE_SECONDS, so activating a version
+    reaches every process within that time.
+    """
+    cached = _defaults.get(name)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    template_id = (
+        PromptTemplate.objects
+        .filter(name=name, is_active=True)
+        .order_by('-version')
+        .values_list('pk', flat=True)
+        .first()
+    )
+    compiled = _db_prompt(template_id) if template_id else None
+    compiled = compiled or _disk_prompt(name)
+    if compiled is None:
+        raise LookupError(f"No prompt template named '{name}'")
+    with _lock:
+        _defaults[name] = (time.monotonic() + getattr(settings, 'PROMPT_CACHE_SECONDS', 60), compiled)
+    return compiled
+
+
+def get_prompt(name, blog=None):
+    """The prompt to use for `blog`: its own template if it picked one of this name, else the default"""
+    template_id = getattr(blog, 'prompt_template_id', None)
+    if template_id:
+        compiled = _db_prompt(template_id)
+        if compiled is not None and compiled.name == name:
+            return compiled
+    return default_prompt(name)
+
+
+@lru_cache(maxsize=1024)
+def categories_context(categories):
+    """The article prompt's sentence about a blog's categories (pass a tuple)"""
+    if not categories:
+        return ''
+    return f" The blog focuses on categories like: {', '.join(categories)}."
+
+
+def clear_cache():
+    with _lock:
+        _db_prompts.clear()
+        _defaults.clear()
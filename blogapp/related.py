@@ -0,0 +1,305 @@
+import logging
+import math
+import re
+import time
+import zlib
+from collections import Counter
+
+import numpy as np
+from scipy import sparse
+
+from django.conf import settings
+from django.db import transaction
+
+from . import sharding
+from .fields import decompress_text
+from .models import Article, ArticleVector, RelatedArticle
+
+logger = logging.getLogger(__name__)
+
+# Terms are hashed into this many buckets, so there is no vocabulary to store or keep in sync
+N_FEATURES = 1 << 20
+
+_WORD_RE = re.compile(r'\w+')
+
+STOP_WORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below
+between both but by can did do does doing down during each few for from further had has have having
+he her here hers herself him himself his how i if in into is it its itself just me more most my
+myself no nor not now of off on once only or other our ours ourselves out over own same she should
+so some such than that the their theirs them themselves then there these they this those through to
+too under until up very was we were what when where which while who whom why will with you your
+yours yourself yourselves
+""".split())
+
+
+def _settings():
+    return (
+        getattr(settings, 'RELATED_ARTICLES_TOP_K', 5),
+        getattr(settings, 'RELATED_ARTICLES_MIN_SCORE', 0.1),
+    )
+
+
+def tokenize(text):
+    """
+    Lower-cased words without stop words.
+
+    Runs of non-ASCII characters (CJK text has no spaces) are split into
+    overlapping character bigrams instead.
+    """
+    tokens = []
+    for word in _WORD_RE.findall(text.lower()):
+        if word.isascii():
+            if len(word) > 1 and word not in STOP_WORDS and not word.isdigit():
+                tokens.append(word)
+        elif len(word) == 1:
+            tokens.append(word)
+        else:
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+def term_vector(title, content, max_terms=None):
+    """
+    Hashed, sublinear term frequencies of an article; title words count double.
+
+    Only the `max_terms` most frequent terms are kept. Returns parallel
+    arrays of feature ids (sorted) and weights.
+    """
+    max_terms = max_terms or getattr(settings, 'RELATED_ARTICLES_MAX_TERMS', 128)
+    counts = Counter(tokenize(content))
+    for token in tokenize(title):
+        counts[token] += 2
+    buckets = Counter()
+    for token, count in counts.most_common(max_terms):
+        buckets[zlib.crc32(token.encode('utf-8')) & (N_FEATURES - 1)] += count
+    ids = np.fromiter(sorted(buckets), dtype=np.int32, count=len(buckets))
+    weights = np.array([1.0 + math.log(buckets[i]) for i in ids.tolist()], dtype=np.float32)
+    return ids, weights
+
+
+def pack_terms(ids, weights):
+    return ids.astype('<i4').tobytes() + weights.astype('<f4').tobytes()
+
+
+def unpack_terms(data):
+    data = bytes(data)
+    n = len(data) // 8
+    return np.frombuffer(data, dtype='<i4', count=n), np.frombuffer(data, dtype='<f4', count=n, offset=n * 4)
+
+
+def refresh_vectors(articles):
+    """Recompute and store term vectors for an Article queryset; clears their stale flag and returns the ids"""
+    rows = articles.order_by().values_list('id', 'title', 'content')
+    vectors = [
+        ArticleVector(article_id=pk, terms=pack_terms(*term_vector(title, decompress_text(content))), stale=False)
+        for pk, title, content in rows.iterator(chunk_size=500)
+    ]
+    ArticleVector.objects.bulk_create(
+        vectors,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['article'],
+        update_fields=['terms', 'stale', 'updated_at'],
+    )
+    return [vector.article_id for vector in vectors]
+
+
+def user_matrix(user_id, max_terms=None):
+    """
+    TF-IDF matrix over all of a user's articles, one L2-normalised row each.
+
+    IDF is computed from the stored term vectors on the fly, so it is never
+    out of date. Each row keeps its `max_terms` heaviest terms, which keeps
+    the similarity product sparse. Returns (article_ids, csr_matrix).
+    """
+    max_terms = max_terms or getattr(settings, 'RELATED_ARTICLES_ROW_TERMS', 48)
+    article_ids, indices, data, indptr = [], [], [], [0]
+    seen = set()
+    for lookup in sharding.article_ids(sharding.user_querysets(user_id)):
+        rows = (
+            ArticleVector.objects
+            .filter(article_id__in=lookup)
+            .order_by('article_id')
+            .values_list('article_id', 'terms')
+        )
+        for article_id, terms in rows.iterator(chunk_size=2000):
+            if article_id in seen:
+                continue
+            seen.add(article_id)
+            ids, weights = unpack_terms(terms)
+            article_ids.append(article_id)
+            indices.append(ids)
+            data.append(weights)
+            indptr.append(indptr[-1] + len(ids))
+    n = len(article_ids)
+    if not n:
+        return np.array([], dtype=np.int64), sparse.csr_matrix((0, N_FEATURES), dtype=np.float32)
+    indices = np.concatenate(indices)
+    data = np.concatenate(data)
+    matrix = sparse.csr_matrix((data, indices, np.array(indptr)), shape=(n, N_FEATURES), dtype=np.float32)
+
+    df = np.bincount(indices, minlength=N_FEATURES)
+    idf = (np.log((1.0 + n) / (1.0 + df)) + 1.0).astype(np.float32)
+    matrix = matrix.multiply(idf).tocsr()
+
+    # Keep the heaviest terms of each row
+    for i in range(n):
+        start, end = matrix.indptr[i], matrix.indptr[i + 1]
+        if end - start > max_terms:
+            row = matrix.data[start:end]
+            row[np.argpartition(row, -max_terms)[:-max_terms]] = 0
+    matrix.eliminate_zeros()
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    matrix = sparse.diags(1.0 / norms).dot(matrix).astype(np.float32).tocsr()
+    return np.array(article_ids, dtype=np.int64), matrix
+
+
+def _top_k(scores, row, self_col, k, min_score):
+    start, end = scores.indptr[row], scores.indptr[row + 1]
+    cols = scores.indices[start:end]
+    values = scores.data[start:end]
+    keep = (cols != self_col) & (values >= min_score)
+    cols, values = cols[keep], values[keep]
+    if len(values) > k:
+        best = np.argpartition(-values, k)[:k]
+        cols, values = cols[best], values[best]
+    order = np.argsort(-values, kind='stable')
+    return list(zip(cols[order].tolist(), values[order].tolist()))
+
+
+def _write_lists(lists):
+    """Replace the neighbour lists of the given articles: {article_id: [(related_id, score), ...]}"""
+    if not lists:
+        return
+    with transaction.atomic():
+        RelatedArticle.objects.filter(article_id__in=list(lists)).delete()
+        RelatedArticle.objects.bulk_create(
+            [
+                RelatedArticle(article_id=article_id, related_id=related_id, rank=rank, score=score)
+                for article_id, neighbours in lists.items()
+                for rank, (related_id, score) in enumerate(neighbours)
+            ],
+            batch_size=1000,
+        )
+
+
+def rebuild_user(user_id, chunk_size=256):
+    """
+    Recompute every term vector and neighbour list of one user's articles.
+
+    Similarities are computed `chunk_size` rows at a time to bound memory.
+    Returns the number of articles.
+    """
+    k, min_score = _settings()
+    for articles in sharding.user_querysets(user_id):
+        refresh_vectors(articles)
+    article_ids, matrix = user_matrix(user_id)
+    transposed = matrix.T.tocsr()
+    for start in range(0, len(article_ids), chunk_size):
+        scores = (matrix[start:start + chunk_size] @ transposed).tocsr()
+        lists = {}
+        for offset in range(scores.shape[0]):
+            row = start + offset
+            lists[int(article_ids[row])] = [
+                (int(article_ids[col]), score) for col, score in _top_k(scores, offset, row, k, min_score)
+            ]
+        _write_lists(lists)
+    return len(article_ids)
+
+
+def update_user(user_id):
+    """
+    Bring one user's lists up to date after some of their articles changed.
+
+    Only the changed articles' lists are recomputed in full. Every other
+    list is patched with the changed articles' new scores, and written
+    back only if that changes it. Returns the number of changed articles.
+    """
+    k, min_score = _settings()
+    querysets = sharding.user_querysets(user_id)
+    stale = []
+    for lookup in sharding.article_ids(querysets):
+        stale.extend(ArticleVector.objects.filter(stale=True, article_id__in=lookup).values_list('article_id', flat=True))
+    changed = []
+    for chunk in sharding.chunks(sorted(set(stale))):
+        for articles in querysets:
+            changed.extend(refresh_vectors(articles.filter(id__in=chunk)))
+    if not changed:
+        return 0
+    article_ids, matrix = user_matrix(user_id)
+    position = {int(pk): i for i, pk in enumerate(article_ids.tolist())}
+    changed = [pk for pk in changed if pk in position]
+    if not changed:
+        return 0
+    rows = [position[pk] for pk in changed]
+    scores = (matrix[rows] @ matrix.T).tocsr()
+
+    lists = {}
+    for offset, row in enumerate(rows):
+        lists[int(article_ids[row])] = [
+            (int(article_ids[col]), score) for col, score in _top_k(scores, offset, row, k, min_score)
+        ]
+
+    # Scores are symmetric: column j of `scores` says how close each changed article now is to j
+    changed_set = set(changed)
+    current = {}
+    for lookup in sharding.article_ids(querysets):
+        for article_id, related_id, score in (
+            RelatedArticle.objects
+            .filter(article_id__in=lookup)
+            .exclude(article_id__in=changed)
+            .order_by('article_id', 'rank')
+            .values_list('article_id', 'related_id', 'score')
+        ):
+            current.setdefault(article_id, []).append((related_id, score))
+    column_scores = scores.T.tocsr()
+    for pk, row in position.items():
+        if pk in changed_set:
+            continue
+        start, end = column_scores.indptr[row], column_scores.indptr[row + 1]
+        candidates = {
+            changed[c]: s for c, s in zip(column_scores.indices[start:end].tolist(), column_scores.data[start:end].tolist())
+            if s >= min_score
+        }
+        old = current.get(pk, [])
+        if not candidates and not any(related_id in changed_set for related_id, _ in old):
+            continue
+        merged = [(related_id, score) for related_id, score in old if related_id not in changed_set]
+        merged.extend(candidates.items())
+        merged.sort(key=lambda item: -item[1])
+        merged = merged[:k]
+        if merged != old:
+            lists[pk] = merged
+    _write_lists(lists)
+    return len(changed)
+
+
+def users_with_stale_vectors():
+    """Ids of the users owning an article whose vector is stale, on any article database"""
+    stale = ArticleVector.objects.filter(stale=True).values('article_id')
+    users = set(Article.objects.filter(id__in=stale).values_list('user_id', flat=True).distinct())
+    shards = sharding.shard_aliases()
+    if shards:
+        # The subquery would read the shard's own, empty vector table
+        ids = sorted(stale.values_list('article_id', flat=True))
+        for alias in shards:
+            for chunk in sharding.chunks(ids):
+                users.update(
+                    Article.objects.using(alias).filter(id__in=chunk).values_list('user_id', flat=True).distinct()
+                )
+    return sorted(users)
+
+
+def update_all():
+    """Process every user with changed articles; returns the number of articles handled"""
+    total = 0
+    for user_id in list(users_with_stale_vectors()):
+        started = time.monotonic()
+        updated = update_user(user_id)
+        total += updated
+        logger.info(f"Updated related articles for user {user_id}: {updated} changed in {time.monotonic() - started:.2f}s")
+    return total
+
@@ -0,0 +1,159 @@
+"""
+Article content as sanitized HTML, rendered once and stored in ArticleHtml.
+
+Content is plain text with a small Markdown subset: paragraphs and line
+breaks, # headings, - and 1. lists, > quotes, ``` code blocks, `code`,
+**bold**, *italic* and [links](https://...). The text is HTML-escaped
+before any markup is added, so no tag or attribute written in an article
+reaches the page, and links only take http(s) URLs.
+
+A stored row carries the hash of the text and RENDERER_VERSION, so an edit
+(or a renderer change) leaves it stale without any invalidation step. The
+'rendered_html' outbox consumer renders changed articles ahead of their
+first view, html_for() renders on a miss, and `manage.py render_articles`
+backfills in bulk.
+"""
+import hashlib
+import re
+
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from . import routers
+from .models import ArticleHtml
+
+# Bump when render() changes its output; every stored row becomes stale
+RENDERER_VERSION = 1
+
+_FENCE_RE = re.compile(r'^```')
+_HEADING_RE = re.compile(r'^(#{1,6})\s+(.*?)\s*#*$')
+_BULLET_RE = re.compile(r'^[-*+]\s+(.*)$')
+_NUMBERED_RE = re.compile(r'^\d+[.)]\s+(.*)$')
+_QUOTE_RE = re.compile(r'^>\s?(.*)$')
+
+# Applied to escaped text, outside code spans
+_CODE_RE = re.compile(r'`([^`]+)`')
+_LINK_RE = re.compile(r'\[([^\]]+)\]\((https?://[^\s)]+)\)')
+_BOLD_RE = re.compile(r'\*\*(?=\S)(.+?)(?<=\S)\*\*')
+_ITALIC_RE = re.compile(r'(?<![*\w])\*(?=\S)(.+?)(?<=\S)\*(?![*\w])')
+
+
+def content_hash(text):
+    """Identifies the text and the renderer; an unchanged hash means unchanged HTML"""
+    return hashlib.sha1(f"{RENDERER_VERSION}\n{text}".encode('utf-8')).hexdigest()
+
+
+def _inline(text):
+    parts = _CODE_RE.split(escape(text))
+    # Odd parts are the insides of code spans, left as they are
+    for i in range(0, len(parts), 2):
+        part = _LINK_RE.sub(r'<a href="\2" rel="nofollow noopener">\1</a>', parts[i])
+        part = _BOLD_RE.sub(r'<strong>\1</strong>', part)
+        parts[i] = _ITALIC_RE.sub(r'<em>\1</em>', part)
+    for i in range(1, len(parts), 2):
+        parts[i] = f'<code>{parts[i]}</code>'
+    return ''.join(parts)
+
+
+def render(text):
+    """Sanitized HTML for article text"""
+    out = []
+    # The open block: (kind, lines), kind one of 'p', 'ul', 'ol', 'blockquote'
+    block = [None, []]
+
+    def close():
+        kind, lines = block
+        if kind in ('ul', 'ol'):
+            out.append(f'<{kind}>' + ''.join(f'<li>{_inline(line)}</li>' for line in lines) + f'</{kind}>')
+        elif kind:
+            body = '<br>\n'.join(_inline(line) for line in lines)
+            out.append(f'<blockquote><p>{body}</p></blockquote>' if kind == 'blockquote' else f'<p>{body}</p>')
+        block[:] = [None, []]
+
+    def add(kind, line):
+        if block[0] != kind:
+            close()
+            block[0] = kind
+        block[1].append(line)
+
+    lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    i = 0
+    while i < len(lines):
+        line = lines[i].rstrip()
+        i += 1
+        if _FENCE_RE.match(line):
+            close()
+            code = []
+            while i < len(lines) and not _FENCE_RE.match(lines[i]):
+                code.append(lines[i])
+                i += 1
+            i += 1
+            out.append(f'<pre><code>{escape(chr(10).join(code))}</code></pre>')
+        elif not line.strip():
+            close()
+        elif match := _HEADING_RE.match(line):
+            close()
+            # The page title is the top heading, so the text's headings start one below it
+            level = min(len(match[1]) + 1, 6)
+            out.append(f'<h{level}>{_inline(match[2])}</h{level}>')
+        elif match := _BULLET_RE.match(line):
+            add('ul', match[1])
+        elif match := _NUMBERED_RE.match(line):
+            add('ol', match[1])
+        elif match := _QUOTE_RE.match(line):
+            add('blockquote', match[1])
+        else:
+            add('p', line.strip())
+    close()
+    return '\n'.join(out)
+
+
+def html_for(article):
+    """
+    The article's HTML, ready to output.
+
+    Served from the stored row when its hash still matches the content
+    (one primary-key lookup); otherwise rendered and stored first.
+    """
+    digest = content_hash(article.content)
+    stored = ArticleHtml.objects.filter(article_id=article.pk).only('content_hash', 'html').first()
+    if stored is not None and stored.content_hash == digest:
+        return mark_safe(stored.html)
+    html = render(article.content)
+    with routers.unpinned_write():
+        ArticleHtml.objects.update_or_create(article_id=article.pk, defaults={'content_hash': digest, 'html': html})
+    return mark_safe(html)
+
+
+def store(articles, force=False):
+    """Render and store the articles whose HTML is missing or stale (all of them with `force`); returns the count"""
+    articles = list(articles)
+    stored = dict(
+        ArticleHtml.objects.filter(article_id__in=[article.pk for article in articles]).values_list('article_id', 'content_hash')
+    )
+    rows = []
+    for article in articles:
+        digest = content_hash(article.content)
+        if force or stored.get(article.pk) != digest:
+            rows.append(ArticleHtml(article_id=article.pk, content_hash=digest, html=render(article.content)))
+    ArticleHtml.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['article'],
+        update_fields=['content_hash', 'html', 'rendered_at'],
+        batch_size=500,
+    )
+    return len(rows)
+
+
+def backfill(articles, batch_size=500, force=False):
+    """Store HTML for every article in the queryset that needs it, in pk order; returns (checked, rendered)"""
+    checked = rendered = 0
+    last = 0
+    while True:
+        batch = list(articles.filter(pk__gt=last).order_by('pk').only('id', 'content')[:batch_size])
+        if not batch:
+            return checked, rendered
+        rendered += store(batch, force)
+        checked += len(batch)
+        last = batch[-1].pk
@@ -0,0 +1,224 @@
+import random
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CallTimeout(Exception):
+    """Raised when a call does not finish within its deadline"""
+
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker rejects a call without attempting it"""
+
+    def __init__(self, name, retry_after):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"Circuit '{name}' is open; retry in {retry_after:.0f}s")
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker.
+
+    After `failure_threshold` consecutive failures the breaker opens and
+    rejects calls for `reset_timeout` seconds. It then lets a single trial
+    call through (half-open); success closes it, failure opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._publish()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+            self._publish()
+        return self._state
+
+    def _publish(self):
+        metrics.set_gauge('circuit_breaker_state', self.STATE_VALUES[self._state], circuit=self.name)
+        metrics.set_gauge('circuit_breaker_failures', self._failures, circuit=self.name)
+
+    def before_call(self):
+        """Reserve a call slot or raise CircuitOpenError"""
+        with self._lock:
+            state = self._current_state()
+            if state == self.OPEN:
+                metrics.inc('circuit_breaker_rejected_total', circuit=self.name)
+                raise CircuitOpenError(self.name, self.reset_timeout - (self._clock() - self._opened_at))
+            if state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    metrics.inc('circuit_breaker_rejected_total', circuit=self.name)
+                    raise CircuitOpenError(self.name, self.reset_timeout)
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+            self._publish()
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"Circuit '{self.name}' opened after {self._failures} failures")
+                    metrics.inc('circuit_breaker_opened_total', circuit=self.name)
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+            self._publish()
+
+    def reset(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+            self._publish()
+
+
+# Calls run on this pool so a hung request cannot hold the caller past its deadline.
+# It is only a backstop: Python cannot stop a running call, so the thread stays
+# busy until the call returns. Callers should give the client its own timeout,
+# which is what actually ends a slow call.
+_executor = None
+_executor_lock = threading.Lock()
+# Calls on the pool that have not returned yet, including those whose caller gave up
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+
+def _get_executor(max_workers):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='resilient-call')
+        return _executor
+
+
+def shutdown_executor(wait=True):
+    """Drop queued calls and optionally wait for running ones (used on worker exit)"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def _call_finished():
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight -= 1
+
+
+def call_with_deadline(func, timeout, max_workers=8):
+    """
+    Run `func()` on the shared pool and wait at most `timeout` seconds for it.
+
+    Raises CallTimeout at once when `max_workers` calls are still running
+    (hung calls keep their thread after their caller gave up), rather than
+    queueing behind them until the deadline passes.
+    """
+    global _in_flight
+    with _in_flight_lock:
+        if _in_flight >= max_workers:
+            metrics.inc('resilient_call_saturated_total')
+            raise CallTimeout(f"All {max_workers} call threads are busy")
+        _in_flight += 1
+
+    def run():
+        try:
+            return func()
+        finally:
+            _call_finished()
+
+    try:
+        future = _get_executor(max_workers).submit(run)
+    except BaseException:
+        _call_finished()
+        raise
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        if future.cancel():
+            # Never started, so run() will not release its slot
+            _call_finished()
+        raise CallTimeout(f"Call did not complete within {timeout}s")
+
+
+def calls_in_flight():
+    with _in_flight_lock:
+        return _in_flight
+
+
+def backoff_delay(attempt, base=0.5, cap=8.0):
+    """Full-jitter exponential backoff for the given (zero-based) attempt"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def call_resilient(func, breaker, timeout, max_retries=2, is_retryable=lambda exc: False,
+                   is_failure=lambda exc: True, classify=lambda exc: exc, sleep=time.sleep, grace=0.0):
+    """
+    Call `func` through `breaker` with a per-attempt deadline.
+
+    Exceptions are passed through `classify` before anything else looks at
+    them; only those accepted by `is_retryable` are retried, with jittered
+    backoff. Errors accepted by `is_failure` count against the breaker, the
+    rest (bad input, blocked content) mean the provider itself is healthy.
+
+    When `func` enforces `timeout` itself (a client-side request timeout),
+    pass a `grace`: the pool then waits that much longer, so the client's
+    own error ends the attempt and frees its thread, and the pool deadline
+    only catches a call that ignores it.
+    """
+    attempt = 0
+    while True:
+        breaker.before_call()
+        try:
+            result = call_with_deadline(func, timeout + grace)
+        except Exception as exc:
+            error = classify(exc)
+            if is_failure(error):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            metrics.inc('resilient_call_failures_total', circuit=breaker.name, error=type(error).__name__)
+            if attempt >= max_retries or not is_retryable(error):
+                if error is exc:
+                    raise
+                raise error from exc
+            delay = backoff_delay(attempt)
+            logger.info(f"Retrying '{breaker.name}' call in {delay:.2f}s after {type(error).__name__}")
+            sleep(delay)
+            attempt += 1
+            continue
+        breaker.record_success()
+        return result
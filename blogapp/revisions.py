@@ -0,0 +1,175 @@
+import json
+import re
+import zlib
+from difflib import SequenceMatcher
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import ArticleRevision
+
+# Words with their trailing whitespace; joining the tokens gives back the text
+_TOKEN_RE = re.compile(r'\s+|\S+\s*')
+
+
+def _tokenize(text):
+    return _TOKEN_RE.findall(text)
+
+
+def _snapshot_interval():
+    return getattr(settings, 'ARTICLE_REVISION_SNAPSHOT_INTERVAL', 10)
+
+
+def encode_snapshot(content):
+    return zlib.compress(content.encode('utf-8'))
+
+
+def encode_delta(old, new):
+    """
+    Encode `new` as edits against `old`.
+
+    The delta is a list of ops: `[start, end]` copies tokens of the old text,
+    a string inserts literal text. Its size tracks the size of the change,
+    not of the article.
+    """
+    old_tokens = _tokenize(old)
+    new_tokens = _tokenize(new)
+    ops = []
+    matcher = SequenceMatcher(None, old_tokens, new_tokens)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append(''.join(new_tokens[j1:j2]))
+    return zlib.compress(json.dumps(ops, separators=(',', ':')).encode('utf-8'))
+
+
+def apply_delta(old, data):
+    old_tokens = _tokenize(old)
+    parts = []
+    for op in json.loads(zlib.decompress(data)):
+        if isinstance(op, str):
+            parts.append(op)
+        else:
+            parts.append(''.join(old_tokens[op[0]:op[1]]))
+    return ''.join(parts)
+
+
+def revision_content(revision):
+    """
+    Rebuild the content of `revision` from the nearest snapshot at or before it.
+
+    Works for ArchivedArticleRevision rows as well, which are stored the same way.
+    """
+    if revision.is_snapshot:
+        return zlib.decompress(bytes(revision.data)).decode('utf-8')
+    revision_model = type(revision)
+    base_number = (
+        revision_model.objects
+        .filter(article_id=revision.article_id, number__lt=revision.number, is_snapshot=True)
+        .order_by('-number')
+        .values_list('number', flat=True)
+        .first()
+    )
+    chain = (
+        revision_model.objects
+        .filter(article_id=revision.article_id, number__gte=base_number, number__lte=revision.number)
+        .order_by('number')
+        .only('is_snapshot', 'data')
+    )
+    content = ''
+    for step in chain:
+        if step.is_snapshot:
+            content = zlib.decompress(bytes(step.data)).decode('utf-8')
+        else:
+            content = apply_delta(content, bytes(step.data))
+    return content
+
+
+def _last_snapshot_number(article):
+    return (
+        ArticleRevision.objects
+        .filter(article=article, is_snapshot=True)
+        .order_by('-number')
+        .values_list('number', flat=True)
+        .first()
+    ) or 0
+
+
+def record_revision(article, user=None):
+    """
+    Store the article's current title/content as a new revision.
+
+    A full snapshot is written for the first revision, every
+    ARTICLE_REVISION_SNAPSHOT_INTERVAL revisions, and whenever the delta
+    would be no smaller than the snapshot. Returns the new revision, or
+    None when nothing changed.
+    """
+    with transaction.atomic():
+        latest = (
+            ArticleRevision.objects
+            .select_for_update()
+            .filter(article=article)
+            .order_by('-number')
+            .first()
+        )
+        if latest is None:
+            number, is_snapshot, data = 1, True, encode_snapshot(article.content)
+        else:
+            previous = revision_content(latest)
+            if previous == article.content and latest.title == article.title:
+                return None
+            number = latest.number + 1
+            snapshot = encode_snapshot(article.content)
+            since_snapshot = (
+                ArticleRevision.objects
+                .filter(article=article, number__gt=_last_snapshot_number(article))
+                .count()
+            )
+            if since_snapshot + 1 >= _snapshot_interval():
+                is_snapshot, data = True, snapshot
+            else:
+                delta = encode_delta(previous, article.content)
+                is_snapshot, data = (True, snapshot) if len(delta) >= len(snapshot) else (False, delta)
+
+        return ArticleRevision.objects.create(
+            article=article,
+            number=number,
+            user=user,
+            title=article.title,
+            is_snapshot=is_snapshot,
+            data=data,
+            content_length=len(article.content),
+        )
+
+
+def ensure_baseline(article, user=None):
+    """Record the current state of an article that predates revision tracking"""
+    if not article.revisions.exists():
+        record_revision(article, user)
+
+
+def prune_revisions(article, keep):
+    """
+    Drop all but the newest `keep` revisions of an article.
+
+    The oldest surviving revision is rewritten as a snapshot first so that
+    later deltas can still be reconstructed. Returns the number deleted.
+    """
+    with transaction.atomic():
+        numbers = list(
+            ArticleRevision.objects
+            .filter(article=article)
+            .order_by('-number')
+            .values_list('number', flat=True)[:keep]
+        )
+        if not numbers:
+            return 0
+        oldest_kept = ArticleRevision.objects.get(article=article, number=numbers[-1])
+        if not oldest_kept.is_snapshot:
+            content = revision_content(oldest_kept)
+            oldest_kept.is_snapshot = True
+            oldest_kept.data = encode_snapshot(content)
+            oldest_kept.save(update_fields=['is_snapshot', 'data'])
+        deleted, _ = ArticleRevision.objects.filter(article=article, number__lt=oldest_kept.number).delete()
+        return deleted
@@ -0,0 +1,155 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+PRIMARY = 'default'
+
+# Set for the rest of a request once it writes, or when the client wrote recently
+_pinned = ContextVar('db_pinned_to_primary', default=False)
+# Set once the current request (or command) has sent a write to the primary
+_wrote = ContextVar('db_wrote_to_primary', default=False)
+
+# Apps whose reads must always see the latest write (e.g. a session created by the previous request)
+PRIMARY_ONLY_APPS = {'sessions'}
+
+
+def replica_aliases():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+def pin_to_primary():
+    _pinned.set(True)
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+def has_written():
+    return _wrote.get()
+
+
+@contextmanager
+def pinned(value=True):
+    """
+    Scope routing state to a block (one request): reads go to the primary
+    when `value` is true, and any write inside pins the rest of the block.
+    """
+    pin_token = _pinned.set(value)
+    wrote_token = _wrote.set(False)
+    try:
+        yield
+    finally:
+        _pinned.reset(pin_token)
+        _wrote.reset(wrote_token)
+
+
+@contextmanager
+def unpinned_write():
+    """
+    Writes inside the block don't count as the request's own: cache and
+    bookkeeping rows (a regenerated feed, stored HTML, a token's
+    last_used_at) that the client never asked to change, so they neither
+    pin its later reads nor set the sticky cookie. They still go to the
+    primary.
+    """
+    pin_token = _pinned.set(_pinned.get())
+    wrote_token = _wrote.set(_wrote.get())
+    try:
+        yield
+    finally:
+        _pinned.reset(pin_token)
+        _wrote.reset(wrote_token)
+
+
+def report_db():
+    """
+    Alias for read-only reports: `Model.objects.using(report_db())`.
+
+    Always a replica when one is configured, even for a pinned request;
+    reports tolerate replication lag and should never load the primary.
+    """
+    replicas = replica_aliases()
+    return random.choice(replicas) if replicas else PRIMARY
+
+
+class PrimaryReplicaRouter:
+    """
+    Writes go to `default`, reads to a random DATABASE_REPLICAS alias.
+
+    Reads stay on the primary while the request is pinned (it has written,
+    or the client wrote within REPLICA_STICKY_SECONDS; see
+    ReplicaPinningMiddleware) and inside transactions, so a writer always
+    reads its own writes. Without replicas every query goes to `default`.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = replica_aliases()
+        if not replicas or is_pinned() or model._meta.app_label in PRIMARY_ONLY_APPS:
+            return PRIMARY
+        if connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        pin_to_primary()
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data, so objects from any of them may be related
+        pool = {PRIMARY, *replica_aliases()}
+        return obj1._state.db in pool and obj2._state.db in pool
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the primary; only the primary is migrated
+        return db == PRIMARY
+
+
+class ArticleShardRouter:
+    """
+    Article rows go to the database of their blog (blogapp.sharding).
+
+    Only decisions with an Article instance in hand are made here: a saved
+    article stays where it was loaded from, a new one goes to its blog's
+    shard. Everything else falls through to the next router, so querysets
+    without .using() read `default` (or its replicas). Listed before
+    PrimaryReplicaRouter.
+    """
+
+    def _article(self, model, hints):
+        instance = hints.get('instance')
+        if model._meta.label == 'blogapp.Article' and isinstance(instance, model):
+            return instance
+        return None
+
+    def db_for_read(self, model, **hints):
+        article = self._article(model, hints)
+        return article._state.db if article is not None else None
+
+    def db_for_write(self, model, **hints):
+        article = self._article(model, hints)
+        if article is None:
+            return None
+        _wrote.set(True)
+        pin_to_primary()
+        if article._state.db and not article._state.adding:
+            return article._state.db
+        from .sharding import write_alias
+        return write_alias(article.blog_id)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        from .sharding import all_aliases
+        if obj1._state.db == obj2._state.db:
+            return True
+        if 'blogapp.Article' in (obj1._meta.label, obj2._meta.label):
+            pool = {*all_aliases(), *replica_aliases()}
+            return obj1._state.db in pool and obj2._state.db in pool
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Shards get the full schema (most of it stays empty) so migrations apply unchanged
+        return True if db in getattr(settings, 'ARTICLE_SHARDS', []) else None
@@ -1,97 +1,283 @@
-import google.generativeai as genai
+import importlib
 import os
-from dotenv import load_dotenv
+import threading
+import time
+from django.conf import settings
 import logging
 
+from .resilience import CircuitBreaker, CircuitOpenError, CallTimeout, call_resilient
+from . import prompts
+
 logger = logging.getLogger(__name__)
 
+
+class GeminiError(Exception):
+    """Base class for typed Gemini failures"""
+    user_message = 'An unexpected error occurred while generating the article.'
+    # Retry the call after a backoff
+    retryable = False
+    # Count against the circuit breaker (provider-side problem)
+    is_outage = True
+
+
+class GeminiTimeoutError(GeminiError):
+    user_message = 'The AI service took too long to respond. Please try again.'
+    retryable = True
+
+
+class GeminiUnavailableError(GeminiError):
+    user_message = 'Connection error. Please check your internet connection and try again.'
+    retryable = True
+
+
+class GeminiRateLimitError(GeminiError):
+    user_message = 'API rate limit exceeded. Please try again in a moment.'
+    retryable = True
+
+
+class GeminiAuthError(GeminiError):
+    user_message = 'API authentication failed. Please check your Gemini API key in .env file.'
+
+
+class GeminiModelNotFoundError(GeminiError):
+    user_message = 'AI model not available. Please try again later or contact support.'
+
+
+class GeminiBlockedError(GeminiError):
+    user_message = 'Content was blocked by safety filters. Please try a different keyword.'
+    is_outage = False
+
+
+class GeminiInvalidRequestError(GeminiError):
+    user_message = 'Invalid request. Please try a different keyword.'
+    is_outage = False
+
+
+class GeminiPromptTooLongError(GeminiInvalidRequestError):
+    user_message = 'The keyword is too long. Please shorten it and try again.'
+
+
+class GeminiCircuitOpenError(GeminiError):
+    user_message = 'The AI service is temporarily unavailable. Please try again in a minute.'
+
+
+_genai = None
+_exception_map = None
+
+
+def _load_genai():
+    """
+    Import google.generativeai on first use.
+
+    The client pulls in gRPC and protobuf; deferring it keeps URLconf import
+    and worker boot fast, and workers that never generate never pay for it.
+    """
+    global _genai
+    if _genai is None:
+        _genai = importlib.import_module('google.generativeai')
+    return _genai
+
+
+def _get_exception_map():
+    """Client exception types mapped to GeminiError classes, most specific first"""
+    global _exception_map
+    if _exception_map is None:
+        from google.api_core import exceptions as google_exceptions
+        from google.generativeai.types import BlockedPromptException, StopCandidateException
+        # TooManyRequests covers ResourceExhausted
+        _exception_map = (
+            (CallTimeout, GeminiTimeoutError),
+            (google_exceptions.DeadlineExceeded, GeminiTimeoutError),
+            (TimeoutError, GeminiTimeoutError),
+            (google_exceptions.TooManyRequests, GeminiRateLimitError),
+            (google_exceptions.Unauthenticated, GeminiAuthError),
+            (google_exceptions.PermissionDenied, GeminiAuthError),
+            (google_exceptions.NotFound, GeminiModelNotFoundError),
+            (google_exceptions.InvalidArgument, GeminiInvalidRequestError),
+            (google_exceptions.BadRequest, GeminiInvalidRequestError),
+            (BlockedPromptException, GeminiBlockedError),
+            (StopCandidateException, GeminiBlockedError),
+            (google_exceptions.ServerError, GeminiUnavailableError),
+            (google_exceptions.RetryError, GeminiUnavailableError),
+            (ConnectionError, GeminiUnavailableError),
+        )
+    return _exception_map
+
+
+def classify_gemini_exception(exc):
+    """Map a client-library exception onto the GeminiError hierarchy"""
+    if isinstance(exc, GeminiError):
+        return exc
+    for exc_type, error_class in _get_exception_map():
+        if isinstance(exc, exc_type):
+            return error_class(str(exc))
+    return GeminiError(str(exc))
+
+
+# Shared by every GeminiService instance in the process so an outage is
+# detected once rather than per request.
+gemini_breaker = CircuitBreaker(
+    'gemini',
+    failure_threshold=getattr(settings, 'GEMINI_BREAKER_THRESHOLD', 5),
+    reset_timeout=getattr(settings, 'GEMINI_BREAKER_RESET_SECONDS', 30),
+)
+
+_model_name = None
+_model_lock = threading.Lock()
+
+
+class FakeGenerativeModel:
+    """
+    Stand-in for genai.GenerativeModel used when GEMINI_USE_FAKE is set.
+
+    Sleeps for GEMINI_FAKE_LATENCY_SECONDS and returns a well-formed answer,
+    so load tests exercise the full request path without calling Google.
+    """
+
+    class _Response:
+        def __init__(self, text):
+            self.text = text
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def generate_content(self, prompt, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._Response(
+            "Title: A Practical Guide to the Topic\n"
+            "Content: This generated article introduces the topic and explains why it matters. "
+            "It walks through the key ideas with concrete examples. "
+            "It closes with practical next steps for readers."
+        )
+
+
 class GeminiService:
     def __init__(self):
-        load_dotenv()
+        self.timeout = getattr(settings, 'GEMINI_TIMEOUT_SECONDS', 20)
+        self.grace = getattr(settings, 'GEMINI_DEADLINE_GRACE_SECONDS', 5)
+        self.max_retries = getattr(settings, 'GEMINI_MAX_RETRIES', 2)
+        if getattr(settings, 'GEMINI_USE_FAKE', False):
+            self.model = FakeGenerativeModel(getattr(settings, 'GEMINI_FAKE_LATENCY_SECONDS', 0.0))
+            return
+
+        # .env is loaded once by settings; reading it again per request is wasted I/O
         api_key = os.getenv('GEMINI_API_KEY')
         
         if not api_key:
             raise ValueError("GEMINI_API_KEY not found in environment variables. Please check your .env file.")
         
 
-        genai.configure(api_key=api_key)
+        _load_genai().configure(api_key=api_key)
         self.model = self._get_available_model()
+
+    def _call(self, func):
+        """
+        Run a model call with deadline, retry and circuit breaking.
+
+        `func` must pass request_options={'timeout': self.timeout} to the
+        client: that timeout is the real deadline, the pool's is a backstop.
+        """
+        try:
+            return call_resilient(
+                func,
+                gemini_breaker,
+                timeout=self.timeout,
+                grace=self.grace,
+                max_retries=self.max_retries,
+                is_retryable=lambda error: error.retryable,
+                is_failure=lambda error: error.is_outage,
+                classify=classify_gemini_exception,
+            )
+        except CircuitOpenError as e:
+            raise GeminiCircuitOpenError(str(e)) from e
+
+    def _generate_text(self, model, prompt):
+        response = self._call(
+            lambda: model.generate_content(prompt, request_options={'timeout': self.timeout})
+        )
+        try:
+            return response.text if response else ''
+        except ValueError as e:
+            # The client raises ValueError from .text when every candidate was filtered
+            raise GeminiBlockedError(str(e)) from e
     
     def _get_available_model(self):
-        """Try to get an available free model"""
+        """Try to get an available free model, probing the API once per process"""
+        global _model_name
+        genai = _load_genai()
+        if _model_name:
+            return genai.GenerativeModel(_model_name)
+
+        with _model_lock:
+            if _model_name:
+                return genai.GenerativeModel(_model_name)
+
+            free_models = [
+                'gemini-1.5-flash',
+            ]
+
+            for model_name in free_models:
+                try:
+                    model = genai.GenerativeModel(model_name)
+                    if self._generate_text(model, "Say 'test'"):
+                        logger.info(f"Successfully initialized Gemini model: {model_name}")
+                        _model_name = model_name
+                        return model
+                except GeminiCircuitOpenError:
+                    raise
+                except GeminiError as e:
+                    logger.debug(f"Model {model_name} not available: {e}")
+                    continue
 
-        free_models = [
-            'gemini-1.5-flash',
-        ]
-        
-        for model_name in free_models:
             try:
-                model = genai.GenerativeModel(model_name)
-                test_response = model.generate_content("Say 'test'")
-                if test_response and test_response.text:
-                    logger.info(f"Successfully initialized Gemini model: {model_name}")
-                    return model
-            except Exception as e:
-                logger.debug(f"Model {model_name} not available: {e}")
-                continue
-    
-        try:
-            available_models = genai.list_models()
-            logger.error("Available models:")
-            for model in available_models:
-                if hasattr(model, 'name'):
-                    logger.error(f"- {model.name}")
-                    if 'generateContent' in getattr(model, 'supported_generation_methods', []):
-                        try:
+                available_models = self._call(lambda: list(genai.list_models(request_options={'timeout': self.timeout})))
+                logger.error("Available models:")
+                for model in available_models:
+                    if hasattr(model, 'name'):
+                        logger.error(f"- {model.name}")
+                        if 'generateContent' in getattr(model, 'supported_generation_methods', []):
+                            _model_name = model.name
                             return genai.GenerativeModel(model.name)
-                        except:
-                            continue
-        except Exception as e:
-            logger.error(f"Could not list available models: {e}")
-        raise Exception("No available Gemini models found. Please check your API key and try again.")
+            except GeminiError as e:
+                logger.error(f"Could not list available models: {e}")
+                raise
+        raise GeminiModelNotFoundError("No available Gemini models found. Please check your API key and try again.")
     
-    def generate_article(self, keyword, blog_categories=None):
+    def generate_article(self, keyword, blog_categories=None, prompt=None):
         """
         Generate an article title and content using Gemini API
         
         Args:
             keyword (str): The keyword/topic for the article
             blog_categories (list): Optional blog categories for context
+            prompt (CompiledPrompt): Template to use; defaults to the active 'article' prompt
         
         Returns:
-            dict: Contains 'title', 'content', 'success', and 'error' keys
+            dict: Contains 'title', 'content', 'success', 'error' and 'prompt' (the template key) keys
         """
+        prompt = prompt or prompts.default_prompt('article')
         try:
-            categories_context = ""
-            if blog_categories and len(blog_categories) > 0:
-                categories_context = f" The blog focuses on categories like: {', '.join(blog_categories)}."
-            
-            prompt = f"""
-            Write a professional blog article about "{keyword}".{categories_context}
-            
-            Requirements:
-            1. Create an engaging title
-            2. Write 3-5 well-structured sentences that provide valuable, informative content about the topic
-            3. Make the content professional, engaging, and suitable for a blog audience
-            
-            Please format your response exactly like this:
-            Title: Your engaging title here
-            Content: Your informative content here (3-5 sentences)
+            values = {
+                'keyword': keyword,
+                'categories_context': prompts.categories_context(tuple(blog_categories or ())),
+            }
+            # Sized before rendering, so an oversized request never reaches the model
+            max_tokens = getattr(settings, 'GEMINI_MAX_PROMPT_TOKENS', 2048)
+            if prompt.estimate_tokens(**values) > max_tokens:
+                raise GeminiPromptTooLongError(f"Prompt {prompt.key} would exceed {max_tokens} tokens")
             
-            Do not include any additional text, explanations, or formatting.
-            """
-   
-            response = self.model.generate_content(prompt)
+            generated_text = self._generate_text(self.model, prompt.render(**values)).strip()
       
-            if not response or not response.text:
+            if not generated_text:
                 return {
                     'success': False,
                     'title': '',
                     'content': '',
-                    'error': 'No content was generated. Please try again with a different keyword.'
+                    'error': 'No content was generated. Please try again with a different keyword.',
+                    'prompt': prompt.key,
                 }
             
-            generated_text = response.text.strip()
             
             title = ""
             content = ""
@@ -174,65 +360,26 @@ class GeminiService:
                 'success': True,
                 'title': title,
                 'content': content,
-                'error': None
+                'error': None,
+                'prompt': prompt.key,
             }
             
-        except Exception as e:
-            error_message = str(e).lower()
-            
-            if 'quota exceeded' in error_message or 'rate limit' in error_message:
-                logger.error("Gemini API rate limit exceeded")
-                return {
-                    'success': False,
-                    'title': '',
-                    'content': '',
-                    'error': 'API rate limit exceeded. Please try again in a moment.'
-                }
-            elif 'api key' in error_message or 'authentication' in error_message:
-                logger.error("Gemini API authentication failed")
-                return {
-                    'success': False,
-                    'title': '',
-                    'content': '',
-                    'error': 'API authentication failed. Please check your Gemini API key in .env file.'
-                }
-            elif 'not found' in error_message or '404' in error_message:
-                logger.error("Gemini model not found")
-                return {
-                    'success': False,
-                    'title': '',
-                    'content': '',
-                    'error': 'AI model not available. Please try again later or contact support.'
-                }
-            elif 'blocked' in error_message or 'safety' in error_message:
-                logger.error("Content was blocked by Gemini safety filters")
-                return {
-                    'success': False,
-                    'title': '',
-                    'content': '',
-                    'error': 'Content was blocked by safety filters. Please try a different keyword.'
-                }
-            elif 'connection' in error_message or 'timeout' in error_message:
-                logger.error("Gemini API connection error")
-                return {
-                    'success': False,
-                    'title': '',
-                    'content': '',
-                    'error': 'Connection error. Please check your internet connection and try again.'
-                }
-            elif 'invalid argument' in error_message:
-                logger.error("Invalid request to Gemini API")
-                return {
-                    'success': False,
-                    'title': '',
-                    'content': '',
-                    'error': 'Invalid request. Please try a different keyword.'
-                }
-            else:
-                logger.error(f"Unexpected error in Gemini service: {e}")
-                return {
-                    'success': False,
-                    'title': '',
-                    'content': '',
-                    'error': f'An unexpected error occurred: {str(e)}'
-                }
\ No newline at end of file
+        except GeminiError as e:
+            logger.error(f"Gemini generation failed ({type(e).__name__}): {e}")
+            return {
+                'success': False,
+                'title': '',
+                'content': '',
+                'error': e.user_message,
+                'prompt': prompt.key,
+            }
+        except Exception:
+            # The details stay in the log; they may name internals the user should not see
+            logger.exception("Unexpected error in Gemini service")
+            return {
+                'success': False,
+                'title': '',
+                'content': '',
+                'error': GeminiError.user_message,
+                'prompt': prompt.key,
+            }
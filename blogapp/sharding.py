@@ -0,0 +1,411 @@
+"""
+Article rows spread over several databases by blog.
+
+With ARTICLE_SHARDS set (e.g. from SQLITE_SHARD_PATHS), each new blog is
+placed on one of those aliases (a stable hash of its id) and recorded in
+BlogShard; ArticleShardRouter then sends the blog's Article writes there.
+Blogs without a BlogShard row, including every blog that predates
+sharding, keep their articles on `default`. `manage.py rebalance_shards`
+moves a blog between databases in batches.
+
+Everything else (users, blogs, revisions, vectors, fingerprints, rendered HTML, the
+outbox cursors) stays on `default`. Queries on Article that do not go
+through an instance or the helpers here only see `default`:
+
+    blog_querysets(blog_id, qs)   a blog's articles (two databases while it moves)
+    user_querysets(user, qs)      a user's articles, one queryset per database
+    merge(querysets, key)         fan out, then merge the sorted results
+    find_article(**filters)       one article, wherever it lives
+    in_bulk(ids, qs)              articles by id, wherever they live
+    article_ids(querysets)        `article_id__in` values for the side tables
+
+Article ids come from a sequence on `default` (next_article_id), so they
+are unique across databases; bulk_create on a shard must set them too.
+Joins between Article and any other table do not work on a shard (the
+tables exist there, but are empty): filter Article by blog_id/user_id, and
+side tables by article_ids() instead of article__ lookups.
+"""
+import heapq
+import logging
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, DateTimeField, F, Max, Value, When
+from django.utils import timezone
+
+from .models import (
+    ArchivedArticle, Article, ArticleFingerprint, ArticleHtml, ArticleIdSequence, ArticleLSHBucket,
+    ArticleRevision, ArticleVector, Blog, BlogShard, FeedDocument, RelatedArticle,
+)
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = 'default'
+
+# Article ids a process reserves from the shared sequence at a time
+ID_BLOCK_SIZE = 100
+
+_id_lock = threading.Lock()
+# [next id, end of the reserved block]
+_id_block = [0, 0]
+
+# blog id -> (expires_at, (alias, moving_to)), kept for SHARD_MAP_CACHE_SECONDS
+_placements = {}
+_placements_lock = threading.Lock()
+# Entries kept before the whole map is dropped
+PLACEMENT_CACHE_SIZE = 50000
+
+# Columns copied when a blog moves; content goes across as the stored bytes
+_ARTICLE_FIELDS = [
+    'id', 'user_id', 'blog_id', 'title', 'content', 'status',
+    'created_at', 'updated_at', 'published_at', 'publish_at', 'archived_at',
+]
+
+
+def shard_aliases():
+    return list(getattr(settings, 'ARTICLE_SHARDS', []))
+
+
+def is_enabled():
+    return bool(shard_aliases())
+
+
+def all_aliases():
+    """Every database that may hold articles, `default` first"""
+    return [PRIMARY] + [alias for alias in shard_aliases() if alias != PRIMARY]
+
+
+def on(queryset, alias):
+    """`queryset` on `alias`; `default` is left to the routers, so its reads can still go to a replica"""
+    return queryset if alias == PRIMARY else queryset.using(alias)
+
+
+def place(blog_id):
+    """The shard a new blog goes to"""
+    shards = shard_aliases()
+    return shards[zlib.crc32(str(blog_id).encode()) % len(shards)]
+
+
+def assign_shard(blog):
+    if is_enabled():
+        BlogShard.objects.get_or_create(blog_id=blog.pk, defaults={'alias': place(blog.pk)})
+        forget_placement(blog.pk)
+
+
+def _cache_seconds():
+    return getattr(settings, 'SHARD_MAP_CACHE_SECONDS', 5)
+
+
+def forget_placement(blog_id=None):
+    """Drop this process's cached placement of a blog, or of every blog"""
+    with _placements_lock:
+        if blog_id is None:
+            _placements.clear()
+        else:
+            _placements.pop(blog_id, None)
+
+
+def _entry(blog_id):
+    """
+    (alias, moving_to) of a blog, cached per process for SHARD_MAP_CACHE_SECONDS
+    so that an article write does not also read BlogShard on `default`.
+    move_blog waits that long after announcing a move, before copying.
+    """
+    if not is_enabled():
+        return PRIMARY, ''
+    cached = _placements.get(blog_id)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    entry = BlogShard.objects.filter(blog_id=blog_id).values_list('alias', 'moving_to').first() or (PRIMARY, '')
+    ttl = _cache_seconds()
+    if ttl:
+        with _placements_lock:
+            if len(_placements) >= PLACEMENT_CACHE_SIZE:
+                _placements.clear()
+            _placements[blog_id] = (time.monotonic() + ttl, entry)
+    return entry
+
+
+def write_alias(blog_id):
+    """Where a new article of the blog is written: the destination while it moves"""
+    alias, moving_to = _entry(blog_id)
+    return moving_to or alias
+
+
+def read_aliases(blog_id):
+    """Databases that may hold the blog's articles"""
+    alias, moving_to = _entry(blog_id)
+    return [moving_to, alias] if moving_to else [alias]
+
+
+def blog_querysets(blog_id, queryset=None):
+    queryset = Article.objects.all() if queryset is None else queryset
+    return [on(queryset.filter(blog_id=blog_id), alias) for alias in read_aliases(blog_id)]
+
+
+def user_querysets(user, queryset=None):
+    """
+    One queryset of the user's articles per database that holds any of
+    their blogs; a single unchanged queryset when sharding is off.
+    """
+    queryset = Article.objects.all() if queryset is None else queryset
+    queryset = queryset.filter(user=user)
+    if not is_enabled():
+        return [queryset]
+    aliases = {PRIMARY}
+    for alias, moving_to in BlogShard.objects.filter(blog__user=user).values_list('alias', 'moving_to'):
+        aliases.add(alias)
+        if moving_to:
+            aliases.add(moving_to)
+    return [on(queryset, alias) for alias in all_aliases() if alias in aliases]
+
+
+def merge(querysets, key, reverse=False):
+    """
+    Evaluate each queryset (already ordered by `key`) and merge the results.
+
+    A row found on two databases (a blog caught mid-move) is kept once,
+    the copy with the newest updated_at.
+    """
+    results = [list(qs) for qs in querysets]
+    if len(results) == 1:
+        return results[0]
+    newest = {}
+    for rows in results:
+        for obj in rows:
+            kept = newest.get(obj.pk)
+            if kept is None or obj.updated_at > kept.updated_at:
+                newest[obj.pk] = obj
+    return [obj for obj in heapq.merge(*results, key=key, reverse=reverse) if newest[obj.pk] is obj]
+
+
+def find_article(**filters):
+    """The article matching `filters` on any database, or None"""
+    found = None
+    for alias in all_aliases():
+        obj = on(Article.objects.filter(**filters), alias).first()
+        if obj is not None and (found is None or obj.updated_at > found.updated_at):
+            found = obj
+    return found
+
+
+def chunks(values, size=500):
+    """Consecutive slices of a list, so IN lookups stay under the database's parameter limit"""
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def in_bulk(ids, queryset=None):
+    """{id: article} for the `ids` found on any database; the newest copy of one caught mid-move"""
+    queryset = Article.objects.all() if queryset is None else queryset
+    ids = sorted(set(ids))
+    found = {}
+    for alias in all_aliases():
+        for chunk in chunks(ids):
+            for obj in on(queryset.filter(id__in=chunk), alias):
+                kept = found.get(obj.pk)
+                if kept is None or obj.updated_at > kept.updated_at:
+                    found[obj.pk] = obj
+    return found
+
+
+def article_ids(querysets, size=500):
+    """
+    `article_id__in` values covering the articles of `querysets` (as from
+    blog_querysets/user_querysets), for the side tables on `default`.
+
+    A queryset on `default` goes in as a subquery; one on a shard is
+    evaluated into sorted id lists of at most `size`. An article caught
+    mid-move may be covered twice.
+    """
+    lookups = []
+    for queryset in querysets:
+        if queryset._db in (None, PRIMARY):
+            lookups.append(queryset.order_by().values('id'))
+        else:
+            lookups.extend(chunks(sorted(queryset.values_list('id', flat=True)), size))
+    return lookups
+
+
+def delete_side_rows(ids):
+    """
+    Delete the rows on `default` that belong to the given article ids.
+
+    Nothing cascades to them from an article deleted on a shard.
+    """
+    for chunk in chunks(sorted(ids)):
+        ArticleRevision.objects.filter(article_id__in=chunk).delete()
+        ArticleVector.objects.filter(article_id__in=chunk).delete()
+        RelatedArticle.objects.filter(article_id__in=chunk).delete()
+        RelatedArticle.objects.filter(related_id__in=chunk).delete()
+        ArticleFingerprint.objects.filter(article_id__in=chunk).delete()
+        ArticleLSHBucket.objects.filter(article_id__in=chunk).delete()
+        ArticleHtml.objects.filter(article_id__in=chunk).delete()
+
+
+def articles_deleted(db, articles):
+    """
+    Clean up after articles deleted from `db`, given as (id, blog_id)
+    pairs: their side rows on `default` when `db` is a shard, and the other
+    copies of those whose blog is mid-move.
+    """
+    if not is_enabled():
+        return
+    if db != PRIMARY:
+        delete_side_rows([pk for pk, _ in articles])
+    by_blog = {}
+    for pk, blog_id in articles:
+        by_blog.setdefault(blog_id, []).append(pk)
+    for blog_id, ids in by_blog.items():
+        for alias in read_aliases(blog_id):
+            if alias != db:
+                Article._base_manager.using(alias).filter(pk__in=ids)._raw_delete(alias)
+
+
+def article_deleted(article):
+    articles_deleted(article._state.db or PRIMARY, [(article.pk, article.blog_id)])
+
+
+def _reserve_ids(count):
+    """Take `count` ids from the shared sequence; returns the first"""
+    for _ in range(2):
+        with transaction.atomic(using=PRIMARY):
+            # Write first, so the read below sees this block and no other process's
+            if ArticleIdSequence.objects.filter(name='article').update(next_value=F('next_value') + count):
+                return ArticleIdSequence.objects.get(name='article').next_value - count
+        highest = max(
+            [Article._base_manager.using(alias).aggregate(m=Max('id'))['m'] or 0 for alias in all_aliases()]
+            + [ArchivedArticle._base_manager.aggregate(m=Max('id'))['m'] or 0]
+        )
+        try:
+            with transaction.atomic(using=PRIMARY):
+                ArticleIdSequence.objects.create(name='article', next_value=highest + 1)
+        except IntegrityError:
+            # Another process created it first
+            pass
+    raise RuntimeError("Could not reserve article ids")
+
+
+def next_article_id():
+    """
+    A new article id, unique across every article database.
+
+    Ids are reserved from `default` ID_BLOCK_SIZE at a time, so most
+    inserts on a shard do not touch the primary at all. Ids are increasing
+    per process but not across processes; unused ones are skipped.
+    """
+    with _id_lock:
+        if _id_block[0] >= _id_block[1]:
+            start = _reserve_ids(ID_BLOCK_SIZE)
+            _id_block[:] = [start, start + ID_BLOCK_SIZE]
+        value = _id_block[0]
+        _id_block[0] += 1
+        return value
+
+
+def _copy_rows(rows, source, target):
+    """
+    Upsert article rows (from .values(*_ARTICLE_FIELDS)) on `target`, keeping
+    their timestamps, and move their pending outbox events along with them.
+    """
+    from . import outbox
+    ids = [row['id'] for row in rows]
+    with transaction.atomic(using=target):
+        Article._base_manager.using(target).bulk_create(
+            [Article(**row) for row in rows],
+            update_conflicts=True,
+            unique_fields=['id'],
+            update_fields=[name for name in _ARTICLE_FIELDS if name != 'id'],
+        )
+        # bulk_create stamps the auto fields; put the originals back
+        Article._base_manager.using(target).filter(id__in=ids).update(
+            created_at=Case(*[When(id=row['id'], then=Value(row['created_at'])) for row in rows],
+                            output_field=DateTimeField()),
+            updated_at=Case(*[When(id=row['id'], then=Value(row['updated_at'])) for row in rows],
+                            output_field=DateTimeField()),
+        )
+        # In the same transaction, so the rows' next events on the target come after these
+        outbox.move_events('article', ids, source, target)
+
+
+def copy_batch(blog_id, source, target, batch_size=500):
+    """
+    Move one batch of the blog's articles from `source` to `target`.
+
+    Rows are upserted on the target first, then deleted from the source
+    only if they were not saved again after the copy started; those are
+    copied again by a later batch. Returns the number of rows copied.
+    """
+    started = timezone.now()
+    rows = list(
+        Article._base_manager.using(source).filter(blog_id=blog_id).order_by('pk').values(*_ARTICLE_FIELDS)[:batch_size]
+    )
+    if not rows:
+        return 0
+    _copy_rows(rows, source, target)
+    with transaction.atomic(using=source):
+        Article._base_manager.using(source).filter(
+            id__in=[row['id'] for row in rows], updated_at__lte=started,
+        )._raw_delete(source)
+    return len(rows)
+
+
+def follow_blog(article):
+    """After an article was saved under another blog, move it to that blog's database if it is not there"""
+    source = article._state.db
+    if source in read_aliases(article.blog_id):
+        return
+    target = write_alias(article.blog_id)
+    _copy_rows(list(Article._base_manager.using(source).filter(pk=article.pk).values(*_ARTICLE_FIELDS)), source, target)
+    Article._base_manager.using(source).filter(pk=article.pk)._raw_delete(source)
+    article._state.db = target
+
+
+def move_blog(blog_id, target, batch_size=500, pause=0.0):
+    """
+    Move a blog's articles to `target` in batches; returns the number copied.
+
+    New articles go straight to the target as soon as the move starts, and
+    reads cover both databases until it is done, so the blog stays usable
+    throughout. Safe to re-run after an interruption.
+    """
+    if target not in all_aliases():
+        raise ValueError(f"Unknown article database {target!r}; expected one of {', '.join(all_aliases())}")
+    blog = Blog.objects.get(pk=blog_id)
+    entry, _ = BlogShard.objects.get_or_create(blog=blog, defaults={'alias': PRIMARY})
+    source = entry.alias
+    if entry.moving_to and target not in (entry.alias, entry.moving_to):
+        raise ValueError(f"Blog {blog_id} is still moving to {entry.moving_to}; finish that move first")
+    if source == target:
+        if entry.moving_to:
+            # A move back to where the rows came from: the move in progress is the one to finish
+            source, target = entry.moving_to, source
+        else:
+            return 0
+    BlogShard.objects.filter(pk=blog.pk).update(alias=source, moving_to=target, updated_at=timezone.now())
+    forget_placement(blog.pk)
+    if entry.moving_to != target:
+        # Other processes may still place new articles on the source only until their cached entry expires
+        time.sleep(_cache_seconds())
+    copied = 0
+    while True:
+        moved = copy_batch(blog.pk, source, target, batch_size)
+        copied += moved
+        if not moved:
+            break
+        if pause:
+            time.sleep(pause)
+    # Processes that still see the move write to the target and read both, which stays correct
+    BlogShard.objects.filter(pk=blog.pk).update(alias=target, moving_to='', updated_at=timezone.now())
+    forget_placement(blog.pk)
+    FeedDocument.objects.filter(blog=blog).update(stale=True)
+    logger.info(f"Moved {copied} article(s) of blog {blog.pk} from {source} to {target}")
+    return copied
+
+
+def shard_counts():
+    """{alias: number of articles} over every article database"""
+    return {alias: Article._base_manager.using(alias).count() for alias in all_aliases()}
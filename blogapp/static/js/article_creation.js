@@ -0,0 +1,112 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const generateBtn = document.getElementById('generate-btn');
+    const keywordInput = document.getElementById('keyword-input');
+    const blogSelectAI = document.getElementById('blog-select-ai');
+    const titleInput = document.getElementById('title-input');
+    const contentTextarea = document.getElementById('content-textarea');
+    const blogSelect = document.getElementById('blog');
+    const aiMessages = document.getElementById('ai-messages');
+    const generateText = document.getElementById('generate-text');
+    const loadingText = document.getElementById('loading-text');
+    const statusSelect = document.getElementById('status');
+    const publishAtGroup = document.getElementById('publish-at-group');
+
+    function togglePublishAt() {
+        publishAtGroup.style.display = statusSelect.value === 'scheduled' ? 'block' : 'none';
+    }
+    statusSelect.addEventListener('change', togglePublishAt);
+    togglePublishAt();
+
+    generateBtn.addEventListener('click', function() {
+        const keyword = keywordInput.value.trim();
+        
+        if (!keyword) {
+            showAIMessage('Please enter a keyword for article generation.', 'error');
+            return;
+        }
+
+        generateBtn.disabled = true;
+        generateText.style.display = 'none';
+        loadingText.style.display = 'inline';
+        clearAIMessages();
+        const requestData = {
+            keyword: keyword,
+            blog_id: blogSelectAI.value
+        };
+        fetch(generateBtn.dataset.url, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]').value,
+                'X-Requested-With': 'XMLHttpRequest'
+            },
+            body: JSON.stringify(requestData)
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.success) {
+                titleInput.value = data.title;
+                contentTextarea.value = data.content;
+                if (blogSelectAI.value) {
+                    blogSelect.value = blogSelectAI.value;
+                }
+                
+                showAIMessage('Article generated successfully! Review and edit as needed.', 'success');
+                if (data.near_duplicates && data.near_duplicates.length) {
+                    showDuplicateWarning(data.near_duplicates);
+                }
+                contentTextarea.scrollIntoView({ behavior: 'smooth', block: 'center' });
+            } else {
+                showAIMessage('Error: ' + data.error, 'error');
+            }
+        })
+        .catch(error => {
+            console.error('Error:', error);
+            showAIMessage('An unexpected error occurred. Please try again.', 'error');
+        })
+        .finally(() => {
+            generateBtn.disabled = false;
+            generateText.style.display = 'inline';
+            loadingText.style.display = 'none';
+        });
+    });
+
+    keywordInput.addEventListener('keypress', function(e) {
+        if (e.key === 'Enter') {
+            e.preventDefault();
+            generateBtn.click();
+        }
+    });
+
+    function showAIMessage(message, type) {
+        clearAIMessages();
+        const messageDiv = document.createElement('div');
+        messageDiv.className = type === 'success' ? 'alert alert-success' : 'alert alert-danger';
+        messageDiv.style.padding = '8px 12px';
+        messageDiv.style.marginTop = '10px';
+        messageDiv.style.borderRadius = '4px';
+        messageDiv.textContent = message;
+        aiMessages.appendChild(messageDiv);
+        if (type === 'success') {
+            setTimeout(() => {
+                messageDiv.remove();
+            }, 5000);
+        }
+    }
+
+    function showDuplicateWarning(duplicates) {
+        const warningDiv = document.createElement('div');
+        warningDiv.className = 'alert alert-warning';
+        warningDiv.style.padding = '8px 12px';
+        warningDiv.style.marginTop = '10px';
+        warningDiv.style.borderRadius = '4px';
+        warningDiv.textContent = 'This looks like a near-duplicate of: ' + duplicates.map(
+            d => d.title + ' (' + d.blog + ', ' + Math.round(d.similarity * 100) + '% similar)'
+        ).join('; ');
+        aiMessages.appendChild(warningDiv);
+    }
+
+    function clearAIMessages() {
+        aiMessages.innerHTML = '';
+    }
+});
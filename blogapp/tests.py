@@ -1,3 +1,1527 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import importlib
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+import orjson
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.paginator import EmptyPage
+from django.db import connections, transaction
+from django.db.models import CASCADE, QuerySet
+from django.db.models.signals import post_save, pre_delete
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from blogapp import (
+    admin_utils, admission, api, archive, deletion, feeds, fields, fingerprints, health, http_cache, outbox, profiling, prompts, rendering, resilience, revisions, routers,
+    scheduling, services, sharding, views,
+)
+from blogapp.management.commands.blog_health_stub import StubServer
+from blogapp.admin import BlogAdmin
+from blogapp.middleware import AdmissionControlMiddleware, ReplicaPinningMiddleware, StaticAssetMiddleware
+from blogapp.models import (
+    ApiToken, ArchivedArticle, ArchivedArticleRevision, Article, ArticleIdSequence, ArticleRevision, Blog, BlogHealth,
+    BlogShard, Category, FeedDocument, OutboxConsumer, OutboxEvent, PromptTemplate, RelatedArticle, RequestProfile,
+    UserProfile,
+)
+
+# Cumulative microseconds allowed for importing the URLconf in a fresh interpreter
+URLCONF_IMPORT_BUDGET_US = 500_000
+
+
+class ImportTimeBudgetTests(SimpleTestCase):
+    """Guard worker boot time: the URLconf must not pull in the AI client"""
+
+    def _importtime(self):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='myproject.settings')
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c',
+             'import django; django.setup(); import myproject.urls'],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+        )
+        timings = {}
+        for line in result.stderr.splitlines():
+            match = re.match(r'import time:\s+\d+ \|\s+(\d+) \|\s*(\S+)$', line)
+            if match:
+                timings[match.group(2)] = int(match.group(1))
+        return timings
+
+    def test_urlconf_does_not_import_generativeai(self):
+        timings = self._importtime()
+        heavy = [name for name in timings if name.startswith(('google.generativeai', 'grpc'))]
+        self.assertEqual(heavy, [])
+
+    def test_urlconf_does_not_import_numpy(self):
+        timings = self._importtime()
+        heavy = [name for name in timings if name.startswith(('numpy', 'scipy'))]
+        self.assertEqual(heavy, [])
+
+    def test_urlconf_import_within_budget(self):
+        timings = self._importtime()
+        self.assertLess(timings['myproject.urls'], URLCONF_IMPORT_BUDGET_US)
+
+
+class BlogHealthTests(TestCase):
+    """Probes against a local stub server (manage.py blog_health_stub)"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stub = StubServer(slow_seconds=0.3, hang_seconds=3.0).start()
+        cls.addClassCleanup(cls.stub.stop)
+
+    def probe(self, urls, **options):
+        options = {'timeout': 1.0, 'slow_ms': 150, **options}
+        targets = [(i, url, 'user', 'key') for i, url in enumerate(urls)]
+        return asyncio.run(health.probe_all(targets, **options))
+
+    def test_classification(self):
+        behaviours = ['ok', 'slow', 'auth', 'forbidden', 'error', 'hang']
+        results = self.probe([self.stub.url(name) for name in behaviours])
+        self.assertEqual(
+            [(result.status, result.status_code) for result in results],
+            [('ok', 200), ('slow', 200), ('auth', 401), ('auth', 403), ('error', 500), ('down', None)],
+        )
+        ok, slow, auth = results[:3]
+        self.assertLess(ok.latency_ms, 150)
+        self.assertGreaterEqual(slow.latency_ms, 300)
+        self.assertEqual((ok.error, slow.error), ('', ''))
+        self.assertEqual(auth.error, 'HTTP 401 Unauthorized')
+        self.assertEqual((results[-1].error, results[-1].latency_ms), ('Timed out', None))
+
+    def test_unreachable_host_is_down(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        [result] = self.probe([f"http://127.0.0.1:{port}/ok"])
+        self.assertEqual((result.status, result.status_code), ('down', None))
+        self.assertTrue(result.error)
+
+    def test_per_host_limit(self):
+        # A server of its own: requests left hanging by other tests still count as in flight
+        stub = StubServer(slow_seconds=0.2).start()
+        self.addCleanup(stub.stop)
+        results = self.probe([stub.url('slow')] * 6, per_host=2, slow_ms=5000)
+        self.assertEqual({result.status for result in results}, {'ok'})
+        self.assertEqual(stub.max_in_flight[stub.base_url.split('//', 1)[1]], 2)
+
+    @override_settings(BLOG_HEALTH_HISTORY=3)
+    def test_history_is_capped(self):
+        user = User.objects.create_user('health', 'health@example.com', 'pw')
+        good = Blog.objects.create(user=user, name='good', url=self.stub.url('ok'), username='u', apikey='k')
+        bad = Blog.objects.create(user=user, name='bad', url=self.stub.url('error'), username='u', apikey='k')
+        for _ in range(5):
+            counts = health.check_blogs(Blog.objects.all(), timeout=1.0)
+        self.assertEqual(counts, {'ok': 1, 'error': 1})
+        good_health, bad_health = BlogHealth.objects.get(blog=good), BlogHealth.objects.get(blog=bad)
+        self.assertEqual(len(good_health.history), 3)
+        self.assertEqual([status for _, _, status in bad_health.history], ['error'] * 3)
+        self.assertEqual((good_health.consecutive_failures, bad_health.consecutive_failures), (0, 5))
+        self.assertIsNotNone(good_health.last_ok_at)
+        self.assertIsNone(bad_health.last_ok_at)
+
+
+class ScheduledPublishingTests(TestCase):
+    # The blog's articles may be placed on a shard (SQLITE_SHARD_PATHS)
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('scheduler', 'scheduler@example.com', 'pw')
+        cls.blog = Blog.objects.create(user=cls.user, name='scheduled', url='https://example.com', username='u', apikey='k')
+        cls.alias = sharding.write_alias(cls.blog.pk)
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.articles = Article.objects.using(self.alias)
+
+    def article(self, status='scheduled', minutes=-5):
+        return Article.objects.create(
+            user=self.user, blog=self.blog, title='t', content='c', status=status,
+            publish_at=self.now + timedelta(minutes=minutes),
+        )
+
+    def test_publishes_due_articles_in_batches(self):
+        due = [self.article(minutes=-i) for i in range(1, 6)]
+        future = self.article(minutes=5)
+        draft = self.article(status='draft')
+        self.assertEqual(
+            [scheduling.publish_due_batch(self.now, batch_size=2, using=self.alias) for _ in range(4)],
+            [2, 2, 1, 0],
+        )
+        published = self.articles.filter(status='published')
+        self.assertEqual(set(published.values_list('id', flat=True)), {article.pk for article in due})
+        self.assertEqual(set(published.values_list('published_at', flat=True)), {self.now})
+        future.refresh_from_db()
+        draft.refresh_from_db()
+        self.assertEqual((future.status, draft.status), ('scheduled', 'draft'))
+
+    def test_oldest_due_go_first(self):
+        late = self.article(minutes=-1)
+        early = self.article(minutes=-10)
+        scheduling.publish_due_batch(self.now, batch_size=1, using=self.alias)
+        self.assertEqual(list(self.articles.filter(status='published').values_list('id', flat=True)), [early.pk])
+        late.refresh_from_db()
+        self.assertEqual(late.status, 'scheduled')
+
+    def test_rows_published_by_another_worker_are_not_counted(self):
+        mine = self.article()
+        # Leased by this worker but flipped by another one first: without row
+        # locks (SQLite) only the conditional UPDATE keeps the batch honest
+        theirs = self.article(status='published')
+        stale_lease = lambda now, using: Article.objects.using(using).filter(publish_at__lte=now)
+        before = OutboxEvent.objects.using(self.alias).count()
+        with mock.patch.object(scheduling, 'due_articles', stale_lease):
+            self.assertEqual(scheduling.publish_due_batch(self.now, using=self.alias), 1)
+        events = OutboxEvent.objects.using(self.alias).order_by('id')[before:]
+        self.assertEqual([(event.aggregate_id, event.event_type) for event in events], [(mine.pk, 'updated')])
+        self.assertEqual(events[0].payload['previous'], {'blog_id': self.blog.pk, 'status': 'scheduled'})
+        theirs.refresh_from_db()
+        self.assertNotEqual(theirs.published_at, self.now)
+
+    def test_due_scan_uses_the_partial_index(self):
+        plan = scheduling.due_articles(self.now, self.alias).order_by('publish_at').explain()
+        self.assertIn('article_scheduled_idx', plan)
+
+    def test_lease_skips_locked_rows(self):
+        self.article()
+        select_for_update = QuerySet.select_for_update
+        with mock.patch.object(QuerySet, 'select_for_update', autospec=True, side_effect=select_for_update) as lease, \
+                CaptureQueriesContext(connections[self.alias]) as queries:
+            scheduling.publish_due_batch(self.now, using=self.alias)
+        lease.assert_called_once()
+        self.assertEqual(lease.call_args.kwargs, {'skip_locked': True})
+        if connections[self.alias].features.has_select_for_update_skip_locked:
+            self.assertTrue(any('SKIP LOCKED' in query['sql'] for query in queries))
+
+
+class OutboxTests(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('outbox', 'outbox@example.com', 'pw')
+        cls.blog = Blog.objects.create(user=cls.user, name='outbox', url='https://example.com', username='u', apikey='k')
+        cls.alias = sharding.write_alias(cls.blog.pk)
+
+    def setUp(self):
+        # Only the consumers registered by each test
+        registry = mock.patch.dict(outbox._consumers, clear=True)
+        registry.start()
+        self.addCleanup(registry.stop)
+        self.received = []
+
+    def events(self):
+        return OutboxEvent.objects.using(self.alias).filter(aggregate_type='article').order_by('id')
+
+    def register(self, name='test', aggregates=('article',), fail_times=0):
+        failures = [fail_times]
+
+        def handler(events):
+            if failures[0]:
+                failures[0] -= 1
+                raise RuntimeError('consumer down')
+            self.received.append([(event.aggregate_id, event.event_type) for event in events])
+
+        outbox.consumer(name, aggregates=aggregates)(handler)
+
+    def test_events_are_written_with_the_change(self):
+        article = Article.objects.create(user=self.user, blog=self.blog, title='t', content='c', status='draft')
+        article.status = 'published'
+        article.save()
+        pk = article.pk
+        article.delete()
+        with self.assertRaises(RuntimeError), transaction.atomic(using=self.alias):
+            Article.objects.create(user=self.user, blog=self.blog, title='rolled back', content='c')
+            raise RuntimeError
+        events = list(self.events())
+        self.assertEqual([(event.aggregate_id, event.event_type) for event in events],
+                         [(pk, 'created'), (pk, 'updated'), (pk, 'deleted')])
+        self.assertEqual(events[1].payload['previous'], {'blog_id': self.blog.pk, 'status': 'draft'})
+
+    def test_delivery_in_order_with_a_position_per_consumer(self):
+        first = Article.objects.create(user=self.user, blog=self.blog, title='a', content='c')
+        second = Article.objects.create(user=self.user, blog=self.blog, title='b', content='c')
+        first.title = 'a2'
+        first.save()
+        self.register('articles')
+        self.register('blogs', aggregates=('blog',))
+        delivered = []
+        while outbox.deliver('articles', batch_size=2, alias=self.alias):
+            delivered.extend(event for batch in self.received for event in batch)
+            self.received.clear()
+        self.assertEqual(delivered, [(first.pk, 'created'), (second.pk, 'created'), (first.pk, 'updated')])
+        newest = OutboxEvent.objects.using(self.alias).order_by('id').last().pk
+        self.assertEqual(OutboxConsumer.objects.get(pk=outbox.position_key('articles', self.alias)).position, newest)
+        # The other consumer has not moved, and skips the article events on its own position
+        self.assertFalse(OutboxConsumer.objects.filter(pk=outbox.position_key('blogs', self.alias), position__gt=0).exists())
+        while outbox.deliver('blogs', alias=self.alias):
+            pass
+        # The blog's own event shares the outbox only when its articles live on `default`
+        self.assertEqual(self.received, [[(self.blog.pk, 'created')]] if self.alias == sharding.PRIMARY else [])
+        self.assertEqual(OutboxConsumer.objects.get(pk=outbox.position_key('blogs', self.alias)).position, newest)
+
+    def test_failed_batch_is_redelivered(self):
+        article = Article.objects.create(user=self.user, blog=self.blog, title='a', content='c')
+        self.register(fail_times=1)
+        now = timezone.now()
+        with self.assertLogs('blogapp.outbox', 'ERROR'):
+            self.assertEqual(outbox.deliver('test', now=now, alias=self.alias), 0)
+        state = OutboxConsumer.objects.get(pk=outbox.position_key('test', self.alias))
+        self.assertEqual((state.position, state.failures), (0, 1))
+        self.assertIn('consumer down', state.last_error)
+        # Backing off: nothing is delivered before retry_at
+        self.assertEqual(outbox.deliver('test', now=state.retry_at - timedelta(seconds=1), alias=self.alias), 0)
+        self.assertEqual(self.received, [])
+        # Then the same events again
+        self.assertTrue(outbox.deliver('test', now=state.retry_at, alias=self.alias))
+        self.assertEqual(self.received, [[(article.pk, 'created')]])
+        state.refresh_from_db()
+        self.assertEqual((state.position, state.failures, state.retry_at), (self.events().last().pk, 0, None))
+
+    def test_delivery_stops_at_a_recent_gap(self):
+        now = timezone.now()
+        recent = [SimpleNamespace(pk=pk, created_at=now) for pk in (1, 2, 4)]
+        self.assertEqual([event.pk for event in outbox.visible_prefix(recent, 0, now, 60)], [1, 2])
+        old = [SimpleNamespace(pk=pk, created_at=now - timedelta(seconds=120)) for pk in (1, 2, 4)]
+        self.assertEqual([event.pk for event in outbox.visible_prefix(old, 0, now, 60)], [1, 2, 4])
+
+
+class ShardingTests(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('sharding', 'sharding@example.com', 'pw')
+        cls.blog = Blog.objects.create(user=cls.user, name='sharded', url='https://example.com', username='u', apikey='k')
+
+    def setUp(self):
+        # Ids reserved by earlier tests belong to a sequence row that was rolled back
+        sharding._id_block[:] = [0, 0]
+        self.addCleanup(sharding._id_block.__setitem__, slice(None), [0, 0])
+        # Likewise the placements cached by a test whose BlogShard changes were rolled back
+        sharding.forget_placement()
+        self.addCleanup(sharding.forget_placement)
+
+    def article(self, blog=None, **fields):
+        fields.setdefault('title', 't')
+        return Article.objects.create(user=self.user, blog=blog or self.blog, content='c', **fields)
+
+    def test_relations_are_only_unconstrained_when_sharded(self):
+        for shards in ([], ['shard1']):
+            with override_settings(ARTICLE_SHARDS=shards):
+                field = fields.ShardableForeignKey(Blog, on_delete=CASCADE)
+                self.assertEqual(field.db_constraint, not shards)
+                # Migrations are the same either way
+                self.assertNotIn('db_constraint', field.deconstruct()[3])
+
+    def test_ids_come_from_the_shared_sequence_above_existing_rows(self):
+        self.article(id=4000)
+        ArticleIdSequence.objects.all().delete()
+        self.assertEqual(sharding.next_article_id(), 4001)
+        ids = [sharding.next_article_id() for _ in range(sharding.ID_BLOCK_SIZE + 5)]
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertEqual(ArticleIdSequence.objects.get().next_value, 4001 + 2 * sharding.ID_BLOCK_SIZE)
+        if sharding.is_enabled():
+            other = Blog.objects.create(user=self.user, name='other', url='https://example.org', username='u', apikey='k')
+            created = [self.article(blog=blog).pk for blog in (self.blog, other) for _ in range(3)]
+            self.assertFalse(set(created) & set(ids))
+            every = [
+                pk for alias in sharding.all_aliases()
+                for pk in Article.objects.using(alias).values_list('id', flat=True)
+            ]
+            self.assertEqual(len(set(every)), len(every))
+
+    def test_ids_are_unique_across_threads(self):
+        reserved = []
+
+        def reserve(count):
+            # Called under the id lock; a stand-in for the sequence row on `default`
+            reserved.append(count)
+            return 1 + sum(reserved[:-1])
+
+        taken = []
+        with mock.patch.object(sharding, '_reserve_ids', reserve):
+            threads = [
+                threading.Thread(target=lambda: taken.extend(sharding.next_article_id() for _ in range(250)))
+                for _ in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(sorted(taken), list(range(1, 1001)))
+        self.assertEqual(len(reserved), 1000 // sharding.ID_BLOCK_SIZE)
+
+    def test_merge_keeps_the_newest_copy_once(self):
+        now = timezone.now()
+
+        def row(pk, minutes, updated=0):
+            return SimpleNamespace(
+                pk=pk, created_at=now - timedelta(minutes=minutes), updated_at=now - timedelta(minutes=updated),
+            )
+
+        stale, fresh = row(2, 20, updated=10), row(2, 20, updated=1)
+        source = [row(1, 10), stale, row(3, 30)]
+        target = [fresh, row(4, 40)]
+        merged = sharding.merge([source, target], key=lambda obj: obj.created_at, reverse=True)
+        self.assertEqual([obj.pk for obj in merged], [1, 2, 3, 4])
+        self.assertIs(merged[1], fresh)
+
+    @skipUnless(sharding.shard_aliases(), "needs SQLITE_SHARD_PATHS")
+    def test_reads_cover_both_databases_while_a_blog_moves(self):
+        source = sharding.write_alias(self.blog.pk)
+        target = next(alias for alias in sharding.all_aliases() if alias != source)
+        articles = [self.article(title=f'a{i}') for i in range(3)]
+        BlogShard.objects.filter(blog=self.blog).update(alias=source, moving_to=target)
+        # As if this process's cached placement had expired
+        sharding.forget_placement(self.blog.pk)
+        # Copied, but saved again on the source before the batch could delete it
+        sharding._copy_rows(list(Article.objects.using(source).filter(pk=articles[0].pk).values(*sharding._ARTICLE_FIELDS)), source, target)
+        Article.objects.using(source).filter(pk=articles[0].pk).update(title='edited', updated_at=timezone.now())
+        self.assertEqual(sharding.write_alias(self.blog.pk), target)
+        self.assertEqual(sharding.read_aliases(self.blog.pk), [target, source])
+        merged = sharding.merge(sharding.blog_querysets(self.blog.pk), key=lambda obj: obj.created_at, reverse=True)
+        self.assertEqual(sorted(obj.pk for obj in merged), sorted(obj.pk for obj in articles))
+        self.assertEqual(next(obj.title for obj in merged if obj.pk == articles[0].pk), 'edited')
+        self.assertEqual(sharding.find_article(pk=articles[0].pk).title, 'edited')
+
+    @skipUnless(sharding.shard_aliases(), "needs SQLITE_SHARD_PATHS")
+    def test_placements_are_cached_and_a_move_waits_them_out(self):
+        source = sharding.write_alias(self.blog.pk)
+        target = next(alias for alias in sharding.all_aliases() if alias != source)
+        # The first write looks the blog up and reserves a block of ids on default; the next ones need neither
+        self.article()
+        with self.assertNumQueries(0, using='default'):
+            self.assertEqual(sharding.write_alias(self.blog.pk), source)
+            self.article()
+        with mock.patch.object(sharding.time, 'sleep') as sleep:
+            sharding.move_blog(self.blog.pk, target)
+        sleep.assert_called_once_with(settings.SHARD_MAP_CACHE_SECONDS)
+        self.assertEqual(sharding.write_alias(self.blog.pk), target)
+
+    @skipUnless(sharding.shard_aliases(), "needs SQLITE_SHARD_PATHS")
+    @override_settings(SHARD_MAP_CACHE_SECONDS=0)
+    def test_rebalance_moves_a_blog_in_batches(self):
+        source = sharding.write_alias(self.blog.pk)
+        target = next(alias for alias in sharding.all_aliases() if alias != source)
+        articles = [self.article(status='published') for _ in range(5)]
+        created = dict(Article.objects.using(source).values_list('id', 'created_at'))
+        FeedDocument.objects.create(blog=self.blog, kind='rss', part=0, stale=False)
+        out = StringIO()
+        call_command('rebalance_shards', '--blog', str(self.blog.pk), '--to', target, '--batch-size', '2',
+                     '--pause', '0', stdout=out)
+        self.assertIn(f"moved 5 article(s) to {target}", out.getvalue())
+        self.assertFalse(Article.objects.using(source).filter(blog_id=self.blog.pk).exists())
+        self.assertEqual(dict(Article.objects.using(target).values_list('id', 'created_at')), created)
+        self.assertEqual(
+            BlogShard.objects.filter(blog=self.blog).values_list('alias', 'moving_to').get(), (target, ''),
+        )
+        self.assertTrue(FeedDocument.objects.get(blog=self.blog).stale)
+        # New articles follow the blog
+        self.assertEqual(self.article()._state.db, target)
+        self.assertEqual(len(articles) + 1, Article.objects.using(target).count())
+
+    @skipUnless(sharding.shard_aliases(), "needs SQLITE_SHARD_PATHS")
+    @override_settings(SHARD_MAP_CACHE_SECONDS=0)
+    def test_pending_events_move_with_their_articles(self):
+        source = sharding.write_alias(self.blog.pk)
+        target = next(alias for alias in sharding.all_aliases() if alias != source)
+        received = []
+        registry = mock.patch.dict(outbox._consumers, clear=True)
+        registry.start()
+        self.addCleanup(registry.stop)
+        outbox.consumer('test', aggregates=['article'])(
+            lambda events: received.extend((event.aggregate_id, event.event_type) for event in events)
+        )
+        first, second = self.article(title='a'), self.article(title='b')
+        first.title = 'a2'
+        first.save()
+        # The consumer has handled the first event only when the move starts
+        outbox.deliver('test', batch_size=1, alias=source)
+        with self.captureOnCommitCallbacks(using=target, execute=True):
+            sharding.move_blog(self.blog.pk, target, batch_size=1)
+        moved = Article.objects.using(target).get(pk=first.pk)
+        moved.title = 'a3'
+        moved.save()
+        self.assertEqual(
+            list(OutboxEvent.objects.using(source).filter(aggregate_type='article').values_list('aggregate_id', flat=True)),
+            [first.pk],
+        )
+        outbox.dispatch()
+        self.assertEqual(received, [
+            (first.pk, 'created'), (first.pk, 'updated'), (second.pk, 'created'), (first.pk, 'updated'),
+        ])
+
+
+class FakeClock:
+    """Moves `step` seconds forward every time it is read"""
+
+    def __init__(self, step):
+        self.step = step
+        self.now = 0.0
+
+    def __call__(self):
+        value = self.now
+        self.now += self.step
+        return value
+
+
+class AdmissionTests(SimpleTestCase):
+    def controller(self, step=0.25, shared=0, **limit):
+        limit.setdefault('concurrency', 1)
+        return admission.AdmissionController({admission.AI: admission.Limit(**limit)}, shared, clock=FakeClock(step))
+
+    def wait_for_queue(self, controller, route_class, waiting):
+        for _ in range(500):
+            if controller.snapshot().get(route_class, (0, 0))[1] == waiting:
+                return
+            threading.Event().wait(0.01)
+        self.fail(f"{route_class} never had {waiting} waiting")
+
+    def assertRejected(self, controller, reason, status, client=None):
+        with self.assertRaises(admission.Rejected) as caught:
+            controller.acquire(admission.AI, client)
+        self.assertEqual((caught.exception.reason, caught.exception.status), (reason, status))
+        return caught.exception
+
+    def test_unlimited_classes_are_only_counted(self):
+        controller = self.controller()
+        for _ in range(3):
+            self.assertEqual(controller.acquire(admission.READ), 0.0)
+        self.assertEqual(controller.snapshot()[admission.READ], (3, 0))
+        controller.release(admission.READ)
+        self.assertEqual(controller.snapshot()[admission.READ], (2, 0))
+
+    def test_queue_full_is_rejected_at_once(self):
+        controller = self.controller(queue=0, retry_after=7)
+        controller.acquire(admission.AI)
+        rejected = self.assertRejected(controller, 'queue_full', 503)
+        self.assertEqual(rejected.retry_after, 7)
+        controller.release(admission.AI)
+        self.assertEqual(controller.acquire(admission.AI), 0.0)
+
+    def test_waiting_past_the_deadline_times_out(self):
+        # Every read of the clock is past the deadline, so nothing really waits
+        controller = self.controller(step=5.0, queue=1, wait_seconds=1.0)
+        controller.acquire(admission.AI)
+        self.assertRejected(controller, 'timeout', 503)
+        self.assertEqual(controller.snapshot()[admission.AI], (1, 0))
+
+    def test_a_released_slot_goes_to_the_waiting_request(self):
+        controller = self.controller(queue=1, wait_seconds=30.0)
+        controller.acquire(admission.AI)
+        result = {}
+        waiter = threading.Thread(target=lambda: result.update(waited=controller.acquire(admission.AI)))
+        waiter.start()
+        self.wait_for_queue(controller, admission.AI, 1)
+        # The queue is full now
+        self.assertRejected(controller, 'queue_full', 503)
+        controller.release(admission.AI)
+        waiter.join(5)
+        # Three clock reads: the start, one check before waiting, the end
+        self.assertEqual(result, {'waited': 0.5})
+        self.assertEqual(controller.snapshot()[admission.AI], (1, 0))
+
+    def test_per_client_limit_answers_429(self):
+        controller = self.controller(concurrency=5, per_client=2)
+        controller.acquire(admission.AI, 'user:1')
+        controller.acquire(admission.AI, 'user:1')
+        self.assertRejected(controller, 'per_client', 429, client='user:1')
+        controller.acquire(admission.AI, 'user:2')
+        controller.release(admission.AI, 'user:1')
+        controller.acquire(admission.AI, 'user:1')
+        self.assertEqual(controller.snapshot()[admission.AI], (3, 0))
+
+    def test_shared_cap_counts_every_limited_class(self):
+        controller = admission.AdmissionController(
+            {admission.AI: admission.Limit(2), admission.BULK: admission.Limit(2)}, shared=2, clock=FakeClock(0.25),
+        )
+        controller.acquire(admission.AI)
+        controller.acquire(admission.BULK)
+        with self.assertRaises(admission.Rejected) as caught:
+            controller.acquire(admission.AI)
+        self.assertEqual((caught.exception.reason, caught.exception.status), ('saturated', 503))
+        # Unlimited classes are never held back by the cap
+        controller.acquire(admission.READ)
+        controller.release(admission.BULK)
+        controller.acquire(admission.AI)
+        self.assertEqual(controller.snapshot(), {admission.AI: (2, 0), admission.BULK: (0, 0), admission.READ: (1, 0)})
+
+
+@override_settings(ADMISSION_CONTROL_ENABLED=True, ADMISSION_THREADS=0, ADMISSION_LIMITS={'bulk': {'concurrency': 1}})
+class AdmissionMiddlewareTests(SimpleTestCase):
+    def request(self):
+        request = RequestFactory().get('/api/articles/')
+        request.resolver_match = SimpleNamespace(url_name='api_article_list')
+        return request
+
+    def middleware(self, view):
+        def get_response(request):
+            return middleware.process_view(request, view, (), {}) or view(request)
+
+        middleware = AdmissionControlMiddleware(get_response)
+        return middleware
+
+    def running(self):
+        return admission.controller().snapshot().get(admission.BULK, (0, 0))[0]
+
+    def test_plain_responses_release_their_slot_at_once(self):
+        response = self.middleware(lambda request: HttpResponse('ok'))(self.request())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.running(), 0)
+
+    def test_streaming_responses_hold_their_slot_until_closed(self):
+        middleware = self.middleware(lambda request: StreamingHttpResponse(iter([b'a', b'b'])))
+        response = middleware(self.request())
+        self.assertEqual(self.running(), 1)
+        busy = middleware(self.request())
+        self.assertEqual(busy.status_code, 503)
+        self.assertEqual(busy['Retry-After'], '5')
+        self.assertEqual(b''.join(response.streaming_content), b'ab')
+        self.assertEqual(self.running(), 1)
+        response.close()
+        self.assertEqual(self.running(), 0)
+        self.assertEqual(middleware(self.request()).status_code, 200)
+
+    def test_a_failing_view_releases_its_slot(self):
+        def view(request):
+            raise RuntimeError("boom")
+
+        with self.assertRaises(RuntimeError):
+            self.middleware(view)(self.request())
+        self.assertEqual(self.running(), 0)
+
+
+class StaticAssetMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        for name in ('site.css', 'site.0123456789ab.css'):
+            with open(os.path.join(root.name, name), 'w') as f:
+                f.write('body { color: red }')
+        with open(os.path.join(root.name, 'site.css.gz'), 'wb') as f:
+            f.write(gzip.compress(b'body { color: red }'))
+        with override_settings(STATIC_ROOT=root.name, STATIC_URL='/static/'):
+            self.middleware = StaticAssetMiddleware(lambda request: HttpResponse('app', status=404))
+
+    def get(self, name, **headers):
+        return self.middleware(RequestFactory().get(f'/static/{name}', **headers))
+
+    def test_hashed_names_are_immutable_and_unhashed_ones_revalidate(self):
+        hashed = self.get('site.0123456789ab.css')
+        self.assertEqual(hashed['Cache-Control'], 'public, max-age=31536000, immutable')
+        plain = self.get('site.css')
+        self.assertEqual(plain['Cache-Control'], 'public, max-age=300')
+        self.assertFalse(plain.has_header('Content-Disposition'))
+        self.assertEqual(self.get('site.css', HTTP_IF_NONE_MATCH=plain['ETag']).status_code, 304)
+        self.assertEqual(self.get('site.css', HTTP_IF_NONE_MATCH='W/"0-0"').status_code, 200)
+        # If-None-Match wins over a matching If-Modified-Since
+        stale = self.get('site.css', HTTP_IF_NONE_MATCH='W/"0-0"', HTTP_IF_MODIFIED_SINCE=plain['Last-Modified'])
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(self.get('site.css', HTTP_IF_MODIFIED_SINCE=plain['Last-Modified']).status_code, 304)
+
+    def test_precompressed_copies_share_the_etag(self):
+        plain = self.get('site.css')
+        compressed = self.get('site.css', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(compressed['ETag'], plain['ETag'])
+        self.assertEqual(gzip.decompress(b''.join(compressed.streaming_content)), b'body { color: red }')
+
+    def test_missing_files_fall_through(self):
+        self.assertEqual(self.get('missing.css').content, b'app')
+
+
+class GeminiResilienceTests(TestCase):
+    def breaker(self, clock=None, threshold=2):
+        return resilience.CircuitBreaker(
+            'test', failure_threshold=threshold, reset_timeout=10, clock=clock or FakeClock(0),
+        )
+
+    def test_breaker_opens_then_lets_one_trial_through(self):
+        clock = FakeClock(0)
+        breaker = self.breaker(clock)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, breaker.CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, breaker.OPEN)
+        with self.assertRaises(resilience.CircuitOpenError):
+            breaker.before_call()
+        clock.now = 10
+        breaker.before_call()
+        self.assertEqual(breaker.state, breaker.HALF_OPEN)
+        with self.assertRaises(resilience.CircuitOpenError):
+            breaker.before_call()
+        breaker.record_success()
+        self.assertEqual(breaker.state, breaker.CLOSED)
+
+    def test_only_retryable_errors_are_retried(self):
+        calls, sleeps = [], []
+
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise ConnectionError("reset")
+            return 'ok'
+
+        result = resilience.call_resilient(
+            flaky, self.breaker(threshold=5), timeout=5, max_retries=2,
+            is_retryable=lambda error: isinstance(error, ConnectionError), sleep=sleeps.append,
+        )
+        self.assertEqual((result, len(calls), len(sleeps)), ('ok', 3, 2))
+
+        def invalid():
+            raise ValueError("bad input")
+
+        breaker = self.breaker()
+        with self.assertRaises(ValueError):
+            resilience.call_resilient(invalid, breaker, timeout=5, is_failure=lambda error: False, sleep=sleeps.append)
+        self.assertEqual((len(sleeps), breaker.state), (2, breaker.CLOSED))
+
+    def test_hung_calls_fail_fast_once_the_pool_is_full(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        before = resilience.calls_in_flight()
+        for _ in range(2):
+            with self.assertRaises(resilience.CallTimeout):
+                resilience.call_with_deadline(release.wait, 0.05, max_workers=before + 2)
+        self.assertEqual(resilience.calls_in_flight(), before + 2)
+        with self.assertRaisesMessage(resilience.CallTimeout, "busy"):
+            resilience.call_with_deadline(lambda: 'never run', 5, max_workers=before + 2)
+        release.set()
+        for _ in range(200):
+            if resilience.calls_in_flight() == before:
+                break
+            threading.Event().wait(0.01)
+        self.assertEqual(resilience.call_with_deadline(lambda: 'ok', 5, max_workers=before + 2), 'ok')
+
+    @override_settings(GEMINI_USE_FAKE=True, GEMINI_MAX_RETRIES=0)
+    def test_unexpected_errors_are_not_shown_to_the_user(self):
+        service = services.GeminiService()
+        service.model = mock.Mock(**{'generate_content.side_effect': KeyError('internal detail')})
+        with mock.patch.object(services, 'classify_gemini_exception', side_effect=lambda exc: exc), \
+                mock.patch.object(services.gemini_breaker, 'record_failure'), \
+                self.assertLogs('blogapp.services', 'ERROR') as logs:
+            result = service.generate_article('gardening')
+        self.assertFalse(result['success'])
+        self.assertEqual(result['error'], services.GeminiError.user_message)
+        self.assertIn('internal detail', '\n'.join(logs.output))
+
+
+def make_admin(username):
+    user = User.objects.create_user(username, f'{username}@example.com', 'pw')
+    user.profile.role = 'admin'
+    user.profile.save()
+    return user
+
+
+class CategoryTests(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_admin('categories')
+
+    def blog(self, name, category):
+        return Blog.objects.create(
+            user=self.user, name=name, url='https://example.com', username='u', apikey='k', category=category,
+        )
+
+    def test_the_relation_follows_the_json_list(self):
+        blog = self.blog('garden', ['Plants', 'Tools', ''])
+        self.assertEqual(sorted(blog.categories.values_list('name', flat=True)), ['Plants', 'Tools'])
+        blog.category = ['Tools', 'Soil']
+        blog.save()
+        self.assertEqual(sorted(blog.categories.values_list('name', flat=True)), ['Soil', 'Tools'])
+        blog.category = []
+        blog.save()
+        self.assertFalse(blog.categories.exists())
+        # Names are shared, not duplicated per blog
+        self.blog('shed', ['Tools'])
+        self.assertEqual(Category.objects.filter(name='Tools').count(), 1)
+
+    def test_article_list_filters_by_category(self):
+        garden, kitchen = self.blog('garden', ['Plants']), self.blog('kitchen', ['Food'])
+        Article.objects.create(user=self.user, blog=garden, title='Roses', content='c')
+        Article.objects.create(user=self.user, blog=kitchen, title='Bread', content='c')
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('article_list'), {'category': 'Plants'})
+        self.assertEqual([article.title for article in response.context['articles']], ['Roses'])
+        self.assertEqual(sorted(response.context['categories']), ['Food', 'Plants'])
+        response = self.client.get(reverse('blog_registration'), {'category': 'Food'})
+        self.assertEqual([blog.name for blog in response.context['blogs']], ['kitchen'])
+
+
+@override_settings(ARTICLE_REVISION_SNAPSHOT_INTERVAL=3)
+class RevisionTests(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('revisions', 'revisions@example.com', 'pw')
+        cls.blog = Blog.objects.create(user=cls.user, name='revisions', url='https://example.com', username='u', apikey='k')
+
+    def edit_versions(self):
+        paragraph = ' '.join(f"sentence {i} about compost and soil." for i in range(200))
+        versions = [paragraph]
+        for i in range(5):
+            versions.append(versions[-1].replace(f"sentence {i * 7} ", f"line {i * 7} was rewritten "))
+        article = Article.objects.create(user=self.user, blog=self.blog, title='Soil', content=versions[0])
+        revisions.record_revision(article, self.user)
+        for text in versions[1:]:
+            article.content = text
+            article.save()
+            revisions.record_revision(article, self.user)
+        return article, versions
+
+    def stored(self, article):
+        return list(ArticleRevision.objects.filter(article_id=article.pk).order_by('number'))
+
+    def test_deltas_between_snapshots_rebuild_every_version(self):
+        article, versions = self.edit_versions()
+        stored = self.stored(article)
+        self.assertEqual([rev.number for rev in stored], [1, 2, 3, 4, 5, 6])
+        # A snapshot first and then every third revision; small edits in between are deltas
+        self.assertEqual([rev.is_snapshot for rev in stored], [True, False, False, True, False, False])
+        self.assertLess(len(stored[1].data), len(stored[0].data) / 10)
+        self.assertEqual([revisions.revision_content(rev) for rev in stored], versions)
+        self.assertEqual(stored[-1].content_length, len(versions[-1]))
+
+    def test_unchanged_saves_record_nothing(self):
+        article, _ = self.edit_versions()
+        self.assertIsNone(revisions.record_revision(article, self.user))
+        self.assertEqual(len(self.stored(article)), 6)
+
+    def test_pruning_keeps_the_survivors_readable(self):
+        article, versions = self.edit_versions()
+        self.assertEqual(revisions.prune_revisions(article, keep=2), 4)
+        stored = self.stored(article)
+        # The oldest survivor was a delta against a pruned revision; it is rewritten as a snapshot
+        self.assertEqual([(rev.number, rev.is_snapshot) for rev in stored], [(5, True), (6, False)])
+        self.assertEqual([revisions.revision_content(rev) for rev in stored], versions[-2:])
+        self.assertEqual(revisions.prune_revisions(article, keep=1), 1)
+        self.assertEqual(revisions.revision_content(self.stored(article)[0]), versions[-1])
+
+
+@override_settings(ARTICLE_CONTENT_COMPRESSION='zlib', ARTICLE_CONTENT_COMPRESSION_THRESHOLD=100)
+class CompressedContentTests(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('compressed', 'compressed@example.com', 'pw')
+        cls.blog = Blog.objects.create(user=cls.user, name='compressed', url='https://example.com', username='u', apikey='k')
+
+    def stored(self, article):
+        return Article.objects.using(article._state.db).filter(pk=article.pk).values_list('content', flat=True).get()
+
+    def write_legacy(self, article, text):
+        # What a row written before 0005 looks like: text in the BLOB column
+        with connections[article._state.db].cursor() as cursor:
+            cursor.execute("UPDATE blogapp_article SET content = %s WHERE id = %s", [text, article.pk])
+
+    def test_content_round_trips_above_and_below_the_threshold(self):
+        long_text = 'Compost needs air, water and time. ' * 50 + 'Ünïcode ✓'
+        short = Article.objects.create(user=self.user, blog=self.blog, title='short', content='A few words.')
+        long = Article.objects.create(user=self.user, blog=self.blog, title='long', content=long_text)
+        self.assertEqual(bytes(self.stored(short))[:1], fields.RAW)
+        self.assertEqual(bytes(self.stored(long))[:1], fields.ZLIB)
+        self.assertLess(len(self.stored(long)), len(long_text) / 5)
+        self.assertEqual(sharding.find_article(pk=short.pk).content, 'A few words.')
+        self.assertEqual(sharding.find_article(pk=long.pk).content, long_text)
+
+    def test_untouched_content_is_written_back_as_stored(self):
+        article = Article.objects.create(user=self.user, blog=self.blog, title='t', content='soil ' * 100)
+        before = bytes(self.stored(article))
+        loaded = sharding.find_article(pk=article.pk)
+        loaded.title = 'renamed'
+        with mock.patch.object(fields, 'compress_text', side_effect=AssertionError("re-encoded")):
+            loaded.save()
+        self.assertEqual(bytes(self.stored(article)), before)
+
+    def test_legacy_text_rows_read_and_are_converted(self):
+        article = Article.objects.create(user=self.user, blog=self.blog, title='t', content='placeholder')
+        legacy_text = 'Written before compression. ' * 20
+        self.write_legacy(article, legacy_text)
+        self.assertIsInstance(self.stored(article), str)
+        self.assertEqual(sharding.find_article(pk=article.pk).content, legacy_text)
+        migration = importlib.import_module('blogapp.migrations.0022_compress_legacy_content')
+        migration.compress_legacy_content(apps, SimpleNamespace(connection=connections[article._state.db]))
+        self.assertEqual(bytes(self.stored(article))[:1], fields.ZLIB)
+        self.assertEqual(sharding.find_article(pk=article.pk).content, legacy_text)
+
+    def test_command_reencodes_after_a_settings_change(self):
+        article = Article.objects.create(user=self.user, blog=self.blog, title='t', content='mulch ' * 100)
+        with override_settings(ARTICLE_CONTENT_COMPRESSION='none'):
+            call_command('compress_article_content', stdout=StringIO())
+        self.assertEqual(bytes(self.stored(article))[:1], fields.RAW)
+        self.assertEqual(sharding.find_article(pk=article.pk).content, 'mulch ' * 100)
+
+
+class UserBulkActionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = make_admin('bulkadmin')
+        cls.users = [User.objects.create_user(f'member{i}', f'member{i}@example.com', 'pw') for i in range(3)]
+        cls.root = User.objects.create_superuser('root', 'root@example.com', 'pw')
+
+    def post(self, action, users):
+        self.client.force_login(self.admin)
+        return self.client.post(reverse('user_bulk_action'), {
+            'action': action, 'user_ids': [str(user.pk) for user in users],
+        })
+
+    def test_role_change_updates_every_target_but_the_actor_and_superusers(self):
+        self.post('make_admin', [*self.users[:2], self.admin, self.root])
+        roles = dict(UserProfile.objects.values_list('user__username', 'role'))
+        self.assertEqual([roles[f'member{i}'] for i in range(3)], ['admin', 'admin', 'user'])
+        self.assertEqual(roles['root'], 'user')
+        self.post('make_user', [self.users[0], self.admin])
+        self.assertEqual(UserProfile.objects.get(user=self.users[0]).role, 'user')
+        self.assertEqual(UserProfile.objects.get(user=self.admin).role, 'admin')
+
+    def test_role_change_needs_no_receivers_or_events(self):
+        # The single UPDATE skips save(); nothing listening for profile saves may depend on it
+        self.assertFalse(post_save.has_listeners(UserProfile))
+        self.assertEqual({value for value, _ in OutboxEvent.AGGREGATE_CHOICES}, {'article', 'blog'})
+        before = OutboxEvent.objects.count()
+        self.post('make_admin', self.users)
+        self.assertEqual(OutboxEvent.objects.count(), before)
+        # The new role applies from the next request on
+        # Logging in saves the user, and save_user_profile its profile: load both afresh, as a request would
+        self.client.force_login(User.objects.get(pk=self.users[0].pk))
+        self.assertEqual(self.client.get(reverse('article_list')).status_code, 200)
+
+
+class ConditionalPageTests(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_admin('conditional')
+        cls.blog = Blog.objects.create(user=cls.user, name='conditional', url='https://example.com', username='u', apikey='k')
+
+    def setUp(self):
+        self.article = Article.objects.create(user=self.user, blog=self.blog, title='first', content='c')
+        self.client.force_login(self.user)
+
+    def get(self, etag=None, **params):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(reverse('article_list'), params, **headers)
+
+    def test_repeat_visits_get_304_until_the_data_changes(self):
+        first = self.get()
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('private', first['Cache-Control'])
+        self.assertIn('no-cache', first['Cache-Control'])
+        etag = first['ETag']
+        self.assertEqual(self.get(etag).status_code, 304)
+
+        self.article.title = 'edited'
+        self.article.save()
+        edited = self.get(etag)
+        self.assertEqual(edited.status_code, 200)
+        self.assertEqual(self.get(edited['ETag']).status_code, 304)
+
+        # A deletion does not move MAX(updated_at); the count catches it
+        Article.objects.create(user=self.user, blog=self.blog, title='second', content='c')
+        etag = self.get()['ETag']
+        sharding.find_article(title='second').delete()
+        self.assertEqual(self.get(etag).status_code, 200)
+
+    def test_the_etag_covers_the_url_and_the_user(self):
+        etag = self.get()['ETag']
+        self.assertNotEqual(self.get(category='Plants')['ETag'], etag)
+        self.client.force_login(make_admin('someone'))
+        self.assertEqual(self.get(etag).status_code, 200)
+
+    def test_the_blog_page_builds_its_querysets_once_and_tracks_related_links(self):
+        other = Article.objects.create(user=self.user, blog=self.blog, title='neighbour', content='c')
+        url = reverse('blog_view', args=[self.blog.id])
+        with mock.patch('blogapp.views._blog_related_links', wraps=views._blog_related_links) as links:
+            first = self.client.get(url)
+        links.assert_called_once()
+        self.assertNotContains(first, '>neighbour</a>')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        RelatedArticle.objects.create(article_id=self.article.pk, related_id=other.pk, rank=0, score=0.5)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertContains(response, '>neighbour</a>')
+
+    def test_pages_with_pending_messages_render_in_full(self):
+        etag = self.get()['ETag']
+        with mock.patch.object(http_cache.messages, 'get_messages', return_value=['saved']):
+            self.assertEqual(self.get(etag).status_code, 200)
+
+    def test_only_api_responses_are_gzipped(self):
+        page = self.client.get(reverse('article_list'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(page.has_header('Content-Encoding'))
+        _, key = api.issue_token(self.user, 'gzip')
+        response = self.client.get(
+            reverse('api_article_list'), HTTP_ACCEPT_ENCODING='gzip', HTTP_AUTHORIZATION=f'Bearer {key}',
+        )
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        body = gzip.decompress(b''.join(response.streaming_content))
+        self.assertIn(b'"title":"first"', body)
+
+
+class FastDeleteTests(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('deleting', 'deleting@example.com', 'pw')
+        cls.blog = Blog.objects.create(user=cls.user, name='deleting', url='https://example.com', username='u', apikey='k')
+
+    def articles(self, count):
+        articles = [
+            Article.objects.create(user=self.user, blog=self.blog, title=f'a{i}', content='c', status='published')
+            for i in range(count)
+        ]
+        for article in articles:
+            revisions.record_revision(article, self.user)
+        return articles
+
+    def queryset(self, articles):
+        return sharding.on(Article.objects.filter(pk__in=[a.pk for a in articles]), articles[0]._state.db)
+
+    def test_the_bulk_receivers_stand_in_for_the_signals(self):
+        self.assertTrue(deletion.can_fast_delete(Article))
+        articles = self.articles(3)
+        alias = articles[0]._state.db
+        feed = FeedDocument.objects.create(blog=self.blog, kind='rss')
+        # No article is loaded, so none of the per-instance post_delete receivers run
+        bulk = mock.Mock(wraps=deletion.BULK_DELETE_RECEIVERS[Article])
+        with mock.patch.dict(deletion.BULK_DELETE_RECEIVERS, {Article: bulk}):
+            self.assertEqual(deletion.fast_delete(self.queryset(articles)), 3)
+        bulk.assert_called_once()
+        self.assertFalse(sharding.on(Article.objects.filter(blog=self.blog), alias).exists())
+        # Revisions live on default whichever database holds the article
+        self.assertFalse(ArticleRevision.objects.filter(article_id__in=[a.pk for a in articles]).exists())
+        deleted = OutboxEvent.objects.using(alias).filter(aggregate_type='article', event_type='deleted')
+        self.assertEqual(sorted(deleted.values_list('aggregate_id', flat=True)), sorted(a.pk for a in articles))
+        feed.refresh_from_db()
+        self.assertTrue(feed.stale)
+
+    def test_a_delete_listener_in_the_cascade_falls_back_to_the_collector(self):
+        seen = []
+
+        def listener(sender, instance, **kwargs):
+            seen.append(instance.pk)
+
+        pre_delete.connect(listener, sender=ArticleRevision)
+        self.addCleanup(pre_delete.disconnect, listener, sender=ArticleRevision)
+        self.assertFalse(deletion.can_fast_delete(Article))
+        articles = self.articles(2)
+        self.assertEqual(deletion.fast_delete(self.queryset(articles)), 2)
+        self.assertEqual(len(seen), 2)
+        # The regular receivers ran instead of their bulk form
+        alias = articles[0]._state.db
+        self.assertEqual(OutboxEvent.objects.using(alias).filter(event_type='deleted', aggregate_type='article').count(), 2)
+
+    def test_blogs_cascade_through_the_collector(self):
+        # Article's own receivers only have a bulk form when articles are the top of the cascade
+        self.assertFalse(deletion.can_fast_delete(Blog))
+
+    @override_settings(DELETION_INLINE_LIMIT=0, DELETION_BATCH_SIZE=2)
+    def test_large_blogs_are_deleted_in_batches(self):
+        self.articles(5)
+        job = deletion.request_deletion(self.blog)
+        self.assertEqual((job.status, job.total), ('pending', 5))
+        deletion.run_job(deletion.claim_next_job(), pause=0)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.deleted), ('done', 5))
+        self.assertFalse(Blog.objects.filter(pk=self.blog.pk).exists())
+        self.assertFalse(any(Article.objects.using(alias).exists() for alias in sharding.all_aliases()))
+
+
+class ArchiveTests(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('archive', 'archive@example.com', 'pw')
+        cls.blog = Blog.objects.create(user=cls.user, name='archive', url='https://example.com', username='u', apikey='k')
+
+    def article(self, title, archived_days_ago=None):
+        article = Article.objects.create(
+            user=self.user, blog=self.blog, title=title, content=f'{title} body ' * 50,
+            status='archived' if archived_days_ago is not None else 'draft',
+        )
+        revisions.record_revision(article, self.user)
+        if archived_days_ago is not None:
+            sharding.on(Article.objects.filter(pk=article.pk), article._state.db).update(
+                archived_at=timezone.now() - timedelta(days=archived_days_ago),
+            )
+        return article
+
+    @override_settings(ARTICLE_ARCHIVE_AFTER_DAYS=90)
+    def test_only_articles_past_the_window_move_with_their_revisions(self):
+        old, recent, draft = self.article('old', 100), self.article('recent', 10), self.article('draft')
+        self.assertEqual(archive.archive_articles(batch_size=1), 1)
+        self.assertIsNone(sharding.find_article(pk=old.pk))
+        self.assertEqual({a.pk for qs in sharding.blog_querysets(self.blog.id) for a in qs}, {recent.pk, draft.pk})
+        archived = ArchivedArticle.objects.get(pk=old.pk)
+        self.assertEqual(archived.content, old.content)
+        self.assertEqual(archived.created_at, old.created_at)
+        self.assertEqual(ArchivedArticleRevision.objects.filter(article=archived).count(), 1)
+        self.assertFalse(ArticleRevision.objects.filter(article_id=old.pk).exists())
+        # Nothing left to move
+        self.assertEqual(archive.archive_articles(), 0)
+
+    def test_restore_brings_the_article_back_with_its_history(self):
+        old = self.article('old', 100)
+        revision_created = ArticleRevision.objects.get(article_id=old.pk).created_at
+        archive.archive_articles()
+        restored = archive.restore_article(ArchivedArticle.objects.get(pk=old.pk))
+        self.assertEqual(restored.pk, old.pk)
+        self.assertFalse(ArchivedArticle.objects.filter(pk=old.pk).exists())
+        article = sharding.find_article(pk=old.pk)
+        self.assertEqual((article.status, article.content, article.created_at), ('archived', old.content, old.created_at))
+        # A fresh archived_at keeps it out of the next sweep
+        self.assertGreater(article.archived_at, timezone.now() - timedelta(minutes=1))
+        self.assertEqual(archive.archive_articles(), 0)
+        self.assertEqual(ArticleRevision.objects.get(article_id=old.pk).created_at, revision_created)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaPinningTests(SimpleTestCase):
+    # Outside a transaction: reads inside one always stay on the primary
+
+    def setUp(self):
+        self.router = routers.PrimaryReplicaRouter()
+
+    def respond(self, view, method='get', **cookies):
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies)
+        reads = []
+
+        def get_response(request):
+            view()
+            reads.append(self.router.db_for_read(Blog))
+            return HttpResponse()
+
+        return ReplicaPinningMiddleware(get_response)(request), reads[0]
+
+    def write(self):
+        self.router.db_for_write(Blog)
+
+    def test_a_write_pins_the_request_and_the_client(self):
+        response, read = self.respond(lambda: None)
+        self.assertEqual(read, 'replica')
+        self.assertNotIn('db_pin', response.cookies)
+        response, read = self.respond(self.write)
+        self.assertEqual(read, 'default')
+        self.assertIn('db_pin', response.cookies)
+        # The cookie keeps the client's next reads on the primary; so does an unsafe method
+        self.assertEqual(self.respond(lambda: None, db_pin='1')[1], 'default')
+        self.assertEqual(self.respond(lambda: None, method='post')[1], 'default')
+
+    def test_bookkeeping_writes_do_not_pin(self):
+        def bookkeeping():
+            with routers.unpinned_write():
+                self.write()
+
+        response, read = self.respond(bookkeeping)
+        self.assertEqual(read, 'replica')
+        self.assertNotIn('db_pin', response.cookies)
+
+
+class UnpinnedWriteTests(TestCase):
+    databases = '__all__'
+
+    def test_feeds_html_and_token_use_are_bookkeeping(self):
+        user = User.objects.create_user('pinning', 'pinning@example.com', 'pw')
+        blog = Blog.objects.create(user=user, name='pinning', url='https://example.com', username='u', apikey='k')
+        article = Article.objects.create(user=user, blog=blog, title='t', content='c', status='published')
+        _, key = api.issue_token(user, 'pinning')
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {key}')
+        with routers.pinned(False):
+            self.assertIsNotNone(feeds.regenerate(blog.id, 'rss', 0, 'https://example.com'))
+            rendering.html_for(article)
+            self.assertEqual(api.authenticate(request), user)
+            self.assertFalse(routers.has_written())
+            self.assertFalse(routers.is_pinned())
+            routers.PrimaryReplicaRouter().db_for_write(Blog)
+            self.assertTrue(routers.has_written())
+
+
+@override_settings(ADMIN_EXACT_COUNT_LIMIT=5)
+class EstimatedCountPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('counting', 'counting@example.com', 'pw')
+        for i in range(7):
+            Blog.objects.create(user=cls.user, name=f'b{i}', url='https://example.com', username='u', apikey='k')
+
+    def paginator(self):
+        return admin_utils.EstimatedCountPaginator(Blog.objects.filter(user=self.user).order_by('pk'), 2)
+
+    def test_filtered_counts_stop_at_the_cap_but_every_page_is_reachable(self):
+        paginator = self.paginator()
+        self.assertEqual((paginator.count, paginator.count_is_capped), (5, True))
+        # The page holding the rows past the cap is linked
+        self.assertEqual(paginator.num_pages, 4)
+        self.assertEqual([blog.name for blog in paginator.page(4)], ['b6'])
+        # Counted on to the end now, so the last page is known
+        self.assertEqual((paginator.count, paginator.count_is_capped, paginator.num_pages), (7, False, 4))
+        with self.assertRaises(EmptyPage):
+            self.paginator().page(5)
+        # Straight to a page past the cap, as from a bookmarked URL
+        self.assertEqual([blog.name for blog in self.paginator().page(4)], ['b6'])
+
+    def test_small_filtered_counts_are_exact(self):
+        with override_settings(ADMIN_EXACT_COUNT_LIMIT=50):
+            paginator = self.paginator()
+            self.assertEqual((paginator.count, paginator.count_is_capped, paginator.num_pages), (7, False, 4))
+
+    def test_the_changelist_flags_a_capped_count(self):
+        self.client.force_login(self.user)
+        url = reverse('admin:blogapp_blog_changelist')
+        with mock.patch.object(BlogAdmin, 'list_per_page', 2):
+            response = self.client.get(url, {'username': 'counting'})
+            self.assertContains(response, '5+ blogs')
+            response = self.client.get(url, {'username': 'counting', 'p': 4})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([blog.name for blog in response.context['cl'].result_list], ['b0'])
+
+
+class PromptTemplateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('prompts', 'prompts@example.com', 'pw')
+
+    def setUp(self):
+        prompts.clear_cache()
+        self.addCleanup(prompts.clear_cache)
+
+    def version(self, version, body, **fields):
+        return PromptTemplate.objects.create(name='article', version=version, body=body, **fields)
+
+    def test_a_saved_version_cannot_be_edited_in_the_admin(self):
+        template = self.version(2, 'Write about {keyword}.')
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('admin:blogapp_prompttemplate_change', args=[template.pk]), {
+            'name': 'changed', 'version': 9, 'body': 'Something else about {keyword}.',
+            'description': 'tweaked', 'is_active': 'on',
+        })
+        self.assertEqual(response.status_code, 302)
+        template.refresh_from_db()
+        self.assertEqual((template.name, template.version, template.body), ('article', 2, 'Write about {keyword}.'))
+        self.assertEqual(template.description, 'tweaked')
+
+    def test_the_newest_active_version_is_the_default_and_blogs_keep_theirs(self):
+        self.assertEqual(prompts.default_prompt('article').source, 'disk')
+        first = self.version(2, 'Write about {keyword}.')
+        self.assertEqual(prompts.default_prompt('article').version, 2)
+        blog = Blog.objects.create(
+            user=self.user, name='prompts', url='https://example.com', username='u', apikey='k', prompt_template=first,
+        )
+        second = self.version(3, 'Write a post about {keyword}.{categories_context}')
+        self.assertEqual(prompts.default_prompt('article').version, 3)
+        self.assertEqual(prompts.get_prompt('article', blog).version, 2)
+        self.assertNotEqual(prompts.get_prompt('article', blog).key, prompts.default_prompt('article').key)
+        second.is_active = False
+        second.save()
+        self.assertEqual(prompts.default_prompt('article').version, 2)
+
+    def test_unknown_placeholders_are_rejected(self):
+        with self.assertRaises(ValidationError):
+            PromptTemplate(name='article', version=2, body='About {topic}.').full_clean()
+        with self.assertRaises(ValidationError):
+            prompts.validate_template('article', 'About {keyword!r}.')
+        compiled = prompts.compile_template('article', 2, 'About {keyword}.{categories_context}')
+        self.assertEqual(compiled.render(keyword='soil', categories_context=''), 'About soil.')
+
+
+class NearDuplicateTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.random = random.Random(42)
+        self.vocabulary = [f'w{i}' for i in range(5000)]
+
+    def text(self, words=300):
+        return ' '.join(self.random.choices(self.vocabulary, k=words))
+
+    def edited(self, text, every=40):
+        words = text.split()
+        for i in range(0, len(words), every):
+            words[i] = self.random.choice(self.vocabulary)
+        return ' '.join(words)
+
+    def shingles(self, text):
+        tokens = fingerprints.normalize('', text)
+        return {tuple(tokens[i:i + fingerprints.SHINGLE_SIZE]) for i in range(len(tokens) - fingerprints.SHINGLE_SIZE + 1)}
+
+    def signature(self, text):
+        return fingerprints.minhash(fingerprints.normalize('', text))
+
+    def test_signatures_estimate_jaccard_similarity(self):
+        for every in (5, 20, 80):
+            original = self.text()
+            copy = self.edited(original, every)
+            a, b = self.shingles(original), self.shingles(copy)
+            exact = len(a & b) / len(a | b)
+            self.assertAlmostEqual(fingerprints.similarity(self.signature(original), self.signature(copy)), exact, delta=0.12)
+
+    def test_near_copies_share_a_bucket_and_unrelated_texts_do_not(self):
+        recalled = false_hits = 0
+        for _ in range(40):
+            original = self.text()
+            keys = set(fingerprints.band_keys(self.signature(original)))
+            recalled += bool(keys & set(fingerprints.band_keys(self.signature(self.edited(original)))))
+            false_hits += bool(keys & set(fingerprints.band_keys(self.signature(self.text()))))
+        # One word in 40 changed is J ~0.82, which shares a bucket with probability ~0.97
+        self.assertGreaterEqual(recalled, 36)
+        self.assertEqual(false_hits, 0)
+
+    def test_find_near_duplicates_only_looks_at_the_users_articles(self):
+        user, other = (User.objects.create_user(name, f'{name}@example.com', 'pw') for name in ('dupes', 'others'))
+        original = self.text()
+        articles = {}
+        for owner, title, content in (
+            (user, 'copy', self.edited(original)), (user, 'unrelated', self.text()), (other, 'theirs', original),
+        ):
+            blog = Blog.objects.create(user=owner, name=title, url='https://example.com', username='u', apikey='k')
+            articles[title] = Article.objects.create(user=owner, blog=blog, title='Soil', content=content)
+            fingerprints.fingerprint_article(articles[title])
+        matches = fingerprints.find_near_duplicates(user, 'Soil', original, threshold=0.6)
+        self.assertEqual([article.pk for article, _ in matches], [articles['copy'].pk])
+        self.assertGreater(matches[0][1], 0.6)
+        self.assertEqual(fingerprints.find_near_duplicates(user, 'Soil', original, exclude=articles['copy'].pk), [])
+
+
+class FeedTests(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('feeds', 'feeds@example.com', 'pw')
+        cls.blog = Blog.objects.create(user=cls.user, name='feeds', url='https://example.com', username='u', apikey='k')
+
+    def publish(self, title, status='published'):
+        return Article.objects.create(user=self.user, blog=self.blog, title=title, content='c', status=status)
+
+    def feed(self, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(reverse('blog_rss', args=[self.blog.id]), **headers)
+
+    def test_feeds_are_rendered_again_only_after_a_published_change(self):
+        first = self.publish('first')
+        response = self.feed()
+        self.assertContains(response, 'first')
+        etag = response['ETag']
+        self.assertEqual(self.feed(etag).status_code, 304)
+        # Drafts are not in the feed, so they leave it alone
+        self.publish('a draft', status='draft')
+        self.assertFalse(FeedDocument.objects.get(blog=self.blog, kind='rss').stale)
+        self.assertEqual(self.feed(etag).status_code, 304)
+
+        self.publish('second')
+        self.assertTrue(FeedDocument.objects.get(blog=self.blog, kind='rss').stale)
+        response = self.feed(etag)
+        self.assertContains(response, 'second')
+        # Taking an article out of the feed counts too
+        first.status = 'draft'
+        first.save()
+        response = self.feed(response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, '<title>first</title>')
+
+    def test_gzip_clients_get_the_stored_body(self):
+        self.publish('zipped')
+        response = self.client.get(reverse('blog_atom', args=[self.blog.id]), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn(b'zipped', gzip.decompress(response.content))
+
+    @override_settings(SITEMAP_SHARD_SIZE=2)
+    def test_sitemaps_split_at_the_shard_size(self):
+        articles = [self.publish(f'a{i}') for i in range(4)]
+        index = self.client.get(reverse('blog_sitemap_index', args=[self.blog.id]))
+        self.assertEqual(index.content.count(b'<sitemap>'), 2)
+        parts = [self.client.get(reverse('blog_sitemap', args=[self.blog.id, part])) for part in range(3)]
+        self.assertEqual([part.content.count(b'<url>') for part in parts[:2]], [2, 2])
+        self.assertEqual(parts[2].status_code, 404)
+        # Oldest first, so the first shard keeps its URLs as articles are added
+        self.assertIn(f'/{articles[0].pk}/'.encode(), parts[0].content)
+
+        self.publish('a4')
+        index = self.client.get(reverse('blog_sitemap_index', args=[self.blog.id]))
+        self.assertEqual(index.content.count(b'<sitemap>'), 3)
+        self.assertEqual(self.client.get(reverse('blog_sitemap', args=[self.blog.id, 2])).content.count(b'<url>'), 1)
+
+
+class ApiTests(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('api', 'api@example.com', 'pw')
+        cls.other = User.objects.create_user('api-other', 'api-other@example.com', 'pw')
+        cls.token, cls.key = api.issue_token(cls.user, 'tests')
+
+    def setUp(self):
+        self.blogs = [
+            Blog.objects.create(user=self.user, name=f'api{i}', url='https://example.com', username='u', apikey='k')
+            for i in range(2)
+        ]
+        # Alternating blogs, so with shards a page is merged from two databases
+        self.articles = [
+            Article.objects.create(user=self.user, blog=self.blogs[i % 2], title=f'a{i}', content=f'body {i}')
+            for i in range(5)
+        ]
+
+    def get(self, name, *args, key=None, **params):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {key or self.key}'}
+        response = self.client.get(reverse(name, args=args), params, **headers)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, orjson.loads(content)
+
+    def test_the_cursor_walks_every_article_once_in_id_order(self):
+        seen, params = [], {'limit': 2}
+        while True:
+            response, body = self.get('api_article_list', **params)
+            self.assertEqual(response.status_code, 200)
+            seen += [row['id'] for row in body['data']]
+            if not body['next']:
+                break
+            self.assertEqual(response['Link'], f'<{body["next"]}>; rel="next"')
+            params['cursor'] = parse_qs(urlsplit(body['next']).query)['cursor'][0]
+        self.assertEqual(seen, sorted(article.pk for article in self.articles))
+
+    def test_fields_and_include_are_validated(self):
+        _, body = self.get('api_article_list', fields='title', include='blog')
+        self.assertEqual(set(body['data'][0]), {'id', 'title', 'blog'})
+        self.assertEqual(set(body['data'][0]['blog']), {'id', 'name', 'url'})
+        _, body = self.get('api_article_detail', self.articles[0].pk, fields='content')
+        self.assertEqual(body['data'], {'id': self.articles[0].pk, 'content': 'body 0'})
+        for params, code in (
+            ({'fields': 'title,secret'}, 'invalid_fields'),
+            ({'include': 'comments'}, 'invalid_include'),
+            ({'cursor': '!!'}, 'invalid_cursor'),
+            ({'limit': '0'}, 'invalid_limit'),
+            ({'status': 'gone'}, 'invalid_filter'),
+        ):
+            response, body = self.get('api_article_list', **params)
+            self.assertEqual((response.status_code, body['error']['code']), (400, code))
+
+    def test_tokens_authenticate_and_only_see_their_owners_rows(self):
+        response = self.client.get(reverse('api_blog_list'))
+        self.assertEqual((response.status_code, response['WWW-Authenticate']), (401, 'Bearer'))
+        response, body = self.get('api_blog_list', key='not-a-key')
+        self.assertEqual((response.status_code, body['error']['code']), (401, 'invalid_token'))
+
+        theirs = Blog.objects.create(user=self.other, name='theirs', url='https://example.com', username='u', apikey='k')
+        _, body = self.get('api_blog_list')
+        self.assertEqual(sorted(row['id'] for row in body['data']), sorted(blog.pk for blog in self.blogs))
+        self.assertEqual(self.get('api_blog_detail', theirs.pk)[0].status_code, 404)
+
+        self.token.refresh_from_db()
+        used = self.token.last_used_at
+        self.assertIsNotNone(used)
+        self.get('api_blog_list')
+        self.token.refresh_from_db()
+        # Written at most once per LAST_USED_RESOLUTION
+        self.assertEqual(self.token.last_used_at, used)
+
+        ApiToken.objects.filter(pk=self.token.pk).update(is_active=False)
+        self.assertEqual(self.get('api_blog_list')[0].status_code, 401)
+
+
+class RenderingTests(TestCase):
+    databases = '__all__'
+
+    def test_markup_in_the_text_is_escaped(self):
+        html = rendering.render('<script>alert(1)</script>\n\n<img src=x onerror=alert(1)> `<script>`')
+        self.assertNotIn('<script', html)
+        self.assertNotIn('<img', html)
+        self.assertEqual(html, (
+            '<p>&lt;script&gt;alert(1)&lt;/script&gt;</p>\n'
+            '<p>&lt;img src=x onerror=alert(1)&gt; <code>&lt;script&gt;</code></p>'
+        ))
+
+    def test_links_only_take_http_urls(self):
+        html = rendering.render('[a](javascript:alert(1)) [b](JavaScript:alert(1)) <a href="javascript:alert(1)">c</a>')
+        self.assertNotIn('<a', html)
+        self.assertEqual(
+            rendering.render('[ok](https://example.com/?a=1&b=2)'),
+            '<p><a href="https://example.com/?a=1&amp;b=2" rel="nofollow noopener">ok</a></p>',
+        )
+        # A quote cannot end the attribute early
+        self.assertIn('href="https://example.com/&quot;onmouseover=&quot;alert(1"',
+                      rendering.render('[x](https://example.com/"onmouseover="alert(1))'))
+
+    def test_stored_html_is_reused_until_the_text_changes(self):
+        user = User.objects.create_user('rendering', 'rendering@example.com', 'pw')
+        blog = Blog.objects.create(user=user, name='rendering', url='https://example.com', username='u', apikey='k')
+        article = Article.objects.create(user=user, blog=blog, title='t', content='<script>x</script>')
+        self.assertEqual(rendering.html_for(article), '<p>&lt;script&gt;x&lt;/script&gt;</p>')
+        with self.assertNumQueries(1):
+            rendering.html_for(article)
+        article.content = '**safe**'
+        self.assertEqual(rendering.html_for(article), '<p><strong>safe</strong></p>')
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_PERCENT=0)
+class ProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = make_admin('profiler')
+        cls.user = User.objects.create_user('profiled', 'profiled@example.com', 'pw')
+
+    def request(self, user, path='/', **headers):
+        request = RequestFactory().get(path, **headers)
+        request.user = user
+        return request
+
+    def test_only_admins_can_ask_for_a_profile(self):
+        self.assertTrue(profiling.is_admin(self.admin))
+        self.assertEqual(profiling.requested_mode(self.request(self.admin, '/?_profile=cprofile')), 'cprofile')
+        self.assertEqual(profiling.requested_mode(self.request(self.admin, '/?_profile=')), 'sample')
+        self.assertEqual(profiling.requested_mode(self.request(self.admin, HTTP_X_PROFILE=' Sample ')), 'sample')
+        self.assertIsNone(profiling.requested_mode(self.request(self.admin, '/?_profile=perf')))
+        self.assertIsNone(profiling.requested_mode(self.request(self.admin)))
+        for user in (self.user, AnonymousUser()):
+            self.assertFalse(profiling.is_admin(user))
+            self.assertIsNone(profiling.requested_mode(self.request(user, '/?_profile=cprofile')))
+            self.assertIsNone(profiling.requested_mode(self.request(user, HTTP_X_PROFILE='sample')))
+        # An account without a profile row is no admin either
+        UserProfile.objects.filter(user=self.user).delete()
+        self.assertFalse(profiling.is_admin(User.objects.get(pk=self.user.pk)))
+
+    def test_a_flagged_request_is_profiled_for_admins_only(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('landing'), {'_profile': 'cprofile'})
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertFalse(RequestProfile.objects.exists())
+
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('landing'), {'_profile': 'cprofile'})
+        profile = RequestProfile.objects.get()
+        self.assertEqual(response['X-Profile-Id'], str(profile.pk))
+        self.assertEqual((profile.mode, profile.trigger, profile.user_id), ('cprofile', 'flag', self.admin.pk))
+        self.assertEqual(self.client.get(reverse('profile_detail', args=[profile.pk])).status_code, 200)
+
+        self.client.force_login(self.user)
+        self.assertRedirects(self.client.get(reverse('profile_detail', args=[profile.pk])), reverse('home'),
+                             fetch_redirect_response=False)
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path("", views.landing, name="landing"),
@@ -14,12 +14,31 @@ urlpatterns = [
     path("article-creation/", views.article_creation, name="article_creation"),
     path("article-edit/<int:article_id>/", views.article_edit, name="article_edit"),
     path("article-delete/<int:article_id>/", views.article_delete, name="article_delete"),
+    path("article-history/<int:article_id>/", views.article_history, name="article_history"),
+    path("article-history/<int:article_id>/<int:number>/", views.article_revision, name="article_revision"),
     path("article-list/", views.article_list, name="article_list"),
     path("admin-panel/", views.admin_panel, name="admin_panel"),
+    path("admin-panel/profiles/", views.profile_list, name="profile_list"),
+    path("admin-panel/profiles/<int:profile_id>/", views.profile_detail, name="profile_detail"),
+    path("admin-panel/profiles/<int:profile_id>/<str:kind>", views.profile_download, name="profile_download"),
+    path("metrics/", views.metrics_view, name="metrics"),
+    path("healthz/", views.health, name="health"),
     # User Management
     path("user-list/", views.user_list, name="user_list"),
+    path("user-bulk-action/", views.user_bulk_action, name="user_bulk_action"),
     path("user-create/", views.user_create, name="user_create"),
     path("user-edit/<int:user_id>/", views.user_edit, name="user_edit"),
     path("user-delete/<int:user_id>/", views.user_delete, name="user_delete"),
     path("generate-article/", views.handle_ai_generation, name="generate_article"),
+    # Public feeds, sitemaps and the pages they link to
+    path("feeds/<int:blog_id>/rss.xml", views.feed_document, {"kind": "rss"}, name="blog_rss"),
+    path("feeds/<int:blog_id>/atom.xml", views.feed_document, {"kind": "atom"}, name="blog_atom"),
+    path("sitemaps/<int:blog_id>.xml", views.feed_document, {"kind": "sitemap_index"}, name="blog_sitemap_index"),
+    path("sitemaps/<int:blog_id>-<int:part>.xml", views.feed_document, {"kind": "sitemap"}, name="blog_sitemap"),
+    path("b/<int:blog_id>/<int:article_id>/", views.article_public, name="article_public"),
+    # Read-only JSON API (token auth, see blogapp.api)
+    path("api/v1/blogs/", api.blog_list, name="api_blog_list"),
+    path("api/v1/blogs/<int:blog_id>/", api.blog_detail, name="api_blog_detail"),
+    path("api/v1/articles/", api.article_list, name="api_article_list"),
+    path("api/v1/articles/<int:article_id>/", api.article_detail, name="api_article_detail"),
 ]
@@ -1,12 +1,24 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import Http404, JsonResponse
+from django.http import Http404, JsonResponse, HttpResponse
 from django.contrib import messages
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.db import IntegrityError
+from django.db import IntegrityError, connection
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.core.paginator import Paginator
+from django.db.models import Count, Q
+from django.db.models.functions import Lower
+from django.urls import reverse
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
 from .forms import BlogForm
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import gzip
 import json
 
 # blogs = [
@@ -17,8 +29,23 @@ import json
 #     {"title": "How to Write a Blog with AI", "date": "2024-06-01 10:00", "status": "Published"},
 #     {"title": "SEO-Friendly Article Structure", "date": "2024-06-01 09:30", "status": "Draft"}
 # ]
-from .models import Blog, Article, UserProfile
-from .services import GeminiService
+from .models import (
+    Blog, Article, UserProfile, Category, ArticleRevision, ArchivedArticle, ArchivedArticleRevision,
+    DeletionJob, PromptTemplate, RelatedArticle, BlogHealth, RequestProfile, related_articles, users_with_email,
+)
+from .deletion import request_deletion, active_jobs
+from .routers import report_db
+from . import revisions
+from .http_cache import conditional_page
+from .services import GeminiService, GeminiError
+from .prompts import get_prompt
+from .fingerprints import find_near_duplicates
+from . import metrics
+from . import feeds
+from . import outbox
+from . import sharding
+from . import rendering
+from . import profiling
 from functools import wraps
 
 def admin_required(view_func):
@@ -36,6 +63,23 @@ def admin_required(view_func):
         return view_func(request, *args, **kwargs)
     return _wrapped_view
 
+def user_categories(user):
+    """Names of the categories used by any of the user's blogs"""
+    return Category.objects.filter(blogs__user=user).values_list('name', flat=True).distinct()
+
+def parse_publish_at(status, value):
+    """Validate the publish time for a scheduled article; returns (publish_at, error)"""
+    if status != 'scheduled':
+        return None, None
+    publish_at = parse_datetime(value) if value else None
+    if publish_at is None:
+        return None, "A valid publish date and time is required for scheduled articles."
+    if timezone.is_naive(publish_at):
+        publish_at = timezone.make_aware(publish_at)
+    if publish_at <= timezone.now():
+        return None, "Publish time must be in the future."
+    return publish_at, None
+
 def user_register(request):
     if request.user.is_authenticated:
         return redirect('home')
@@ -63,7 +107,7 @@ def user_register(request):
             messages.error(request, 'Username already exists.')
             return render(request, 'registration/register.html')
         
-        if User.objects.filter(email=email).exists():
+        if users_with_email(email).exists():
             messages.error(request, 'Email already exists.')
             return render(request, 'registration/register.html')
         
@@ -121,14 +165,80 @@ def home(request):
 def landing(request):
     return render(request, "landing.html")
 
+# Related articles listed under each article in blog_view
+BLOG_VIEW_RELATED = 3
+
+def _blog_related_links(articles):
+    """The top links of the `articles` querysets, as querysets on `default` (several on a shard)"""
+    return [
+        RelatedArticle.objects.filter(article_id__in=lookup, rank__lt=BLOG_VIEW_RELATED).order_by('article_id', 'rank')
+        for lookup in sharding.article_ids(articles)
+    ]
+
+def _blog_related_articles(links):
+    """The articles the links point to; related titles can come from other blogs, on any database"""
+    querysets = [Article.objects.filter(id__in=qs.values('related_id')) for qs in links]
+    if sharding.is_enabled():
+        ids = sorted({pk for qs in links for pk in qs.values_list('related_id', flat=True)})
+        querysets += [
+            Article.objects.using(alias).filter(id__in=chunk)
+            for alias in sharding.shard_aliases() for chunk in sharding.chunks(ids)
+        ]
+    return querysets
+
+@dataclass
+class BlogPageQuerysets:
+    """What blog_view shows; iterating yields every queryset, for conditional_page"""
+    blog: object
+    articles: list
+    links: list
+    related: list
+
+    def __iter__(self):
+        yield self.blog
+        yield from self.articles
+        yield from self.links
+        yield from self.related
+
+def _blog_page_querysets(request, id):
+    """Built once per request, so the ETag check and the view share the querysets"""
+    cache = request.__dict__.setdefault('_blog_page_querysets', {})
+    if id not in cache:
+        articles = sharding.blog_querysets(id, Article.objects.filter(user=request.user))
+        links = _blog_related_links(articles)
+        cache[id] = BlogPageQuerysets(
+            blog=Blog.objects.filter(id=id, user=request.user),
+            articles=articles,
+            links=links,
+            related=_blog_related_articles(links),
+        )
+    return cache[id]
+
 @login_required
+@conditional_page('blog_view', _blog_page_querysets)
 def blog_view(request, id):
-    blog = Blog.objects.filter(id=id, user=request.user).first()
-    articles = Article.objects.filter(blog_id=id, user=request.user)
+    querysets = _blog_page_querysets(request, id)
+    blog = querysets.blog.first()
+    articles = sharding.merge(querysets.articles, key=lambda article: article.created_at, reverse=True)
+    # Neighbours for every article on the page: the links, then their titles from each database
+    pairs = list(dict.fromkeys(
+        pair for qs in querysets.links for pair in qs.values_list('article_id', 'related_id')
+    ))
+    titles = sharding.in_bulk({related_id for _, related_id in pairs}, Article.objects.only('id', 'title', 'updated_at'))
+    related = {}
+    for article_id, related_id in pairs:
+        if related_id in titles:
+            related.setdefault(article_id, []).append(titles[related_id])
+    for article in articles:
+        article.related_articles = related.get(article.id, [])
     return render(request, "blog/blog_view.html", {"blog": blog, "articles": articles})
 
 @admin_required
-@admin_required
+@conditional_page('blog_registration', lambda request: [
+    Blog.objects.filter(user=request.user),
+    DeletionJob.objects.filter(target_type='blog', requested_by=request.user),
+    BlogHealth.objects.filter(blog__user=request.user),
+])
 def blog_registration(request):
     if request.method == "POST":
         form = BlogForm(request.POST)
@@ -159,8 +269,31 @@ def blog_registration(request):
     else:
         form = BlogForm()
 
-    blogs = Blog.objects.filter(user=request.user)
-    return render(request, "blog_registration.html", {"form": form, "blogs": blogs})
+    blogs = Blog.objects.filter(user=request.user).select_related('health')
+    category = request.GET.get("category", "").strip()
+    if category:
+        blogs = blogs.filter(categories__name=category)
+    blogs = list(blogs)
+    jobs = active_jobs('blog', [blog.id for blog in blogs if blog.is_deleting])
+    for blog in blogs:
+        blog.deletion_job = jobs.get(blog.id)
+        # Reverse one-to-one access raises when the blog has not been probed yet
+        blog.health_status = getattr(blog, 'health', None)
+    return render(request, "blog_registration.html", {
+        "form": form,
+        "blogs": blogs,
+        "categories": user_categories(request.user),
+        "selected_category": category,
+    })
+
+def _blog_edit_context(blog):
+    return {
+        "blog": blog,
+        # Inactive versions stay pinnable for the blogs already using them
+        "prompt_templates": PromptTemplate.objects.filter(
+            Q(is_active=True) | Q(pk=blog.prompt_template_id), name='article',
+        ),
+    }
 
 @admin_required
 def blog_edit(request, blog_id):
@@ -172,43 +305,51 @@ def blog_edit(request, blog_id):
         username = request.POST.get("username", "").strip()
         apikey = request.POST.get("apikey", "").strip()
         category_input = request.POST.get("category", "").strip()
+        prompt_template_id = request.POST.get("prompt_template", "")
         
         # Validation
         if not all([name, url, username, apikey]):
             messages.error(request, "All fields are required!")
-            return render(request, "blog/blog_edit.html", {"blog": blog})
+            return render(request, "blog/blog_edit.html", _blog_edit_context(blog))
         
         if len(name) < 2:
             messages.error(request, "Blog name must be at least 2 characters long.")
-            return render(request, "blog/blog_edit.html", {"blog": blog})
+            return render(request, "blog/blog_edit.html", _blog_edit_context(blog))
         
         if not url.startswith(('http://', 'https://')):
             messages.error(request, "URL must start with http:// or https://")
-            return render(request, "blog/blog_edit.html", {"blog": blog})
+            return render(request, "blog/blog_edit.html", _blog_edit_context(blog))
         
         if len(username) < 2:
             messages.error(request, "Username must be at least 2 characters long.")
-            return render(request, "blog/blog_edit.html", {"blog": blog})
+            return render(request, "blog/blog_edit.html", _blog_edit_context(blog))
         
         if len(apikey) < 10:
             messages.error(request, "API key must be at least 10 characters long.")
-            return render(request, "blog/blog_edit.html", {"blog": blog})
+            return render(request, "blog/blog_edit.html", _blog_edit_context(blog))
         
         # Check if new name conflicts with existing blogs (excluding current blog)
         if Blog.objects.filter(user=request.user, name=name).exclude(id=blog_id).exists():
             messages.error(request, f"Blog with name '{name}' already exists!")
-            return render(request, "blog/blog_edit.html", {"blog": blog})
+            return render(request, "blog/blog_edit.html", _blog_edit_context(blog))
         
         # Process categories
         categories = [cat.strip() for cat in category_input.split(",") if cat.strip()] if category_input else []
         if len(categories) > 10:
             messages.error(request, "Maximum 10 categories allowed.")
-            return render(request, "blog/blog_edit.html", {"blog": blog})
+            return render(request, "blog/blog_edit.html", _blog_edit_context(blog))
 
         for cat in categories:
             if len(cat) > 50:
                 messages.error(request, "Each category must be 50 characters or less.")
-                return render(request, "blog/blog_edit.html", {"blog": blog})
+                return render(request, "blog/blog_edit.html", _blog_edit_context(blog))
+        
+        prompt_template = None
+        if prompt_template_id:
+            prompt_template = PromptTemplate.objects.filter(id=prompt_template_id, name='article').first()
+            if prompt_template is None:
+                messages.error(request, "Invalid prompt template selected.")
+                return render(request, "blog/blog_edit.html", _blog_edit_context(blog))
 
         try:
             blog.name = name
@@ -216,6 +357,7 @@ def blog_edit(request, blog_id):
             blog.username = username
             blog.apikey = apikey
             blog.category = categories
+            blog.prompt_template = prompt_template
             blog.save()
             
             messages.success(request, f"Blog '{blog.name}' updated successfully!")
@@ -223,16 +365,20 @@ def blog_edit(request, blog_id):
         except Exception as e:
             messages.error(request, f'Error updating blog: {str(e)}')
 
-    return render(request, "blog/blog_edit.html", {"blog": blog})
+    return render(request, "blog/blog_edit.html", _blog_edit_context(blog))
 
 @admin_required
 def blog_delete(request, blog_id):
     blog = get_object_or_404(Blog, id=blog_id, user=request.user)
     
     if request.method == "POST":
-        blog_name = blog.name
-        blog.delete()
-        messages.success(request, f"Blog '{blog_name}' deleted successfully!")
+        job = request_deletion(blog, request.user)
+        if job.status == 'done':
+            messages.success(request, f"Blog '{blog.name}' deleted successfully!")
+        elif job.status == 'failed':
+            messages.error(request, f"Deleting blog '{blog.name}' failed: {job.error}")
+        else:
+            messages.info(request, f"Blog '{blog.name}' has {job.total} articles and is being deleted in the background.")
         return redirect("blog_registration")
 
     return render(request, "blog/blog_delete.html", {"blog": blog})
@@ -246,56 +392,78 @@ def article_creation(request):
         content = request.POST.get("content", "").strip()
         status = request.POST.get("status", "draft")
         blog_id = request.POST.get("blog", "")
+        publish_at, publish_at_error = parse_publish_at(status, request.POST.get("publish_at", "").strip())
         
         # Validation
         if not all([title, content, blog_id]):
             messages.error(request, "Title, content, and blog are required!")
-            blogs = Blog.objects.filter(user=request.user)
+            blogs = Blog.objects.filter(user=request.user, is_deleting=False)
             form = {"fields": {"blog": {"queryset": blogs}}}
             return render(request, "article_creation.html", {"form": form})
         
         if len(title) < 5:
             messages.error(request, "Title must be at least 5 characters long.")
-            blogs = Blog.objects.filter(user=request.user)
+            blogs = Blog.objects.filter(user=request.user, is_deleting=False)
             form = {"fields": {"blog": {"queryset": blogs}}}
             return render(request, "article_creation.html", {"form": form})
         
         
         if len(content) < 50:
             messages.error(request, "Content must be at least 50 characters long.")
-            blogs = Blog.objects.filter(user=request.user)
+            blogs = Blog.objects.filter(user=request.user, is_deleting=False)
             form = {"fields": {"blog": {"queryset": blogs}}}
             return render(request, "article_creation.html", {"form": form})
         
         if len(content.split()) < 10:
             messages.error(request, "Content must contain at least 10 words.")
-            blogs = Blog.objects.filter(user=request.user)
+            blogs = Blog.objects.filter(user=request.user, is_deleting=False)
+            form = {"fields": {"blog": {"queryset": blogs}}}
+            return render(request, "article_creation.html", {"form": form})
+        
+        if publish_at_error:
+            messages.error(request, publish_at_error)
+            blogs = Blog.objects.filter(user=request.user, is_deleting=False)
             form = {"fields": {"blog": {"queryset": blogs}}}
             return render(request, "article_creation.html", {"form": form})
         
         try:
-            blog = Blog.objects.get(id=blog_id, user=request.user)
+            blog = Blog.objects.get(id=blog_id, user=request.user, is_deleting=False)
         except Blog.DoesNotExist:
             messages.error(request, "Invalid blog selected.")
-            blogs = Blog.objects.filter(user=request.user)
+            blogs = Blog.objects.filter(user=request.user, is_deleting=False)
             form = {"fields": {"blog": {"queryset": blogs}}}
             return render(request, "article_creation.html", {"form": form})
         
+        # Warn before saving a near-copy; the re-rendered form posts allow_duplicate to save anyway
+        if not request.POST.get("allow_duplicate"):
+            near_duplicates = find_near_duplicates(request.user, title, content)
+            if near_duplicates:
+                messages.warning(request, "This article looks like a near-duplicate of an existing one. Review it, or post it anyway.")
+                blogs = Blog.objects.filter(user=request.user, is_deleting=False)
+                form = {"fields": {"blog": {"queryset": blogs}}}
+                return render(request, "article_creation.html", {
+                    "form": form,
+                    "draft": request.POST,
+                    "near_duplicates": near_duplicates,
+                })
+        
         try:
             article = Article.objects.create(
                 user=request.user,
                 blog=blog,
                 title=title,
                 content=content,
-                status=status
+                status=status,
+                publish_at=publish_at
             )
+            revisions.record_revision(article, request.user)
             messages.success(request, f"Article '{article.title}' created successfully!")
             return redirect("article_list")
         except Exception as e:
             messages.error(request, f'Error creating article: {str(e)}')
     
     # GET request - show the form
-    blogs = Blog.objects.filter(user=request.user)
+    blogs = Blog.objects.filter(user=request.user, is_deleting=False)
     form = {"fields": {"blog": {"queryset": blogs}}}
     return render(request, "article_creation.html", {"form": form})
 
@@ -313,6 +481,7 @@ def handle_ai_generation(request):
                 'error': 'Keyword is required for article generation.'
             })
         
+        blog = None
         blog_categories = []
         if blog_id:
             try:
@@ -321,7 +490,12 @@ def handle_ai_generation(request):
             except Blog.DoesNotExist:
                 pass
         gemini_service = GeminiService()
-        result = gemini_service.generate_article(keyword, blog_categories)
+        result = gemini_service.generate_article(keyword, blog_categories, prompt=get_prompt('article', blog=blog))
+        if result.get('success'):
+            result['near_duplicates'] = [
+                {'id': article.id, 'title': article.title, 'blog': article.blog.name, 'similarity': round(score, 2)}
+                for article, score in find_near_duplicates(request.user, result['title'], result['content'])
+            ]
         
         return JsonResponse(result)
         
@@ -330,21 +504,34 @@ def handle_ai_generation(request):
             'success': False,
             'error': 'Invalid request format.'
         })
+    except GeminiError as e:
+        return JsonResponse({
+            'success': False,
+            'error': e.user_message
+        })
     except Exception as e:
         return JsonResponse({
             'success': False,
             'error': f'An error occurred: {str(e)}'
         })
 
+def _get_article(request, article_id):
+    """The user's article, from whichever database holds it"""
+    article = sharding.find_article(id=article_id, user=request.user)
+    if article is None:
+        raise Http404("No such article")
+    return article
+
 @admin_required
 def article_edit(request, article_id):
-    article = get_object_or_404(Article, id=article_id, user=request.user)
+    article = _get_article(request, article_id)
     
     if request.method == "POST":
         title = request.POST.get("title", "").strip()
         content = request.POST.get("content", "").strip()
         status = request.POST.get("status", "draft")
         blog_id = request.POST.get("blog", "")
+        publish_at, publish_at_error = parse_publish_at(status, request.POST.get("publish_at", "").strip())
         
         # Validation
         if not all([title, content, blog_id]):
@@ -363,18 +550,25 @@ def article_edit(request, article_id):
             messages.error(request, "Content must contain at least 10 words.")
             return render(request, "articles/article_edit.html", {"article": article, "form": None})
         
+        if publish_at_error:
+            messages.error(request, publish_at_error)
+            return render(request, "articles/article_edit.html", {"article": article, "form": None})
+        
         try:
-            blog = Blog.objects.get(id=blog_id, user=request.user)
+            blog = Blog.objects.get(id=blog_id, user=request.user, is_deleting=False)
         except Blog.DoesNotExist:
             messages.error(request, "Invalid blog selected.")
             return render(request, "articles/article_edit.html", {"article": article, "form": None})
         
         try:
+            revisions.ensure_baseline(article, request.user)
             article.title = title
             article.content = content
             article.status = status
+            article.publish_at = publish_at
             article.blog = blog
             article.save()
+            revisions.record_revision(article, request.user)
             
             messages.success(request, f"Article '{article.title}' updated successfully!")
             return redirect("article_list")
@@ -382,13 +576,56 @@ def article_edit(request, article_id):
             messages.error(request, f'Error updating article: {str(e)}')
     
     # Create a simple form context for the template
-    blogs = Blog.objects.filter(user=request.user)
+    blogs = Blog.objects.filter(user=request.user, is_deleting=False)
     form = {"fields": {"blog": {"queryset": blogs}}}
-    return render(request, "articles/article_edit.html", {"article": article, "form": form})
+    return render(request, "articles/article_edit.html", {
+        "article": article,
+        "form": form,
+        "related_articles": related_articles(article),
+    })
+
+def _history_article(request, article_id):
+    """The live article, or its archived copy once it has been moved out (read-only)"""
+    article = sharding.find_article(id=article_id, user=request.user)
+    if article is not None:
+        return article, False
+    return get_object_or_404(ArchivedArticle, id=article_id, user=request.user), True
+
+@admin_required
+def article_history(request, article_id):
+    article, archived = _history_article(request, article_id)
+    history = article.revisions.select_related('user').defer('data')
+    return render(request, "articles/article_history.html", {
+        "article": article,
+        "revisions": history,
+        "archived": archived,
+    })
+
+@admin_required
+def article_revision(request, article_id, number):
+    article, archived = _history_article(request, article_id)
+    revision_model = ArchivedArticleRevision if archived else ArticleRevision
+    revision = get_object_or_404(revision_model, article=article, number=number)
+    
+    if request.method == "POST" and not archived:
+        revisions.ensure_baseline(article, request.user)
+        article.title = revision.title
+        article.content = revisions.revision_content(revision)
+        article.save()
+        revisions.record_revision(article, request.user)
+        messages.success(request, f"Article '{article.title}' reverted to revision {revision.number}.")
+        return redirect("article_history", article_id=article.id)
+    
+    return render(request, "articles/article_revision.html", {
+        "article": article,
+        "archived": archived,
+        "revision": revision,
+        "content": revisions.revision_content(revision),
+    })
 
 @admin_required
 def article_delete(request, article_id):
-    article = get_object_or_404(Article, id=article_id, user=request.user)
+    article = _get_article(request, article_id)
     
     if request.method == "POST":
         article_title = article.title
@@ -399,19 +636,247 @@ def article_delete(request, article_id):
     return render(request, "articles/article_delete.html", {"article": article})
 
 @admin_required
+@conditional_page('article_list', lambda request: [
+    *sharding.user_querysets(request.user),
+    Blog.objects.filter(user=request.user),
+])
 def article_list(request):
-    articles = Article.objects.filter(user=request.user)
-    return render(request, "article_list.html", {"articles": articles})
+    articles = Article.objects.all()
+    category = request.GET.get("category", "").strip()
+    if category:
+        # Resolved up front: articles on a shard cannot join to blogs
+        blog_ids = Blog.objects.filter(user=request.user, categories__name=category).values_list('id', flat=True)
+        articles = articles.filter(blog_id__in=list(blog_ids))
+    return render(request, "article_list.html", {
+        "articles": sharding.merge(
+            sharding.user_querysets(request.user, articles),
+            key=lambda article: article.created_at, reverse=True,
+        ),
+        "categories": user_categories(request.user),
+        "selected_category": category,
+    })
 
 @admin_required
 def admin_panel(request):
-    return render(request, "admin_panel.html")
+    # Site-wide counts are a report: read them from a replica, never the primary
+    db = report_db()
+    article_counts = {}
+    # Shards have no replicas; their counts come from the shard itself
+    for alias in sharding.all_aliases():
+        for status, n in (
+            Article.objects.using(db if alias == sharding.PRIMARY else alias)
+            .order_by().values_list('status').annotate(n=Count('id'))
+        ):
+            article_counts[status] = article_counts.get(status, 0) + n
+    stats = {
+        "users": User.objects.using(db).count(),
+        "blogs": Blog.objects.using(db).count(),
+        "articles": sum(article_counts.values()),
+        "published": article_counts.get('published', 0),
+        "archived": article_counts.get('archived', 0) + ArchivedArticle.objects.using(db).count(),
+    }
+    return render(request, "admin_panel.html", {"stats": stats})
+
+PROFILE_LIST_PAGE_SIZE = 50
+
+@admin_required
+def profile_list(request):
+    """Stored request profiles, newest first; filter by view name or minimum duration"""
+    profiles = RequestProfile.objects.select_related('user').defer('queries', 'stacks', 'pstats', 'summary')
+    view_name = request.GET.get('view', '').strip()
+    min_ms = request.GET.get('min_ms', '').strip()
+    if view_name:
+        profiles = profiles.filter(view_name=view_name)
+    if min_ms.isdigit():
+        profiles = profiles.filter(duration_ms__gte=int(min_ms))
+    page = Paginator(profiles, PROFILE_LIST_PAGE_SIZE).get_page(request.GET.get('page'))
+    querystring = request.GET.copy()
+    querystring.pop('page', None)
+    return render(request, "profiling/profile_list.html", {
+        "page": page,
+        "profiles": page.object_list,
+        "filters": {"view": view_name, "min_ms": min_ms},
+        "views": RequestProfile.objects.order_by('view_name').values_list('view_name', flat=True).distinct(),
+        "querystring": querystring.urlencode(),
+        "sample_percent": getattr(settings, 'PROFILING_SAMPLE_PERCENT', 0),
+    })
+
+@admin_required
+def profile_detail(request, profile_id):
+    """One profile: hot functions (or the cProfile table) and its SQL, repeated statements grouped"""
+    profile = get_object_or_404(RequestProfile, id=profile_id)
+    grouped = {}
+    for query in profile.queries:
+        count, ms = grouped.get(query['sql'], (0, 0.0))
+        grouped[query['sql']] = (count + 1, ms + query['ms'])
+    statements = sorted(
+        ({'sql': sql, 'count': count, 'ms': round(ms, 3)} for sql, (count, ms) in grouped.items()),
+        key=lambda statement: -statement['ms'],
+    )
+    return render(request, "profiling/profile_detail.html", {
+        "profile": profile,
+        "hot_functions": profiling.hot_functions(profile.stacks) if profile.stacks else [],
+        "statements": statements,
+        "unrecorded_queries": profile.sql_count - len(profile.queries),
+    })
+
+@admin_required
+def profile_download(request, profile_id, kind):
+    """A profile's raw data: collapsed stacks for flamegraph tools, pstats for snakeviz & co., or the SQL trace"""
+    profile = get_object_or_404(RequestProfile, id=profile_id)
+    if kind == 'collapsed' and profile.stacks:
+        response = HttpResponse(profile.stacks + '\n', content_type='text/plain; charset=utf-8')
+        filename = f"profile-{profile.id}.folded"
+    elif kind == 'pstats' and profile.pstats:
+        response = HttpResponse(bytes(profile.pstats), content_type='application/octet-stream')
+        filename = f"profile-{profile.id}.prof"
+    elif kind == 'sql':
+        response = JsonResponse(profile.queries, safe=False)
+        filename = f"profile-{profile.id}-sql.json"
+    else:
+        raise Http404("No such profile data")
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+def health(request):
+    """Liveness/readiness probe: checks the database only, never the AI service"""
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'error': str(e)}, status=503)
+    return JsonResponse({'status': 'ok'})
+
+@require_safe
+def feed_document(request, blog_id, kind, part=0):
+    """Public RSS/Atom feeds and sitemaps, served from pre-rendered gzipped XML (see blogapp.feeds)"""
+    doc = feeds.get_document(blog_id, kind, part, feeds.base_url(request))
+    if doc is None:
+        raise Http404("No such feed")
+    response = HttpResponse(content_type=feeds.CONTENT_TYPES[kind])
+    # Weak: the same ETag goes out with gzip and identity encodings
+    response['ETag'] = f'W/"{doc.etag}"'
+    response['Last-Modified'] = http_date(doc.updated_at.timestamp())
+    response['Cache-Control'] = f"public, max-age={getattr(settings, 'FEED_CACHE_SECONDS', 300)}"
+    patch_vary_headers(response, ('Accept-Encoding',))
+    not_modified = get_conditional_response(
+        request, etag=response['ETag'], last_modified=int(doc.updated_at.timestamp()), response=response,
+    )
+    if not_modified is not response:
+        return not_modified
+    body = bytes(doc.body)
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response['Content-Encoding'] = 'gzip'
+        response.content = body
+    else:
+        response.content = gzip.decompress(body)
+    return response
+
+def article_public(request, blog_id, article_id):
+    """The public page of a published article; what feeds and sitemaps link to"""
+    blog = get_object_or_404(Blog, id=blog_id, is_deleting=False)
+    article = sharding.find_article(id=article_id, blog_id=blog_id, status='published')
+    if article is None:
+        raise Http404("No such article")
+    article.blog = blog
+    return render(request, "articles/article_public.html", {
+        "article": article,
+        "content_html": rendering.html_for(article),
+    })
+
+@admin_required
+def metrics_view(request):
+    """Expose process metrics (circuit breaker state etc.) in Prometheus format"""
+    outbox.update_lag_metrics()
+    return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4')
+
+USER_LIST_PAGE_SIZE = 50
+
+def _parse_date_param(value):
+    try:
+        return parse_date(value) if value else None
+    except ValueError:
+        return None
 
 @admin_required
 def user_list(request):
-    """List all users with their roles"""
-    users = User.objects.select_related('profile').filter(is_superuser=False).order_by('date_joined')
-    return render(request, "user_management/user_list.html", {"users": users})
+    """List users with server-side search, filters and pagination"""
+    users = User.objects.select_related('profile').filter(is_superuser=False)
+    
+    q = request.GET.get('q', '').strip()
+    role = request.GET.get('role', '')
+    active = request.GET.get('active', '')
+    joined_from = _parse_date_param(request.GET.get('joined_from', ''))
+    joined_to = _parse_date_param(request.GET.get('joined_to', ''))
+    
+    if q:
+        # Prefix ranges on the LOWER() indexes; istartswith/startswith compile to LIKE, which scans the table
+        prefix = q.lower()
+        users = users.annotate(username_lower=Lower('username'), email_lower=Lower('email')).filter(
+            Q(username_lower__gte=prefix, username_lower__lt=prefix + '\uffff')
+            # email__gt='' repeats the partial index predicate so the planner can use it
+            | Q(email_lower__gte=prefix, email_lower__lt=prefix + '\uffff', email__gt='')
+        )
+    if role in ('user', 'admin'):
+        users = users.filter(profile__role=role)
+    if active in ('1', '0'):
+        users = users.filter(is_active=active == '1')
+    # Compare against datetimes rather than DATE(date_joined) so the index is usable
+    if joined_from:
+        users = users.filter(date_joined__gte=timezone.make_aware(datetime.combine(joined_from, datetime.min.time())))
+    if joined_to:
+        users = users.filter(date_joined__lt=timezone.make_aware(datetime.combine(joined_to + timedelta(days=1), datetime.min.time())))
+    
+    paginator = Paginator(users.order_by('date_joined', 'id'), USER_LIST_PAGE_SIZE)
+    page = paginator.get_page(request.GET.get('page'))
+    page_users = list(page.object_list)
+    jobs = active_jobs('user', [u.id for u in page_users if hasattr(u, 'profile') and u.profile.is_deleting])
+    for u in page_users:
+        u.deletion_job = jobs.get(u.id)
+    
+    # Keep the filters when following pagination links
+    params = request.GET.copy()
+    params.pop('page', None)
+    return render(request, "user_management/user_list.html", {
+        "users": page_users,
+        "page": page,
+        "filters": {"q": q, "role": role, "active": active,
+                    "joined_from": request.GET.get('joined_from', ''),
+                    "joined_to": request.GET.get('joined_to', '')},
+        "querystring": params.urlencode(),
+    })
+
+@admin_required
+def user_bulk_action(request):
+    """Apply one action to every selected user with a single UPDATE"""
+    if request.method != "POST":
+        return redirect('user_list')
+    
+    action = request.POST.get('action', '')
+    user_ids = [int(i) for i in request.POST.getlist('user_ids') if i.isdigit()]
+    if not user_ids:
+        messages.error(request, 'No users selected.')
+        return redirect('user_list')
+    
+    # Superusers and the acting admin are never changed in bulk
+    targets = User.objects.filter(id__in=user_ids, is_superuser=False).exclude(id=request.user.id)
+    if action == 'activate':
+        updated = targets.update(is_active=True)
+    elif action == 'deactivate':
+        updated = targets.update(is_active=False)
+    elif action in ('make_admin', 'make_user'):
+        role = 'admin' if action == 'make_admin' else 'user'
+        # Skipping save() loses nothing: UserProfile has no receivers, and neither users
+        # nor profiles are outbox aggregates (the role is read afresh on every request).
+        # A receiver added for either model has to be run here as well.
+        updated = UserProfile.objects.filter(user__in=targets).update(role=role, updated_at=timezone.now())
+    else:
+        messages.error(request, 'Invalid bulk action.')
+        return redirect('user_list')
+    
+    messages.success(request, f'Updated {updated} user(s).')
+    querystring = request.POST.get('querystring', '')
+    return redirect(f"{reverse('user_list')}?{querystring}" if querystring else 'user_list')
 
 @admin_required
 def user_create(request):
@@ -440,7 +905,7 @@ def user_create(request):
             messages.error(request, 'Username already exists.')
             return render(request, 'user_management/user_create.html')
         
-        if User.objects.filter(email=email).exists():
+        if users_with_email(email).exists():
             messages.error(request, 'Email already exists.')
             return render(request, 'user_management/user_create.html')
         
@@ -497,7 +962,7 @@ def user_edit(request, user_id):
             messages.error(request, 'Username already exists.')
             return render(request, 'user_management/user_edit.html', {"user_obj": user})
         
-        if User.objects.filter(email=email).exclude(id=user_id).exists():
+        if users_with_email(email).exclude(id=user_id).exists():
             messages.error(request, 'Email already exists.')
             return render(request, 'user_management/user_edit.html', {"user_obj": user})
 
@@ -538,9 +1003,13 @@ def user_delete(request, user_id):
         return redirect('user_list')
     
     if request.method == "POST":
-        username = user.username
-        user.delete()
-        messages.success(request, f'User {username} deleted successfully!')
+        job = request_deletion(user, request.user)
+        if job.status == 'done':
+            messages.success(request, f'User {user.username} deleted successfully!')
+        elif job.status == 'failed':
+            messages.error(request, f'Deleting user {user.username} failed: {job.error}')
+        else:
+            messages.info(request, f'User {user.username} has {job.total} articles and is being deleted in the background.')
         return redirect('user_list')
 
     return render(request, 'user_management/user_delete.html', {"user_obj": user})
\ No newline at end of file
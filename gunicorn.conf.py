@@ -0,0 +1,44 @@
+"""
+Gunicorn settings for the production image.
+
+Every value can be overridden through the environment, e.g.
+WEB_CONCURRENCY=4 GUNICORN_THREADS=8 gunicorn -c gunicorn.conf.py myproject.wsgi
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+
+# gthread workers: AI generation blocks on network I/O for seconds, so each
+# process serves several requests on threads instead of one at a time.
+worker_class = 'gthread'
+workers = int(os.getenv('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 12)))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+
+# Import Django once in the master and fork it into workers (copy-on-write)
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() in ('true', '1', 'yes', 'on')
+
+# A request may wait for every Gemini attempt plus backoff; keep the hard
+# worker timeout above that and give in-flight generations the same window
+# to finish on SIGTERM before the worker is killed.
+_gemini_budget = float(os.getenv('GEMINI_TIMEOUT_SECONDS', '20')) * (int(os.getenv('GEMINI_MAX_RETRIES', '2')) + 1)
+timeout = int(os.getenv('GUNICORN_TIMEOUT', _gemini_budget + 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', _gemini_budget + 10))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+# Recycle workers periodically to bound memory growth
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '200'))
+
+# Heartbeat files on tmpfs so a slow disk cannot make healthy workers look dead
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+def worker_exit(server, worker):
+    # Cancel queued model calls and let running ones finish within graceful_timeout
+    from blogapp.resilience import shutdown_executor
+    shutdown_executor(wait=True)
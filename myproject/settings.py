@@ -49,10 +49,16 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'blogapp.middleware.StaticAssetMiddleware',
+    # Compresses API responses only; HTML pages stay uncompressed (BREACH, see the class)
+    'blogapp.middleware.ApiGZipMiddleware',
+    'blogapp.middleware.ReplicaPinningMiddleware',
+    'blogapp.middleware.AdmissionControlMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'blogapp.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -83,10 +89,43 @@ WSGI_APPLICATION = 'myproject.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
     }
 }
 
+# Read replicas
+# Comma-separated SQLite files holding copies of the primary (refresh them with
+# `manage.py refresh_sqlite_replicas`). Reads are spread across them; writes and
+# a writer's reads for REPLICA_STICKY_SECONDS afterwards stay on `default`.
+
+DATABASE_REPLICAS = []
+for _i, _path in enumerate(p.strip() for p in os.getenv('SQLITE_REPLICA_PATHS', '').split(',') if p.strip()):
+    DATABASES[f'replica{_i + 1}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': _path,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{_i + 1}')
+
+# Article shards
+# Comma-separated SQLite files that hold Article rows, placed per blog (see
+# blogapp.sharding). Empty keeps every article in `default`. Move blogs between
+# databases with `manage.py rebalance_shards`.
+
+ARTICLE_SHARDS = []
+for _i, _path in enumerate(p.strip() for p in os.getenv('SQLITE_SHARD_PATHS', '').split(',') if p.strip()):
+    DATABASES[f'shard{_i + 1}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': _path,
+    }
+    ARTICLE_SHARDS.append(f'shard{_i + 1}')
+
+# Seconds each process caches a blog's placement; a move waits this long before copying
+SHARD_MAP_CACHE_SECONDS = int(os.getenv('SHARD_MAP_CACHE_SECONDS', '5'))
+
+DATABASE_ROUTERS = ['blogapp.routers.ArticleShardRouter', 'blogapp.routers.PrimaryReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '10'))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -121,6 +160,156 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# collectstatic writes content-hashed names plus .gz/.br copies; they are
+# served with far-future cache headers by blogapp.middleware.StaticAssetMiddleware
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'blogapp.storage.PrecompressedManifestStaticFilesStorage',
+    },
+}
+
+# Gemini client resilience
+# Per-attempt deadline (enforced by the client), retries for transient errors, and
+# circuit breaker tuning. The call pool gives up GEMINI_DEADLINE_GRACE_SECONDS after
+# the deadline, for a call that ignores the client timeout.
+
+GEMINI_TIMEOUT_SECONDS = float(os.getenv('GEMINI_TIMEOUT_SECONDS', '20'))
+GEMINI_DEADLINE_GRACE_SECONDS = float(os.getenv('GEMINI_DEADLINE_GRACE_SECONDS', '5'))
+GEMINI_MAX_RETRIES = int(os.getenv('GEMINI_MAX_RETRIES', '2'))
+GEMINI_BREAKER_THRESHOLD = int(os.getenv('GEMINI_BREAKER_THRESHOLD', '5'))
+GEMINI_BREAKER_RESET_SECONDS = float(os.getenv('GEMINI_BREAKER_RESET_SECONDS', '30'))
+
+# Serve canned responses instead of calling Google (load tests, local development)
+GEMINI_USE_FAKE = os.getenv('GEMINI_USE_FAKE', 'False').lower() in ('true', '1', 'yes', 'on')
+GEMINI_FAKE_LATENCY_SECONDS = float(os.getenv('GEMINI_FAKE_LATENCY_SECONDS', '0'))
+
+# Prompt templates (blogapp.prompts)
+# Requests whose estimated prompt size exceeds the limit are rejected before calling the model
+
+GEMINI_MAX_PROMPT_TOKENS = int(os.getenv('GEMINI_MAX_PROMPT_TOKENS', '2048'))
+PROMPT_CACHE_SECONDS = int(os.getenv('PROMPT_CACHE_SECONDS', '60'))
+
+# Article revisions
+# A full snapshot is stored every N revisions to bound delta reconstruction
+
+ARTICLE_REVISION_SNAPSHOT_INTERVAL = int(os.getenv('ARTICLE_REVISION_SNAPSHOT_INTERVAL', '10'))
+
+# Article content storage
+# 'zlib', 'zstd' (needs the zstandard package) or 'none'; bodies smaller than the
+# threshold (bytes) are stored uncompressed
+
+ARTICLE_CONTENT_COMPRESSION = os.getenv('ARTICLE_CONTENT_COMPRESSION', 'zlib')
+ARTICLE_CONTENT_COMPRESSION_THRESHOLD = int(os.getenv('ARTICLE_CONTENT_COMPRESSION_THRESHOLD', '1024'))
+
+# Related articles (blogapp.related)
+# Neighbours kept per article, the minimum cosine similarity to count as related,
+# and the number of terms kept per article when it is vectorised / compared
+
+RELATED_ARTICLES_TOP_K = int(os.getenv('RELATED_ARTICLES_TOP_K', '5'))
+RELATED_ARTICLES_MIN_SCORE = float(os.getenv('RELATED_ARTICLES_MIN_SCORE', '0.1'))
+RELATED_ARTICLES_MAX_TERMS = int(os.getenv('RELATED_ARTICLES_MAX_TERMS', '128'))
+RELATED_ARTICLES_ROW_TERMS = int(os.getenv('RELATED_ARTICLES_ROW_TERMS', '48'))
+
+# Blog health checks
+# `manage.py check_blog_health` probes every blog's REST API with at most
+# BLOG_HEALTH_CONCURRENCY requests in flight and BLOG_HEALTH_PER_HOST per host.
+# Answers slower than BLOG_HEALTH_SLOW_MS count as slow; BLOG_HEALTH_HISTORY
+# probes are kept per blog.
+
+BLOG_HEALTH_CONCURRENCY = int(os.getenv('BLOG_HEALTH_CONCURRENCY', '200'))
+BLOG_HEALTH_PER_HOST = int(os.getenv('BLOG_HEALTH_PER_HOST', '4'))
+BLOG_HEALTH_TIMEOUT_SECONDS = float(os.getenv('BLOG_HEALTH_TIMEOUT_SECONDS', '10'))
+BLOG_HEALTH_SLOW_MS = int(os.getenv('BLOG_HEALTH_SLOW_MS', '2000'))
+BLOG_HEALTH_HISTORY = int(os.getenv('BLOG_HEALTH_HISTORY', '50'))
+
+# Feeds and sitemaps
+# Per-blog RSS/Atom feeds list the FEED_ITEMS newest published articles; sitemaps
+# are split into shards of SITEMAP_SHARD_SIZE URLs (50,000 is the protocol limit).
+# Links are built from FEED_BASE_URL (e.g. https://example.com), or the request's host.
+
+FEED_ITEMS = int(os.getenv('FEED_ITEMS', '50'))
+SITEMAP_SHARD_SIZE = int(os.getenv('SITEMAP_SHARD_SIZE', '50000'))
+FEED_CACHE_SECONDS = int(os.getenv('FEED_CACHE_SECONDS', '300'))
+FEED_BASE_URL = os.getenv('FEED_BASE_URL', '')
+
+# JSON API (blogapp.api)
+# List endpoints return API_DEFAULT_PAGE_SIZE rows unless ?limit= asks for more,
+# up to API_MAX_PAGE_SIZE; pages are streamed, so large pages do not buffer.
+API_DEFAULT_PAGE_SIZE = int(os.getenv('API_DEFAULT_PAGE_SIZE', '100'))
+API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', '5000'))
+
+# Transactional outbox (blogapp.outbox)
+# `manage.py dispatch_outbox` hands Article/Blog change events to consumers in
+# batches of OUTBOX_BATCH_SIZE. OUTBOX_CONSUMERS lists extra modules that register
+# consumers. Delivered events are kept OUTBOX_RETENTION_HOURS; a gap in event ids
+# younger than OUTBOX_GAP_TIMEOUT_SECONDS is treated as a transaction still open.
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '500'))
+OUTBOX_CONSUMERS = [m.strip() for m in os.getenv('OUTBOX_CONSUMERS', '').split(',') if m.strip()]
+OUTBOX_RETENTION_HOURS = int(os.getenv('OUTBOX_RETENTION_HOURS', '72'))
+OUTBOX_GAP_TIMEOUT_SECONDS = int(os.getenv('OUTBOX_GAP_TIMEOUT_SECONDS', '60'))
+
+# Admission control (blogapp.admission)
+# Per worker process, at most `concurrency` requests of a route class run at once and
+# `queue` more wait up to `wait_seconds` for a slot; the rest get 503 (429 once a client
+# holds `per_client` slots) with Retry-After. AI and bulk requests together never hold
+# more than ADMISSION_THREADS - ADMISSION_RESERVED_FOR_READS threads, so reads always
+# find one free. ADMISSION_THREADS should match GUNICORN_THREADS; 0 removes that cap.
+ADMISSION_CONTROL_ENABLED = os.getenv('ADMISSION_CONTROL_ENABLED', 'True').lower() in ('true', '1', 'yes', 'on')
+ADMISSION_THREADS = int(os.getenv('ADMISSION_THREADS', os.getenv('GUNICORN_THREADS', '4')))
+ADMISSION_RESERVED_FOR_READS = int(os.getenv('ADMISSION_RESERVED_FOR_READS', '1'))
+ADMISSION_LIMITS = {
+    'ai': {
+        'concurrency': int(os.getenv('ADMISSION_AI_CONCURRENCY', '2')),
+        'queue': int(os.getenv('ADMISSION_AI_QUEUE', '1')),
+        'wait_seconds': float(os.getenv('ADMISSION_AI_WAIT_SECONDS', '5')),
+        'per_client': int(os.getenv('ADMISSION_AI_PER_CLIENT', '1')),
+        'retry_after': int(os.getenv('ADMISSION_AI_RETRY_AFTER', '15')),
+    },
+    'bulk': {
+        'concurrency': int(os.getenv('ADMISSION_BULK_CONCURRENCY', '1')),
+        'queue': int(os.getenv('ADMISSION_BULK_QUEUE', '2')),
+        'wait_seconds': float(os.getenv('ADMISSION_BULK_WAIT_SECONDS', '10')),
+        'per_client': int(os.getenv('ADMISSION_BULK_PER_CLIENT', '0')),
+        'retry_after': int(os.getenv('ADMISSION_BULK_RETRY_AFTER', '5')),
+    },
+}
+
+# Request profiling (blogapp.profiling)
+# Admins profile a request with ?_profile=sample|cprofile or an X-Profile header.
+# PROFILING_SAMPLE_PERCENT of all requests are also profiled at random (0 = off),
+# at most PROFILING_MAX_PER_MINUTE per process. The newest PROFILING_KEEP profiles
+# are kept for admin-panel/profiles/.
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'True').lower() in ('true', '1', 'yes', 'on')
+PROFILING_SAMPLE_PERCENT = float(os.getenv('PROFILING_SAMPLE_PERCENT', '0'))
+PROFILING_MAX_PER_MINUTE = int(os.getenv('PROFILING_MAX_PER_MINUTE', '6'))
+PROFILING_SAMPLE_INTERVAL_MS = float(os.getenv('PROFILING_SAMPLE_INTERVAL_MS', '5'))
+PROFILING_MAX_QUERIES = int(os.getenv('PROFILING_MAX_QUERIES', '1000'))
+PROFILING_KEEP = int(os.getenv('PROFILING_KEEP', '500'))
+
+# Near-duplicate detection
+# Estimated Jaccard similarity of two articles' word shingles above which
+# article_creation warns and `manage.py report_duplicates` groups them
+
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv('NEAR_DUPLICATE_THRESHOLD', '0.8'))
+
+# Article archive
+# Articles left in 'archived' this many days are moved out of the hot table by
+# `manage.py archive_articles`
+
+ARTICLE_ARCHIVE_AFTER_DAYS = int(os.getenv('ARTICLE_ARCHIVE_AFTER_DAYS', '90'))
+
+# Blog and user deletion
+# Articles are deleted in batches of DELETION_BATCH_SIZE, one short transaction each.
+# Targets with more than DELETION_INLINE_LIMIT articles are left to `manage.py process_deletions`.
+
+DELETION_BATCH_SIZE = int(os.getenv('DELETION_BATCH_SIZE', '500'))
+DELETION_INLINE_LIMIT = int(os.getenv('DELETION_INLINE_LIMIT', '500'))
+DELETION_BATCH_PAUSE_SECONDS = float(os.getenv('DELETION_BATCH_PAUSE_SECONDS', '0.05'))
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field